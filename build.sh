@@ -14,6 +14,7 @@ cd tienda
 # Ejecutar migraciones
 echo "Running migrations..."
 python manage.py migrate --no-input
+python manage.py createcachetable
 
 # Crear o resetear superusuario
 echo "Creating/resetting admin user..."
@@ -0,0 +1,48 @@
+// Sugerencias del buscador mientras se escribe. El endpoint responde desde un
+// índice en memoria que se pone al día con la base cada unos segundos, no en
+// cada pedido, así que se puede pedir en cada tecla (con una pausa corta).
+document.addEventListener("DOMContentLoaded", () => {
+  const campo = document.querySelector("[data-autocompletar]");
+  const lista = campo && document.getElementById(campo.getAttribute("list"));
+
+  if (!campo || !lista) {
+    return;
+  }
+
+  let espera = null;
+  let pedido = null;
+
+  const mostrar = (resultados) => {
+    lista.replaceChildren(
+      ...resultados.map((resultado) => {
+        const opcion = document.createElement("option");
+        opcion.value = resultado.nombre;
+        return opcion;
+      })
+    );
+  };
+
+  campo.addEventListener("input", () => {
+    clearTimeout(espera);
+    const texto = campo.value;
+    if (texto.trim().length < 2) {
+      mostrar([]);
+      return;
+    }
+    espera = setTimeout(async () => {
+      if (pedido) {
+        pedido.abort();
+      }
+      pedido = new AbortController();
+      try {
+        const url = `${campo.dataset.autocompletar}?q=${encodeURIComponent(texto)}`;
+        const respuesta = await fetch(url, { signal: pedido.signal });
+        if (respuesta.ok) {
+          mostrar((await respuesta.json()).resultados);
+        }
+      } catch (error) {
+        // Pedido cancelado por una tecla nueva o sin conexión: no se sugiere nada.
+      }
+    }, 120);
+  });
+});
@@ -0,0 +1,88 @@
+// Carrito sin recargar la página. Sin JavaScript, los formularios siguen
+// funcionando con su redirección de siempre.
+document.addEventListener("DOMContentLoaded", () => {
+  const contador = document.querySelector("[data-carrito-resumen]");
+
+  const mostrarCantidad = (cantidad) => {
+    if (contador) {
+      contador.textContent = cantidad;
+    }
+  };
+
+  // El contador se pide aparte para que las páginas del catálogo se puedan
+  // servir desde el cache.
+  if (contador) {
+    fetch(contador.dataset.carritoResumen, {
+      headers: { "X-Requested-With": "XMLHttpRequest" },
+      credentials: "same-origin",
+    })
+      .then((respuesta) => (respuesta.ok ? respuesta.json() : null))
+      .then((resumen) => {
+        if (resumen) {
+          mostrarCantidad(resumen.cantidad);
+        }
+      })
+      .catch(() => {});
+  }
+
+  const avisar = (mensaje, error) => {
+    const contenedor = document.querySelector("main .container");
+    if (!contenedor || !mensaje) {
+      return;
+    }
+    const aviso = document.createElement("div");
+    aviso.className = `alert alert-${error ? "danger" : "success"} alert-dismissible fade show sombra-suave`;
+    aviso.setAttribute("role", "alert");
+    aviso.textContent = mensaje;
+    const cerrar = document.createElement("button");
+    cerrar.type = "button";
+    cerrar.className = "btn-close";
+    cerrar.dataset.bsDismiss = "alert";
+    cerrar.setAttribute("aria-label", "Cerrar");
+    aviso.appendChild(cerrar);
+    contenedor.prepend(aviso);
+  };
+
+  const enviar = (formulario, boton, cabeceras) =>
+    fetch(boton?.formAction || formulario.action, {
+      method: "POST",
+      body: new FormData(formulario),
+      headers: { "X-Requested-With": "XMLHttpRequest", ...cabeceras },
+      credentials: "same-origin",
+    });
+
+  document.addEventListener("submit", async (evento) => {
+    const formulario = evento.target;
+    const boton = evento.submitter;
+
+    // Agregar desde el catálogo o el detalle: JSON con la línea y los totales.
+    if (formulario.matches("[data-carrito-json]") && !boton?.hasAttribute("data-sin-json")) {
+      evento.preventDefault();
+      try {
+        const respuesta = await enviar(formulario, boton, { Accept: "application/json" });
+        const datos = await respuesta.json();
+        mostrarCantidad(datos.carrito.cantidad);
+        avisar(datos.mensaje, datos.error);
+      } catch (error) {
+        formulario.submit();
+      }
+      return;
+    }
+
+    // Acciones dentro del carrito: se reemplaza el carrito con el fragmento.
+    if (formulario.matches("#carrito [data-carrito-fragmento]")) {
+      evento.preventDefault();
+      try {
+        const respuesta = await enviar(formulario, boton, {});
+        const carrito = document.getElementById("carrito");
+        carrito.innerHTML = await respuesta.text();
+        const cantidad = carrito.querySelector("[data-carrito-cantidad]");
+        if (cantidad) {
+          mostrarCantidad(cantidad.dataset.carritoCantidad);
+        }
+      } catch (error) {
+        formulario.submit();
+      }
+    }
+  });
+});
@@ -0,0 +1,64 @@
+// Scroll infinito del catálogo: trae la página siguiente como fragmento HTML.
+// Sin JavaScript, el botón "Ver más productos" sigue funcionando como link.
+document.addEventListener("DOMContentLoaded", () => {
+  // La grilla se busca cada vez porque los filtros pueden reemplazarla.
+  const grilla = () => document.getElementById("grilla-productos");
+
+  if (!grilla()) {
+    return;
+  }
+
+  let cargando = false;
+
+  const cargarSiguiente = async (enlace) => {
+    if (cargando) {
+      return;
+    }
+    cargando = true;
+    try {
+      const respuesta = await fetch(enlace.dataset.fragmento, {
+        headers: { "X-Requested-With": "XMLHttpRequest" },
+      });
+      if (!respuesta.ok) {
+        window.location.href = enlace.href;
+        return;
+      }
+      const html = await respuesta.text();
+      enlace.closest(".cargar-mas").remove();
+      grilla().insertAdjacentHTML("beforeend", html);
+      observarBoton();
+    } finally {
+      cargando = false;
+    }
+  };
+
+  const observador =
+    "IntersectionObserver" in window
+      ? new IntersectionObserver((entradas) => {
+          entradas.forEach((entrada) => {
+            if (entrada.isIntersecting) {
+              observador.unobserve(entrada.target);
+              cargarSiguiente(entrada.target);
+            }
+          });
+        }, { rootMargin: "400px" })
+      : null;
+
+  const observarBoton = () => {
+    const enlace = document.querySelector("#grilla-productos .cargar-mas [data-fragmento]");
+    if (enlace && observador) {
+      observador.observe(enlace);
+    }
+  };
+
+  document.addEventListener("click", (evento) => {
+    const enlace = evento.target.closest("#grilla-productos .cargar-mas [data-fragmento]");
+    if (enlace) {
+      evento.preventDefault();
+      cargarSiguiente(enlace);
+    }
+  });
+
+  document.addEventListener("catalogo:actualizado", observarBoton);
+  observarBoton();
+});
@@ -1,26 +1,42 @@
-// Script sencillo para filtrar productos por categoría en el listado principal.
+// Filtros del catálogo por categoría y precio resueltos en el servidor.
+// Cada botón es un link común; con JavaScript se reemplaza sólo el bloque
+// del catálogo con el fragmento que devuelve el servidor.
 document.addEventListener("DOMContentLoaded", () => {
-  const botones = document.querySelectorAll("[data-category]");
-  const productos = document.querySelectorAll(".producto");
+  const contenedor = document.getElementById("catalogo");
 
-  if (!botones.length || !productos.length) {
+  if (!contenedor) {
     return;
   }
 
-  botones.forEach((boton) => {
-    boton.addEventListener("click", () => {
-      botones.forEach((b) => b.classList.remove("active"));
-      boton.classList.add("active");
+  const cargarCatalogo = async (urlFragmento, urlPagina, agregarAlHistorial) => {
+    const respuesta = await fetch(urlFragmento, {
+      headers: { "X-Requested-With": "XMLHttpRequest" },
+    });
+    if (!respuesta.ok) {
+      window.location.href = urlPagina;
+      return;
+    }
+    contenedor.innerHTML = await respuesta.text();
+    if (agregarAlHistorial) {
+      history.pushState({ fragmento: urlFragmento }, "", urlPagina);
+    }
+    document.dispatchEvent(new CustomEvent("catalogo:actualizado"));
+  };
 
-      const categoriaElegida = boton.getAttribute("data-category");
+  contenedor.addEventListener("click", (evento) => {
+    const boton = evento.target.closest("[data-grupo-filtro] a[data-fragmento]");
+    if (!boton) {
+      return;
+    }
+    evento.preventDefault();
+    cargarCatalogo(boton.dataset.fragmento, boton.href, true);
+  });
 
-      productos.forEach((producto) => {
-        const categoriaProducto = producto.getAttribute("data-category");
-        const mostrar =
-          categoriaElegida === "todos" || categoriaProducto === categoriaElegida;
-        producto.style.display = mostrar ? "block" : "none";
-      });
-    });
+  window.addEventListener("popstate", (evento) => {
+    if (evento.state && evento.state.fragmento) {
+      cargarCatalogo(evento.state.fragmento, window.location.href, false);
+    } else {
+      window.location.reload();
+    }
   });
 });
-
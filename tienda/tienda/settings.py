@@ -93,9 +93,73 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Los tests usan un archivo y no la base en memoria compartida: así los
+        # hilos esperan el bloqueo de escritura como en producción en lugar de
+        # fallar con "database table is locked".
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# En Render el worker de tareas es otro servicio, sin acceso al disco del web:
+# con DATABASE_URL los dos usan la misma base (ver render.yaml).
+if os.environ.get('DATABASE_URL'):
+    import dj_database_url
+
+    DATABASES['default'] = dj_database_url.config(conn_max_age=600)
+
+
+# Cache
+# "fragmentos" guarda el HTML de las tarjetas de producto. LocMemCache descarta
+# las entradas menos usadas al llegar a MAX_ENTRIES, lo que acota la memoria
+# por proceso (una tarjeta ocupa ~1,5 KB).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tienda-default',
+    },
+    'fragmentos': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tienda-fragmentos',
+        'TIMEOUT': None,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('CACHE_TARJETAS_MAX_ENTRADAS', '5000')),
+            'CULL_FREQUENCY': 10,
+        },
+    },
+    # Páginas completas del catálogo para visitantes anónimos.
+    'paginas': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tienda-paginas',
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('CACHE_PAGINAS_MAX_ENTRADAS', '500')),
+        },
+    },
+    # Estado de los cortacircuitos: tiene que verse desde todos los workers,
+    # así que vive en la base (tabla creada con `createcachetable`).
+    'circuitos': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'tienda_cache_circuitos',
+    },
+}
+# Vigencia de las páginas cacheadas. Con LocMemCache cada worker tiene su
+# propio cache, así que la invalidación por señales sólo alcanza al proceso
+# que guardó el cambio; los demás lo ven al vencer este plazo.
+CACHE_PAGINAS_SEGUNDOS = int(os.environ.get('CACHE_PAGINAS_SEGUNDOS', '60'))
+
+
+# Sesiones
+# Los motores de tienda_app.sesiones sólo escriben la sesión si su contenido
+# cambió: .db (por defecto), .cached_db, .cache o .file. Los que usan el cache
+# necesitan uno compartido entre workers (Redis o Memcached, en
+# SESSION_CACHE_ALIAS); con LocMemCache cada worker vería su propia copia.
+# `manage.py benchmark_sesiones` compara las opciones.
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'tienda_app.sesiones.db')
+SESSION_CACHE_ALIAS = os.environ.get('SESSION_CACHE_ALIAS', 'default')
+if os.environ.get('SESSION_FILE_PATH'):
+    SESSION_FILE_PATH = os.environ['SESSION_FILE_PATH']
+# Los mensajes viajan en una cookie firmada: mostrar un aviso no escribe la sesión.
+MESSAGE_STORAGE = os.environ.get('MESSAGE_STORAGE', 'django.contrib.messages.storage.cookie.CookieStorage')
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -148,12 +212,61 @@ LOGIN_REDIRECT_URL = 'tienda_app:home'
 LOGOUT_REDIRECT_URL = 'tienda_app:home'
 LOGIN_URL = 'tienda_app:ingreso'
 
+# Paginación del catálogo (se puede pedir otro tamaño con ?por_pagina=, hasta el máximo)
+CATALOGO_TAMANO_PAGINA = int(os.environ.get("CATALOGO_TAMANO_PAGINA", "24"))
+CATALOGO_TAMANO_PAGINA_MAXIMO = 96
+# Límites de los rangos de precio del filtro (hasta 10000, 10000 a 30000, ...)
+CATALOGO_LIMITES_PRECIO = [10000, 30000, 60000]
+
+# El contador del carrito se guarda precalculado en la sesión; se recalcula
+# al cambiar el carrito o pasados estos segundos (por cambios de precio).
+CARRITO_RESUMEN_SEGUNDOS = int(os.environ.get("CARRITO_RESUMEN_SEGUNDOS", "300"))
+
+# Cada worker pide los cambios del autocompletado a la base como mucho cada
+# estos segundos; mientras tanto las sugerencias salen sólo de memoria.
+AUTOCOMPLETAR_SEGUNDOS_SINCRONIZACION = float(os.environ.get("AUTOCOMPLETAR_SEGUNDOS_SINCRONIZACION", "2"))
+
+# Reservas de stock: agregar al carrito aparta las unidades por
+# RESERVAS_MINUTOS_CARRITO minutos; entrar al checkout las extiende a
+# RESERVAS_MINUTOS_CHECKOUT. El worker borra las vencidas cada
+# RESERVAS_BARRIDO_SEGUNDOS (también `manage.py liberar_reservas`). Un
+# visitante sin ingresar reserva a lo sumo RESERVAS_MAXIMO_VISITANTE unidades.
+RESERVAS_MINUTOS_CARRITO = int(os.environ.get("RESERVAS_MINUTOS_CARRITO", "15"))
+RESERVAS_MINUTOS_CHECKOUT = int(os.environ.get("RESERVAS_MINUTOS_CHECKOUT", "20"))
+RESERVAS_MAXIMO_VISITANTE = int(os.environ.get("RESERVAS_MAXIMO_VISITANTE", "3"))
+RESERVAS_BARRIDO_SEGUNDOS = int(os.environ.get("RESERVAS_BARRIDO_SEGUNDOS", "60"))
+
+# Cola de tareas: con True se ejecutan en el mismo proceso al confirmar la
+# transacción (tests y desarrollo sin worker); si no, las procesa `procesar_tareas`.
+TAREAS_SINCRONICAS = os.environ.get("TAREAS_SINCRONICAS", "False") == "True"
+
+# Clientes HTTP hacia Mercado Pago y Telegram: una sesión por proceso con las
+# conexiones abiertas. El pool debería alcanzar para los hilos de un worker.
+HTTP_TAMANO_POOL = int(os.environ.get("HTTP_TAMANO_POOL", "10"))
+HTTP_TIMEOUT_CONEXION = float(os.environ.get("HTTP_TIMEOUT_CONEXION", "3.05"))
+HTTP_TIMEOUT_LECTURA = float(os.environ.get("HTTP_TIMEOUT_LECTURA", "10"))
+HTTP_REINTENTOS_GET = int(os.environ.get("HTTP_REINTENTOS_GET", "2"))
+
+# Cortacircuitos de Mercado Pago: con CIRCUITO_FALLOS_PARA_ABRIR fallos dentro
+# de CIRCUITO_VENTANA segundos, se dejan de hacer llamadas por
+# CIRCUITO_TIEMPO_ABIERTO segundos y después se prueba con una sola.
+CIRCUITO_FALLOS_PARA_ABRIR = int(os.environ.get("CIRCUITO_FALLOS_PARA_ABRIR", "5"))
+CIRCUITO_VENTANA = int(os.environ.get("CIRCUITO_VENTANA", "60"))
+CIRCUITO_TIEMPO_ABIERTO = int(os.environ.get("CIRCUITO_TIEMPO_ABIERTO", "30"))
+# Segundos de lectura que se esperan a Mercado Pago en cada llamada.
+MERCADOPAGO_PRESUPUESTO_PREFERENCIA = float(os.environ.get("MERCADOPAGO_PRESUPUESTO_PREFERENCIA", "8"))
+MERCADOPAGO_PRESUPUESTO_PAGO = float(os.environ.get("MERCADOPAGO_PRESUPUESTO_PAGO", "3"))
+
 # Configuración de Mercado Pago (usar variables de entorno en producción)
 MERCADOPAGO_PUBLIC_KEY = os.environ.get("MERCADOPAGO_PUBLIC_KEY", "")
 MERCADOPAGO_ACCESS_TOKEN = os.environ.get("MERCADOPAGO_ACCESS_TOKEN", "")
 MERCADOPAGO_CURRENCY_ID = os.environ.get("MERCADOPAGO_CURRENCY_ID", "ARS")
 MERCADOPAGO_SUCCESS_URL = os.environ.get("MERCADOPAGO_SUCCESS_URL")
 MERCADOPAGO_NOTIFICATION_URL = os.environ.get("MERCADOPAGO_NOTIFICATION_URL")
+# Sólo para pruebas: reemplaza https://api.mercadopago.com (p. ej. por un servidor falso).
+MERCADOPAGO_API_URL = os.environ.get("MERCADOPAGO_API_URL", "")
+# Clave secreta del webhook (panel de Mercado Pago) para validar `x-signature`.
+MERCADOPAGO_WEBHOOK_SECRET = os.environ.get("MERCADOPAGO_WEBHOOK_SECRET", "")
 
 # Configuración de Telegram para notificaciones (usar variables de entorno en producción)
 TELEGRAM_BOT_TOKEN = os.environ.get("TELEGRAM_BOT_TOKEN", "")
@@ -2,7 +2,8 @@ from django.contrib import admin
 from django.contrib.auth.admin import GroupAdmin
 from django.contrib.auth.models import Group
 
-from .models import Category, Order, OrderItem, Product
+from . import tareas
+from .models import BackgroundJob, Category, Order, OrderItem, PaymentNotification, Product, StockReservation
 
 # Ocultar modelos de django-allauth y django.contrib.sites del admin
 from allauth.socialaccount.models import SocialApp, SocialAccount, SocialToken
@@ -73,11 +74,11 @@ class ProductoAdmin(admin.ModelAdmin):
 
     list_display = ("name", "category", "price", "stock", "is_active", "slug")
     list_filter = ("category", "is_active")
-    search_fields = ("name", "description")
+    search_fields = ("name", "description", "sku")
     readonly_fields = ("slug", "created_at", "updated_at")
     fieldsets = (
         ("Información básica", {
-            "fields": ("name", "category", "slug", "description")
+            "fields": ("name", "category", "slug", "sku", "description")
         }),
         ("Precio y Stock", {
             "fields": ("price", "stock", "is_active")
@@ -107,7 +108,80 @@ class PedidoAdmin(admin.ModelAdmin):
     Panel del administrador para gestionar pedidos.
     """
 
-    list_display = ("id", "user", "status", "created_at", "updated_at")
+    list_display = ("id", "user", "status", "total_items", "total_amount", "created_at", "updated_at")
     list_filter = ("status", "created_at")
     search_fields = ("user__username", "user__email")
+    # Los totales se recalculan solos al guardar las líneas.
+    readonly_fields = ("total_items", "total_amount")
     inlines = [ItemPedidoInline]
+
+
+@admin.register(BackgroundJob)
+class TareaAdmin(admin.ModelAdmin):
+    """
+    Estado de la cola de tareas. Las fallidas se pueden volver a encolar.
+    """
+
+    list_display = ("id", "kind", "status", "attempts", "run_after", "updated_at")
+    list_filter = ("status", "kind")
+    readonly_fields = (
+        "kind",
+        "payload",
+        "status",
+        "attempts",
+        "max_attempts",
+        "run_after",
+        "locked_at",
+        "last_error",
+        "created_at",
+        "updated_at",
+    )
+    actions = ("reintentar_tareas",)
+
+    @admin.action(description="Reintentar las tareas fallidas seleccionadas")
+    def reintentar_tareas(self, request, queryset):
+        cantidad = tareas.reintentar(queryset)
+        self.message_user(request, f"{cantidad} tareas vuelven a la cola.")
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(PaymentNotification)
+class NotificacionPagoAdmin(admin.ModelAdmin):
+    """
+    Avisos recibidos del webhook de Mercado Pago, para auditar pagos.
+    """
+
+    list_display = ("id", "topic", "resource_id", "status", "payment_status", "order", "received_at")
+    list_filter = ("status", "topic", "payment_status")
+    search_fields = ("resource_id", "key")
+    readonly_fields = (
+        "key",
+        "topic",
+        "resource_id",
+        "payload",
+        "status",
+        "order",
+        "payment_status",
+        "received_at",
+        "processed_at",
+    )
+
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(StockReservation)
+class ReservaAdmin(admin.ModelAdmin):
+    """
+    Reservas de stock de los carritos, para ver qué está apartado.
+    """
+
+    list_display = ("product", "owner", "quantity", "expires_at")
+    list_select_related = ("product",)
+    search_fields = ("product__name", "owner")
+    readonly_fields = ("product", "owner", "quantity", "expires_at", "updated_at")
+
+    def has_add_permission(self, request):
+        return False
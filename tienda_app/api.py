@@ -0,0 +1,157 @@
+"""API JSON de sólo lectura del catálogo, para el front end y las integraciones."""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Iterator
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpRequest, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.views.decorators.http import require_GET
+
+from . import autocompletar, facetas
+from .catalogo import filtrar_productos, tamano_pagina
+from .condicional import condicional_catalogo, condicional_producto
+from .models import Category, FacetKind, Product
+from .paginacion import paginar_por_cursor
+
+# Columnas que viajan en el listado; el detalle y la exportación suman la descripción.
+CAMPOS_PRODUCTO = (
+    "pk",
+    "slug",
+    "name",
+    "category__slug",
+    "price",
+    "stock",
+    "image_url",
+    "updated_at",
+)
+CAMPOS_PRODUCTO_COMPLETO = CAMPOS_PRODUCTO + ("description",)
+
+# Nombres de las claves en el JSON para los campos que no se publican tal cual.
+NOMBRES_JSON = {"pk": "id", "category__slug": "category"}
+
+# Filas que se leen de la base por vez al exportar el catálogo completo.
+TAMANO_LOTE_EXPORTACION = 2000
+
+LIMITE_SUGERENCIAS = 8
+
+_CODIFICADOR = DjangoJSONEncoder(separators=(",", ":"), ensure_ascii=False)
+
+
+def _producto_json(fila: Dict[str, Any]) -> Dict[str, Any]:
+    datos = {
+        NOMBRES_JSON.get(campo, campo): fila[campo]
+        for campo in CAMPOS_PRODUCTO_COMPLETO
+        if campo in fila
+    }
+    datos["in_stock"] = fila["stock"] > 0
+    return datos
+
+
+def _respuesta_json(datos: Any, status: int = 200) -> JsonResponse:
+    return JsonResponse(
+        datos,
+        status=status,
+        encoder=DjangoJSONEncoder,
+        json_dumps_params={"separators": (",", ":"), "ensure_ascii": False},
+    )
+
+
+def _productos_activos():
+    return Product.objects.filter(is_active=True)
+
+
+@require_GET
+@condicional_catalogo
+def lista_productos(request: HttpRequest) -> JsonResponse:
+    """
+    Página de productos activos con los mismos filtros que el catálogo
+    (`categoria`, `precio`, `buscar`, `en_stock`) y paginación por cursor.
+    """
+    productos, orden = filtrar_productos(_productos_activos(), request.GET)
+    campos = CAMPOS_PRODUCTO + tuple(campo for campo in orden if campo == "rango_busqueda")
+    pagina = paginar_por_cursor(
+        productos.values(*campos),
+        request.GET.get("cursor"),
+        tamano_pagina(request.GET),
+        orden,
+    )
+
+    siguiente = None
+    if pagina.hay_mas:
+        parametros = request.GET.copy()
+        parametros["cursor"] = pagina.cursor_siguiente
+        siguiente = f"{reverse('tienda_app:api_productos')}?{parametros.urlencode()}"
+
+    return _respuesta_json(
+        {"resultados": [_producto_json(fila) for fila in pagina], "siguiente": siguiente}
+    )
+
+
+@require_GET
+@condicional_producto
+def detalle_producto(request: HttpRequest, slug: str) -> JsonResponse:
+    """
+    Un producto activo por slug, con su descripción.
+    """
+    fila = _productos_activos().filter(slug=slug).values(*CAMPOS_PRODUCTO_COMPLETO).first()
+    if fila is None:
+        return _respuesta_json({"error": "Producto no encontrado."}, status=404)
+    return _respuesta_json(_producto_json(fila))
+
+
+@require_GET
+@condicional_catalogo
+def lista_categorias(request: HttpRequest) -> JsonResponse:
+    """
+    Categorías con la cantidad de productos activos, tomada de las facetas.
+    """
+    por_categoria = facetas.conteos()[FacetKind.CATEGORY.value]
+    categorias = [
+        {
+            "id": pk,
+            "slug": slug,
+            "name": nombre,
+            "products": por_categoria.get(str(pk), 0),
+        }
+        for pk, slug, nombre in Category.objects.values_list("pk", "slug", "name")
+    ]
+    return _respuesta_json({"resultados": categorias})
+
+
+@require_GET
+def sugerencias(request: HttpRequest) -> JsonResponse:
+    """
+    Sugerencias para el buscador mientras se escribe (`?q=`). Responde desde el
+    índice en memoria; la base se consulta a lo sumo cada unos segundos por
+    proceso, para traer los cambios del catálogo.
+    """
+    resultados = autocompletar.sugerencias(request.GET.get("q", ""), LIMITE_SUGERENCIAS)
+    for resultado in resultados:
+        if resultado["tipo"] == autocompletar.CATEGORIA:
+            resultado["url"] = f"{reverse('tienda_app:home')}?categoria={resultado['slug']}"
+        else:
+            resultado["url"] = reverse("tienda_app:product_detail", args=[resultado["slug"]])
+    return _respuesta_json({"resultados": resultados})
+
+
+def _lineas_exportacion(productos) -> Iterator[str]:
+    for fila in productos.iterator(chunk_size=TAMANO_LOTE_EXPORTACION):
+        yield _CODIFICADOR.encode(_producto_json(fila)) + "\n"
+
+
+@require_GET
+@condicional_catalogo
+def exportar_productos(request: HttpRequest) -> HttpResponse:
+    """
+    Exporta el catálogo completo como NDJSON (un producto por línea), leyendo
+    la base por lotes para no cargar todos los productos en memoria.
+    """
+    productos, _orden = filtrar_productos(_productos_activos(), request.GET)
+    productos = productos.order_by("pk").values(*CAMPOS_PRODUCTO_COMPLETO)
+    respuesta = StreamingHttpResponse(
+        _lineas_exportacion(productos), content_type="application/x-ndjson; charset=utf-8"
+    )
+    respuesta["Content-Disposition"] = 'attachment; filename="catalogo.ndjson"'
+    return respuesta
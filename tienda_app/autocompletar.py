@@ -0,0 +1,267 @@
+"""Índice de prefijos en memoria para autocompletar el buscador."""
+
+from __future__ import annotations
+
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .busqueda import normalizar_texto
+from .models import AutocompleteChange, Category, Product
+
+# Los procesos que quedaron más atrás que esto (o cuyos cambios ya vencieron)
+# rearman el índice desde la base en lugar de aplicar cambio por cambio.
+MAXIMO_CAMBIOS = 500
+DURACION_CAMBIOS = 60 * 60 * 24
+# Cada cuántas publicaciones se borran los cambios vencidos.
+FRECUENCIA_LIMPIEZA = 100
+
+PRODUCTO = "producto"
+CATEGORIA = "categoria"
+# Cambio especial: todos los workers rearman el índice desde la base.
+RECONSTRUIR = "reconstruir"
+
+# Claves que se revisan como máximo por consulta, para que un prefijo muy
+# corto ("a") no recorra medio catálogo.
+MAXIMO_CANDIDATOS = 64
+
+# (tipo, pk) de una entrada del índice.
+Referencia = Tuple[str, int]
+# (tipo, pk, nombre, slug); nombre None quita la entrada.
+Cambio = Tuple[str, int, Optional[str], Optional[str]]
+
+_SEPARADOR = "\x00"
+
+_PATRON_PALABRA = re.compile(r"\w+", re.UNICODE)
+
+
+def normalizar_prefijo(texto: str) -> str:
+    """
+    Minúsculas, sin acentos y con un solo espacio entre palabras. El espacio
+    final se conserva: "zapatilla " sólo sugiere nombres con otra palabra.
+    """
+    normalizado = " ".join(_PATRON_PALABRA.findall(normalizar_texto(texto)))
+    if normalizado and texto[-1:].isspace():
+        normalizado += " "
+    return normalizado
+
+
+@dataclass
+class IndicePrefijos:
+    """
+    Lista ordenada de claves "<texto desde la palabra i>\\0<tipo>\\0<pk>\\0<i>":
+    una búsqueda por prefijo es un bisect y un recorrido corto hacia adelante.
+    Así "negra" encuentra "Zapatilla negra" además de "Negra básica".
+    """
+
+    claves: List[str] = field(default_factory=list)
+    entradas: Dict[Referencia, Tuple[str, str]] = field(default_factory=dict)
+
+    @staticmethod
+    def _claves_de(referencia: Referencia, nombre: str) -> List[str]:
+        palabras = normalizar_prefijo(nombre).split()
+        tipo, pk = referencia
+        return [
+            _SEPARADOR.join((" ".join(palabras[inicio:]), tipo, str(pk), str(inicio)))
+            for inicio in range(len(palabras))
+        ]
+
+    @classmethod
+    def construir(cls, filas) -> "IndicePrefijos":
+        """
+        Arma el índice de una vez a partir de tuplas (tipo, pk, nombre, slug).
+        """
+        indice = cls()
+        for tipo, pk, nombre, slug in filas:
+            indice.entradas[(tipo, pk)] = (nombre, slug)
+            indice.claves.extend(cls._claves_de((tipo, pk), nombre))
+        indice.claves.sort()
+        return indice
+
+    def quitar(self, referencia: Referencia) -> None:
+        anterior = self.entradas.pop(referencia, None)
+        if anterior is None:
+            return
+        for clave in self._claves_de(referencia, anterior[0]):
+            posicion = bisect_left(self.claves, clave)
+            if posicion < len(self.claves) and self.claves[posicion] == clave:
+                del self.claves[posicion]
+
+    def poner(self, referencia: Referencia, nombre: str, slug: str) -> None:
+        self.quitar(referencia)
+        self.entradas[referencia] = (nombre, slug)
+        for clave in self._claves_de(referencia, nombre):
+            insort(self.claves, clave)
+
+    def buscar(self, texto: str, limite: int = 8) -> List[Dict[str, str]]:
+        """
+        Sugerencias para el texto escrito: primero las categorías, después los
+        nombres que empiezan con el texto y, por último, los más cortos.
+        """
+        prefijo = normalizar_prefijo(texto)
+        if not prefijo.strip():
+            return []
+        candidatos: Dict[Referencia, Tuple[int, int, int]] = {}
+        posicion = bisect_left(self.claves, prefijo)
+        for clave in self.claves[posicion : posicion + MAXIMO_CANDIDATOS]:
+            if not clave.startswith(prefijo):
+                break
+            _texto, tipo, pk, palabra = clave.split(_SEPARADOR)
+            referencia = (tipo, int(pk))
+            orden = (tipo != CATEGORIA, palabra != "0", len(self.entradas[referencia][0]))
+            candidatos[referencia] = min(orden, candidatos.get(referencia, orden))
+
+        elegidas = sorted(candidatos, key=lambda ref: (candidatos[ref], self.entradas[ref][0]))
+        resultado = []
+        for referencia in elegidas[:limite]:
+            nombre, slug = self.entradas[referencia]
+            resultado.append({"tipo": referencia[0], "nombre": nombre, "slug": slug})
+        return resultado
+
+
+_bloqueo = threading.RLock()
+_indice: Optional[IndicePrefijos] = None
+_version_local: Optional[int] = None
+_construido_en = 0.0
+# Última vez que se preguntó a la base si había cambios; 0 fuerza la consulta.
+_consultado_en = 0.0
+
+
+def _filas_desde_base():
+    for pk, nombre, slug in Category.objects.values_list("pk", "name", "slug"):
+        yield CATEGORIA, pk, nombre, slug
+    productos = Product.objects.filter(is_active=True).values_list("pk", "name", "slug")
+    for pk, nombre, slug in productos.iterator(chunk_size=2000):
+        yield PRODUCTO, pk, nombre, slug
+
+
+def _aplicar(indice: IndicePrefijos, cambio: Cambio) -> None:
+    tipo, pk, nombre, slug = cambio
+    if nombre is None:
+        indice.quitar((tipo, pk))
+    else:
+        indice.poner((tipo, pk), nombre, slug)
+
+
+def _construir() -> IndicePrefijos:
+    """
+    Arma el índice desde la base. La versión se lee antes que las filas: un
+    cambio que se publique mientras tanto se vuelve a aplicar después, y
+    aplicarlo dos veces da lo mismo.
+    """
+    global _indice, _version_local, _construido_en
+    version = AutocompleteChange.objects.aggregate(ultima=Max("pk"))["ultima"] or 0
+    _indice, _version_local = IndicePrefijos.construir(_filas_desde_base()), version
+    _construido_en = time.monotonic()
+    return _indice
+
+
+def _sincronizar() -> IndicePrefijos:
+    """
+    Pone al día el índice del proceso con los cambios que publicaron todos los
+    workers: una consulta por el id para saber si hay algo nuevo. Si faltan
+    demasiados cambios (o los más viejos ya se borraron) se rearma desde la base.
+    Los cambios se aplican a una copia que reemplaza a la anterior, así los
+    hilos que están respondiendo nunca ven el índice a medio modificar.
+    """
+    global _indice, _version_local, _consultado_en
+    _consultado_en = time.monotonic()
+    if _indice is None or _consultado_en - _construido_en > DURACION_CAMBIOS / 2:
+        return _construir()
+
+    cambios = list(
+        AutocompleteChange.objects.filter(pk__gt=_version_local)
+        .order_by("pk")
+        .values_list("pk", "kind", "object_id", "name", "slug")[: MAXIMO_CAMBIOS + 1]
+    )
+    if len(cambios) > MAXIMO_CAMBIOS or any(tipo == RECONSTRUIR for _pk, tipo, *_ in cambios):
+        return _construir()
+    if cambios:
+        nuevo = IndicePrefijos(list(_indice.claves), dict(_indice.entradas))
+        for _version, tipo, pk, nombre, slug in cambios:
+            _aplicar(nuevo, (tipo, pk, nombre, slug))
+        _indice, _version_local = nuevo, cambios[-1][0]
+    return _indice
+
+
+def indice_actual() -> IndicePrefijos:
+    """
+    El índice del proceso. A la base sólo se va para armarlo la primera vez y
+    para pedir los cambios nuevos cada `AUTOCOMPLETAR_SEGUNDOS_SINCRONIZACION`
+    segundos. Esa consulta la hace un solo hilo; los demás no lo esperan y
+    responden con el índice que ya hay.
+    """
+    indice = _indice
+    intervalo = getattr(settings, "AUTOCOMPLETAR_SEGUNDOS_SINCRONIZACION", 2)
+    if indice is not None and time.monotonic() - _consultado_en < intervalo:
+        return indice
+    if indice is None:
+        with _bloqueo:
+            return _indice if _indice is not None else _sincronizar()
+    if not _bloqueo.acquire(blocking=False):
+        return indice
+    try:
+        return _sincronizar()
+    finally:
+        _bloqueo.release()
+
+
+def reconstruir() -> None:
+    """
+    Reconstruye el índice completo desde la base y avisa a los demás workers
+    que hagan lo mismo. Para después de cargas masivas que no disparan señales.
+    """
+    with _bloqueo:
+        AutocompleteChange.objects.create(kind=RECONSTRUIR)
+        _construir()
+
+
+def sugerencias(texto: str, limite: int = 8) -> List[Dict[str, str]]:
+    return indice_actual().buscar(texto, limite)
+
+
+def _publicar(cambio: Cambio) -> None:
+    """
+    Publica un cambio con un número de versión nuevo. Los demás procesos lo
+    aplican a su índice en su próxima consulta de cambios, sin releer el catálogo.
+    De vez en cuando se borran los cambios que ya vencieron.
+    """
+    global _consultado_en
+    tipo, pk, nombre, slug = cambio
+    publicado = AutocompleteChange.objects.create(kind=tipo, object_id=pk, name=nombre, slug=slug or "")
+    # Este proceso ve su propio cambio en la próxima consulta, sin esperar el intervalo.
+    _consultado_en = 0.0
+    if publicado.pk % FRECUENCIA_LIMPIEZA == 0:
+        AutocompleteChange.objects.filter(
+            created_at__lt=timezone.now() - timedelta(seconds=DURACION_CAMBIOS)
+        ).delete()
+
+
+def _al_confirmar(cambio: Cambio) -> None:
+    # Un guardado que se revierte no debe quedar en el índice.
+    transaction.on_commit(lambda: _publicar(cambio))
+
+
+def actualizar_producto(pk: int, nombre: str, slug: str, activo: bool) -> None:
+    _al_confirmar((PRODUCTO, pk, nombre, slug) if activo else (PRODUCTO, pk, None, None))
+
+
+def quitar_producto(pk: int) -> None:
+    _al_confirmar((PRODUCTO, pk, None, None))
+
+
+def actualizar_categoria(pk: int, nombre: str, slug: str) -> None:
+    _al_confirmar((CATEGORIA, pk, nombre, slug))
+
+
+def quitar_categoria(pk: int) -> None:
+    _al_confirmar((CATEGORIA, pk, None, None))
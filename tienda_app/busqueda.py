@@ -0,0 +1,214 @@
+"""Índice de búsqueda de texto completo para el catálogo de productos."""
+
+from __future__ import annotations
+
+import logging
+import re
+import unicodedata
+from typing import Iterable
+
+from django.db import DatabaseError, connection
+from django.db.models import IntegerField, Q, QuerySet
+from django.db.models.expressions import RawSQL
+
+logger = logging.getLogger(__name__)
+
+TABLA_INDICE = "tienda_app_product_busqueda"
+
+_PATRON_PALABRA = re.compile(r"\w+", re.UNICODE)
+
+_indice_verificado = False
+
+
+def normalizar_texto(texto: str) -> str:
+    """
+    Pasa el texto a minúsculas y le quita los acentos ("Camisetá" -> "camiseta").
+    """
+    descompuesto = unicodedata.normalize("NFKD", texto or "")
+    sin_acentos = "".join(c for c in descompuesto if not unicodedata.combining(c))
+    return sin_acentos.lower()
+
+
+def _raiz(palabra: str) -> str:
+    """
+    Reduce el plural español a una raíz simple para usarla como prefijo
+    ("zapatillas" -> "zapatilla", "pantalones" -> "pantalon").
+    """
+    if len(palabra) > 4 and palabra.endswith("es"):
+        return palabra[:-2]
+    if len(palabra) > 3 and palabra.endswith("s"):
+        return palabra[:-1]
+    return palabra
+
+
+def construir_consulta(termino: str) -> str:
+    """
+    Convierte el texto ingresado por el usuario en una consulta FTS5 segura:
+    cada palabra se busca como prefijo de su raíz y todas deben aparecer.
+    """
+    palabras = _PATRON_PALABRA.findall(normalizar_texto(termino))
+    return " ".join(f'"{_raiz(palabra)}"*' for palabra in palabras)
+
+
+def indice_disponible() -> bool:
+    """
+    Indica si la base de datos actual tiene el índice FTS5 creado. El resultado
+    positivo se recuerda para no consultar el catálogo de SQLite en cada búsqueda.
+    """
+    global _indice_verificado
+    if connection.vendor != "sqlite":
+        return False
+    if _indice_verificado:
+        return True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s",
+                [TABLA_INDICE],
+            )
+            _indice_verificado = cursor.fetchone() is not None
+    except DatabaseError:
+        return False
+    return _indice_verificado
+
+
+def crear_indice(schema_editor=None) -> bool:
+    """
+    Crea la tabla virtual FTS5 si el motor la soporta. Devuelve False si no.
+    """
+    conexion = schema_editor.connection if schema_editor else connection
+    if conexion.vendor != "sqlite":
+        return False
+    try:
+        with conexion.cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_INDICE} USING fts5("
+                "name, description, category, "
+                "tokenize = 'unicode61 remove_diacritics 2')"
+            )
+    except DatabaseError:
+        logger.warning("SQLite sin soporte FTS5: la búsqueda usará icontains.")
+        return False
+    return True
+
+
+def eliminar_indice(schema_editor=None) -> None:
+    conexion = schema_editor.connection if schema_editor else connection
+    if conexion.vendor != "sqlite":
+        return
+    global _indice_verificado
+    _indice_verificado = False
+    with conexion.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {TABLA_INDICE}")
+
+
+def _sql_carga(condicion: str = "") -> str:
+    return (
+        f"INSERT INTO {TABLA_INDICE}(rowid, name, description, category) "
+        "SELECT p.id, p.name, p.description, c.name "
+        "FROM tienda_app_product p "
+        "JOIN tienda_app_category c ON c.id = p.category_id "
+        f"{condicion}"
+    )
+
+
+def reconstruir_indice(schema_editor=None) -> None:
+    """
+    Vuelve a cargar el índice completo a partir de las tablas de productos.
+    """
+    conexion = schema_editor.connection if schema_editor else connection
+    if conexion.vendor != "sqlite":
+        return
+    with conexion.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {TABLA_INDICE}")
+        cursor.execute(_sql_carga())
+
+
+def indexar_productos(ids: Iterable[int]) -> None:
+    """
+    Actualiza en el índice las filas de los productos indicados.
+    """
+    ids = [int(pk) for pk in ids]
+    if not ids or not indice_disponible():
+        return
+    marcadores = ", ".join(["%s"] * len(ids))
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLA_INDICE} WHERE rowid IN ({marcadores})", ids)
+            cursor.execute(_sql_carga(f"WHERE p.id IN ({marcadores})"), ids)
+    except DatabaseError:
+        logger.warning("No se pudo actualizar el índice de búsqueda.", exc_info=True)
+
+
+def indexar_categoria(categoria_id: int) -> None:
+    """
+    Reindexa los productos de una categoría (por ejemplo, al renombrarla).
+    """
+    if not indice_disponible():
+        return
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"DELETE FROM {TABLA_INDICE} WHERE rowid IN "
+                "(SELECT id FROM tienda_app_product WHERE category_id = %s)",
+                [categoria_id],
+            )
+            cursor.execute(_sql_carga("WHERE p.category_id = %s"), [categoria_id])
+    except DatabaseError:
+        logger.warning("No se pudo actualizar el índice de búsqueda.", exc_info=True)
+
+
+def desindexar_productos(ids: Iterable[int]) -> None:
+    ids = [int(pk) for pk in ids]
+    if not ids or not indice_disponible():
+        return
+    marcadores = ", ".join(["%s"] * len(ids))
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {TABLA_INDICE} WHERE rowid IN ({marcadores})", ids)
+    except DatabaseError:
+        logger.warning("No se pudo actualizar el índice de búsqueda.", exc_info=True)
+
+
+def filtrar_por_icontains(productos: QuerySet, termino: str) -> QuerySet:
+    return productos.filter(Q(name__icontains=termino) | Q(description__icontains=termino))
+
+
+def buscar_productos(productos: QuerySet, termino: str) -> QuerySet:
+    """
+    Filtra el queryset de productos por el término buscado y lo ordena por
+    relevancia: primero los que tienen todas las palabras en el nombre, después
+    en la categoría y al final el resto (anotado como `rango_busqueda`), y
+    dentro de cada nivel por nombre. Si el índice no está disponible se usa
+    icontains.
+    """
+    consulta = construir_consulta(termino)
+    if not consulta:
+        return productos.none()
+    if not indice_disponible():
+        return filtrar_por_icontains(productos, termino)
+
+    tabla_productos = productos.model._meta.db_table
+    coincide = f"{tabla_productos}.id IN (SELECT rowid FROM {TABLA_INDICE} WHERE {TABLA_INDICE} MATCH %s)"
+    # No se ordena por bm25: su valor depende de las estadísticas de todo el
+    # índice y cambia con cualquier alta o edición, así que un cursor de la
+    # página anterior podía saltear o repetir productos. El nivel sólo depende
+    # de la fila. Se anota con RawSQL (y no con extra(select=...)) para poder
+    # paginar por él.
+    nivel = RawSQL(
+        f"CASE WHEN {coincide} THEN 0 WHEN {coincide} THEN 1 ELSE 2 END",
+        [f"name : ({consulta})", f"category : ({consulta})"],
+        output_field=IntegerField(),
+    )
+    return (
+        productos.extra(
+            tables=[TABLA_INDICE],
+            where=[
+                f"{TABLA_INDICE}.rowid = {tabla_productos}.id",
+                f"{TABLA_INDICE} MATCH %s",
+            ],
+            params=[consulta],
+        )
+        .annotate(rango_busqueda=nivel)
+        .order_by("rango_busqueda", "name", "pk")
+    )
@@ -0,0 +1,98 @@
+"""Cache de páginas completas del catálogo para visitantes anónimos."""
+
+from __future__ import annotations
+
+import hashlib
+import re
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpRequest, HttpResponse
+from django.middleware.csrf import get_token
+
+from . import metricas
+from .cache_tarjetas import MARCADOR_CSRF
+
+ALIAS_CACHE = "paginas"
+CLAVE_VERSION = "paginas:version"
+
+_PATRON_CSRF = re.compile(r'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+
+
+def _cache():
+    return caches[ALIAS_CACHE]
+
+
+def _version() -> int:
+    return _cache().get_or_set(CLAVE_VERSION, 1, timeout=None)
+
+
+def invalidar() -> None:
+    """
+    Descarta todas las páginas guardadas cambiando la versión de las claves.
+    """
+    try:
+        _cache().incr(CLAVE_VERSION)
+    except ValueError:
+        _cache().set(CLAVE_VERSION, 1, timeout=None)
+
+
+def _clave(request: HttpRequest) -> str:
+    ruta = hashlib.md5(request.get_full_path().encode("utf-8")).hexdigest()
+    return f"pagina:{_version()}:{ruta}"
+
+
+def hay_mensajes_pendientes(request: HttpRequest) -> bool:
+    """
+    Indica si el request trae mensajes del framework de mensajes por mostrar,
+    sin consumirlos. Una página con mensajes es personal y no se cachea.
+    """
+    if "messages" in request.COOKIES:
+        return True
+    return settings.SESSION_COOKIE_NAME in request.COOKIES and bool(request.session.get("_messages"))
+
+
+def _es_cacheable(request: HttpRequest) -> bool:
+    """
+    Sólo se cachean los GET de visitantes anónimos sin mensajes pendientes.
+    """
+    if request.method not in ("GET", "HEAD") or request.user.is_authenticated:
+        return False
+    return not hay_mensajes_pendientes(request)
+
+
+def cache_pagina_anonima(vista):
+    """
+    Sirve la vista desde el cache para visitantes anónimos. Los tokens CSRF se
+    guardan como marcador y se completan con el del visitante al responder.
+    """
+
+    @wraps(vista)
+    def envoltura(request: HttpRequest, *args, **kwargs):
+        if not _es_cacheable(request):
+            return vista(request, *args, **kwargs)
+
+        clave = _clave(request)
+        guardada = _cache().get(clave)
+        if guardada is not None:
+            metricas.incrementar("cache_paginas.aciertos")
+            contenido, tipo = guardada
+            if MARCADOR_CSRF in contenido:
+                contenido = contenido.replace(MARCADOR_CSRF, get_token(request))
+            return HttpResponse(contenido, content_type=tipo)
+
+        metricas.incrementar("cache_paginas.fallos")
+        respuesta = vista(request, *args, **kwargs)
+        if respuesta.status_code == 200 and not respuesta.streaming:
+            contenido = _PATRON_CSRF.sub(
+                rf"\g<1>{MARCADOR_CSRF}\g<2>", respuesta.content.decode(respuesta.charset)
+            )
+            _cache().set(
+                clave,
+                (contenido, respuesta["Content-Type"]),
+                getattr(settings, "CACHE_PAGINAS_SEGUNDOS", 60),
+            )
+        return respuesta
+
+    return envoltura
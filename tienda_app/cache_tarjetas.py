@@ -0,0 +1,79 @@
+"""Cache del HTML de las tarjetas de producto del catálogo."""
+
+from __future__ import annotations
+
+from typing import Dict, Iterable, List
+
+from django.core.cache import caches
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.safestring import SafeString, mark_safe
+
+from . import metricas
+
+PLANTILLA_TARJETA = "tienda_app/fragmentos/tarjeta_producto.html"
+ALIAS_CACHE = "fragmentos"
+
+# El token CSRF es distinto para cada visitante: se guarda un marcador en el
+# HTML cacheado y se reemplaza al armar la página.
+MARCADOR_CSRF = "__csrf_token_tarjeta__"
+
+
+def _cache():
+    return caches[ALIAS_CACHE]
+
+
+def _clave(pk: int) -> str:
+    return f"tarjeta:{pk}"
+
+
+def _sello(producto) -> str:
+    """
+    Versión de la tarjeta: cambia cuando se guarda el producto (updated_at) o
+    cuando cambia si se puede comprar.
+    """
+    return f"{producto.updated_at.isoformat()}|{int(producto.is_in_stock)}"
+
+
+def estadisticas() -> Dict[str, float]:
+    """
+    Aciertos y fallos del proceso actual desde que arrancó.
+    """
+    return metricas.resumen_cache("cache_tarjetas")
+
+
+def tarjetas_html(request, productos: Iterable) -> List[SafeString]:
+    """
+    Devuelve el HTML de la tarjeta de cada producto, tomando del cache las que
+    siguen vigentes y renderizando (y guardando) sólo las que faltan.
+    """
+    productos = list(productos)
+    guardadas = _cache().get_many([_clave(producto.pk) for producto in productos])
+
+    html: List[str] = []
+    nuevas: Dict[str, tuple] = {}
+    for producto in productos:
+        sello = _sello(producto)
+        entrada = guardadas.get(_clave(producto.pk))
+        if entrada and entrada[0] == sello:
+            html.append(entrada[1])
+            continue
+        fragmento = render_to_string(
+            PLANTILLA_TARJETA, {"producto": producto, "csrf_token": MARCADOR_CSRF}
+        )
+        nuevas[_clave(producto.pk)] = (sello, fragmento)
+        html.append(fragmento)
+
+    if nuevas:
+        _cache().set_many(nuevas)
+    metricas.incrementar("cache_tarjetas.aciertos", len(productos) - len(nuevas))
+    metricas.incrementar("cache_tarjetas.fallos", len(nuevas))
+
+    token = get_token(request) if html else ""
+    return [mark_safe(fragmento.replace(MARCADOR_CSRF, token)) for fragmento in html]
+
+
+def invalidar_productos(ids: Iterable[int]) -> None:
+    claves = [_clave(pk) for pk in ids]
+    if claves:
+        _cache().delete_many(claves)
@@ -0,0 +1,301 @@
+"""Carrito de compras: en la sesión para visitantes y en la base para clientes registrados."""
+
+from __future__ import annotations
+
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import DecimalField, ExpressionWrapper, F, Q, Sum
+from django.http import HttpRequest
+
+from . import reservas
+from .models import CartItem, Product
+
+CLAVE_SESION = "carrito"
+CLAVE_RESUMEN = "carrito_resumen"
+
+# Columnas que necesita el carrito para mostrar cada línea.
+CAMPOS_LINEA = ("name", "slug", "price", "stock", "image_url", "is_active")
+
+
+@dataclass
+class LineaCarrito:
+    """
+    Una línea del carrito con el producto leído de la base: el precio y el
+    stock que se muestran son los actuales, no los del momento de agregarlo.
+    """
+
+    producto: Product
+    cantidad: int
+    # Stock menos lo reservado en otros carritos; None si no se calculó.
+    disponible: Optional[int] = None
+
+    @property
+    def precio(self) -> Decimal:
+        return self.producto.price
+
+    @property
+    def subtotal(self) -> Decimal:
+        return self.producto.price * self.cantidad
+
+    @property
+    def problema(self) -> Optional[str]:
+        disponible = self.producto.stock if self.disponible is None else self.disponible
+        if not self.producto.is_active:
+            return "Este producto ya no está a la venta."
+        if self.producto.stock == 0:
+            return "Sin stock."
+        if disponible == 0:
+            return "Las últimas unidades están reservadas en otros carritos."
+        if self.cantidad > disponible:
+            return f"Sólo quedan {disponible} unidades."
+        return None
+
+
+@dataclass(frozen=True)
+class Resumen:
+    """
+    Unidades y monto del carrito para el contador de la barra de navegación.
+    El monto va en centavos para guardarlo en la sesión sin floats.
+    """
+
+    unidades: int
+    centavos: int
+
+    @property
+    def monto(self) -> Decimal:
+        return (Decimal(self.centavos) / 100).quantize(Decimal("0.01"))
+
+
+class Carrito(ABC):
+    """
+    Cantidades por producto. Las subclases deciden dónde se guardan; las
+    vistas sólo usan esta interfaz. El resumen vive en la sesión en los dos
+    casos y se rehace en cada cambio, así mostrarlo no consulta la base.
+    """
+
+    sesion = None
+    titular: Optional[str] = None
+
+    @abstractmethod
+    def cantidades(self) -> Dict[int, int]:
+        """
+        Unidades por ID de producto.
+        """
+
+    @abstractmethod
+    def fijar(self, producto_id: int, cantidad: int) -> None:
+        """
+        Deja la línea con `cantidad` unidades; con 0 o menos la quita.
+        """
+
+    @abstractmethod
+    def vaciar(self) -> None:
+        """
+        Quita todas las líneas.
+        """
+
+    def cantidad(self, producto_id: int) -> int:
+        return self.cantidades().get(producto_id, 0)
+
+    def __bool__(self) -> bool:
+        return bool(self.cantidades())
+
+    def lineas(self) -> List[LineaCarrito]:
+        """
+        Arma las líneas con una sola consulta (`in_bulk`) para todos los
+        productos, más una para las reservas de otros carritos. Las líneas de
+        productos que ya no existen se descartan.
+        """
+        cantidades = self.cantidades()
+        if not cantidades:
+            return []
+        productos = Product.objects.only(*CAMPOS_LINEA).in_bulk(list(cantidades))
+        for producto_id in set(cantidades) - set(productos):
+            self.fijar(producto_id, 0)
+        libres = reservas.disponibles(productos.values(), self.titular)
+        lineas = [
+            LineaCarrito(productos[producto_id], cantidad, libres[producto_id])
+            for producto_id, cantidad in sorted(cantidades.items())
+            if producto_id in productos
+        ]
+        # Ya se leyeron los precios: si cambiaron, el contador se corrige acá.
+        resumen = self._resumen_de(*_totales_de(lineas))
+        if self._resumen_guardado() != resumen:
+            self._guardar_resumen(resumen)
+        return lineas
+
+    def totales(self) -> Tuple[int, Decimal]:
+        """
+        Unidades y monto del carrito a precios actuales.
+        """
+        return _totales_de(self.lineas())
+
+    def resumen(self) -> Resumen:
+        """
+        El resumen guardado si todavía está vigente; si no, lo recalcula.
+        """
+        guardado = self.sesion.get(CLAVE_RESUMEN)
+        vigencia = getattr(settings, "CARRITO_RESUMEN_SEGUNDOS", 300)
+        if guardado and time.time() - guardado[2] < vigencia:
+            return Resumen(guardado[0], guardado[1])
+        return self._actualizar_resumen()
+
+    def _resumen_guardado(self) -> Optional[Resumen]:
+        guardado = self.sesion.get(CLAVE_RESUMEN)
+        return Resumen(guardado[0], guardado[1]) if guardado else None
+
+    @staticmethod
+    def _resumen_de(unidades: int, monto: Decimal) -> Resumen:
+        return Resumen(unidades, int((monto * 100).to_integral_value()))
+
+    def _actualizar_resumen(self) -> Resumen:
+        resumen = self._resumen_de(*self.totales())
+        self._guardar_resumen(resumen)
+        return resumen
+
+    def _guardar_resumen(self, resumen: Resumen) -> None:
+        # A un visitante sin carrito no se le crea una sesión sólo para el contador.
+        if resumen.unidades or CLAVE_RESUMEN in self.sesion or self.sesion.session_key:
+            self.sesion[CLAVE_RESUMEN] = [resumen.unidades, resumen.centavos, int(time.time())]
+
+
+def _totales_de(lineas: List[LineaCarrito]) -> Tuple[int, Decimal]:
+    return (
+        sum(linea.cantidad for linea in lineas),
+        sum((linea.subtotal for linea in lineas if linea.producto.is_active), Decimal("0.00")),
+    )
+
+
+class CarritoSesion(Carrito):
+    """
+    Carrito de un visitante: `{"<id de producto>": cantidad}` en la sesión.
+    """
+
+    def __init__(self, sesion):
+        self.sesion = sesion
+
+    @property
+    def titular(self) -> Optional[str]:
+        return self.sesion.get(reservas.CLAVE_TITULAR)
+
+    def _guardado(self) -> Dict[str, int]:
+        guardado = self.sesion.get(CLAVE_SESION) or {}
+        # Formato anterior: nombre, precio, imagen y slug repetidos por línea.
+        return {
+            clave: int(valor["cantidad"]) if isinstance(valor, dict) else int(valor)
+            for clave, valor in guardado.items()
+        }
+
+    def cantidades(self) -> Dict[int, int]:
+        return {int(clave): cantidad for clave, cantidad in self._guardado().items()}
+
+    def fijar(self, producto_id: int, cantidad: int) -> None:
+        guardado = self._guardado()
+        if cantidad > 0:
+            guardado[str(producto_id)] = cantidad
+        elif guardado.pop(str(producto_id), None) is None:
+            return
+        self.sesion[CLAVE_SESION] = guardado
+        self._actualizar_resumen()
+
+    def vaciar(self) -> None:
+        if CLAVE_SESION in self.sesion:
+            del self.sesion[CLAVE_SESION]
+            self._guardar_resumen(Resumen(0, 0))
+
+
+class CarritoGuardado(Carrito):
+    """
+    Carrito de un cliente registrado, en `CartItem`: sobrevive al cierre de
+    sesión y se comparte entre dispositivos.
+    """
+
+    def __init__(self, usuario, sesion):
+        self.usuario = usuario
+        self.sesion = sesion
+        self.titular = reservas.titular_de_usuario(usuario)
+        self._cantidades: Optional[Dict[int, int]] = None
+
+    def cantidades(self) -> Dict[int, int]:
+        if self._cantidades is None:
+            self._cantidades = dict(
+                CartItem.objects.filter(user=self.usuario).values_list("product_id", "quantity")
+            )
+        return dict(self._cantidades)
+
+    def fijar(self, producto_id: int, cantidad: int) -> None:
+        if cantidad > 0:
+            CartItem.objects.update_or_create(
+                user=self.usuario, product_id=producto_id, defaults={"quantity": cantidad}
+            )
+        else:
+            CartItem.objects.filter(user=self.usuario, product_id=producto_id).delete()
+        self._cantidades = None
+        self._actualizar_resumen()
+
+    def vaciar(self) -> None:
+        CartItem.objects.filter(user=self.usuario).delete()
+        self._cantidades = {}
+        self._guardar_resumen(Resumen(0, 0))
+
+    def totales(self) -> Tuple[int, Decimal]:
+        # Sumado en la base, sin traer las líneas.
+        totales = CartItem.objects.filter(user=self.usuario).aggregate(
+            unidades=Sum("quantity"),
+            monto=Sum(
+                ExpressionWrapper(
+                    F("quantity") * F("product__price"),
+                    output_field=DecimalField(max_digits=12, decimal_places=2),
+                ),
+                filter=Q(product__is_active=True),
+            ),
+        )
+        return totales["unidades"] or 0, totales["monto"] or Decimal("0.00")
+
+
+def obtener(request: HttpRequest) -> Carrito:
+    """
+    Carrito del request, creado una sola vez por request.
+    """
+    if not hasattr(request, "_carrito"):
+        if request.user.is_authenticated:
+            request._carrito = CarritoGuardado(request.user, request.session)
+        else:
+            request._carrito = CarritoSesion(request.session)
+    return request._carrito
+
+
+def fusionar_al_ingresar(request: HttpRequest, usuario) -> None:
+    """
+    Pasa el carrito armado como visitante al carrito guardado del cliente,
+    sumando las cantidades de los productos que ya tenía. Las reservas del
+    visitante pasan al cliente, hasta lo que haya disponible.
+    """
+    cantidades = CarritoSesion(request.session).cantidades()
+    token = request.session.pop(reservas.CLAVE_TITULAR, None)
+    reservas.liberar(token)
+    if cantidades:
+        productos = list(Product.objects.filter(pk__in=cantidades).only("stock"))
+        guardadas = dict(
+            CartItem.objects.filter(user=usuario, product_id__in=cantidades).values_list("product_id", "quantity")
+        )
+        fusionadas = {producto.pk: guardadas.get(producto.pk, 0) + cantidades[producto.pk] for producto in productos}
+        CartItem.objects.bulk_create(
+            [CartItem(user=usuario, product_id=pk, quantity=cantidad) for pk, cantidad in sorted(fusionadas.items())],
+            update_conflicts=True,
+            unique_fields=("user", "product"),
+            update_fields=("quantity", "updated_at"),
+        )
+        del request.session[CLAVE_SESION]
+        titular = reservas.titular_de_usuario(usuario)
+        libres = reservas.disponibles(productos, titular)
+        reservas.reservar(titular, {pk: min(cantidad, libres[pk]) for pk, cantidad in fusionadas.items()})
+    # El resumen guardado era el del visitante: se rehace con el carrito del cliente.
+    request.session.pop(CLAVE_RESUMEN, None)
+    if hasattr(request, "_carrito"):
+        del request._carrito
@@ -0,0 +1,52 @@
+"""Filtros del catálogo compartidos por las páginas HTML y la API JSON."""
+
+from __future__ import annotations
+
+from typing import Mapping, Tuple
+
+from django.conf import settings
+from django.db.models import QuerySet
+
+from . import facetas
+from .busqueda import buscar_productos
+
+
+def tamano_pagina(parametros: Mapping[str, str]) -> int:
+    """
+    Cantidad de productos por página: la configurada en settings o la pedida
+    con `?por_pagina=`, acotada al máximo permitido.
+    """
+    tamano = getattr(settings, "CATALOGO_TAMANO_PAGINA", 24)
+    maximo = getattr(settings, "CATALOGO_TAMANO_PAGINA_MAXIMO", 96)
+    try:
+        tamano = int(parametros.get("por_pagina", tamano))
+    except (TypeError, ValueError):
+        pass
+    return max(1, min(tamano, maximo))
+
+
+def filtrar_productos(
+    productos: QuerySet, parametros: Mapping[str, str]
+) -> Tuple[QuerySet, Tuple[str, ...]]:
+    """
+    Aplica los filtros `categoria`, `precio`, `buscar` y `en_stock` y devuelve
+    el queryset junto con el orden estable para paginarlo por cursor.
+    """
+    categoria_slug = parametros.get("categoria")
+    if categoria_slug:
+        productos = productos.filter(category__slug=categoria_slug)
+
+    precio = parametros.get("precio")
+    if precio:
+        productos = facetas.filtrar_por_rango_precio(productos, precio)
+
+    if parametros.get("en_stock") in ("1", "true", "si"):
+        productos = productos.filter(stock__gt=0)
+
+    busqueda = parametros.get("buscar")
+    if busqueda:
+        productos = buscar_productos(productos, busqueda)
+
+    if "rango_busqueda" in productos.query.annotations:
+        return productos, ("rango_busqueda", "name", "pk")
+    return productos, ("name", "pk")
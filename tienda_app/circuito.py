@@ -0,0 +1,112 @@
+"""Cortacircuitos para las llamadas a servicios externos, con estado compartido en el cache."""
+
+from __future__ import annotations
+
+import time
+from dataclasses import dataclass
+from typing import Dict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metricas
+
+# Cache compartido entre los workers de gunicorn (ver CACHES en settings): si
+# un worker abre el circuito, los demás dejan de llamar al servicio.
+ALIAS_CACHE = "circuitos"
+
+CERRADO = "cerrado"
+ABIERTO = "abierto"
+SEMIABIERTO = "semiabierto"
+
+
+def _cache():
+    return caches[ALIAS_CACHE]
+
+
+@dataclass(frozen=True)
+class Circuito:
+    """
+    Cuenta los fallos de un servicio en una ventana de tiempo. Al llegar al
+    límite se abre: durante `CIRCUITO_TIEMPO_ABIERTO` segundos las llamadas
+    se rechazan sin intentar. Después deja pasar una sola llamada de prueba;
+    si sale bien se cierra y si falla vuelve a abrirse.
+    """
+
+    nombre: str
+
+    @property
+    def _clave_fallos(self) -> str:
+        return f"circuito:{self.nombre}:fallos"
+
+    @property
+    def _clave_abierto(self) -> str:
+        return f"circuito:{self.nombre}:abierto_hasta"
+
+    @property
+    def _clave_prueba(self) -> str:
+        return f"circuito:{self.nombre}:prueba"
+
+    def estado(self) -> str:
+        abierto_hasta = _cache().get(self._clave_abierto)
+        if abierto_hasta is None:
+            return CERRADO
+        return ABIERTO if time.time() < abierto_hasta else SEMIABIERTO
+
+    def permitir(self) -> bool:
+        """
+        True si la llamada puede intentarse. Con el circuito semiabierto sólo
+        un proceso obtiene el permiso para la llamada de prueba.
+        """
+        estado = self.estado()
+        if estado == CERRADO:
+            return True
+        if estado == SEMIABIERTO and _cache().add(
+            self._clave_prueba, True, timeout=getattr(settings, "CIRCUITO_TIEMPO_ABIERTO", 30)
+        ):
+            return True
+        metricas.incrementar(f"circuito.{self.nombre}.rechazadas")
+        return False
+
+    def exito(self) -> None:
+        if self.estado() != CERRADO:
+            _cache().delete_many([self._clave_abierto, self._clave_prueba, self._clave_fallos])
+            metricas.incrementar(f"circuito.{self.nombre}.cerrado")
+
+    def fallo(self) -> None:
+        cache = _cache()
+        metricas.incrementar(f"circuito.{self.nombre}.fallos")
+        if self.estado() == SEMIABIERTO:
+            # Falló la llamada de prueba: otro período abierto completo.
+            self._abrir()
+            return
+        cache.add(self._clave_fallos, 0, timeout=getattr(settings, "CIRCUITO_VENTANA", 60))
+        try:
+            fallos = cache.incr(self._clave_fallos)
+        except ValueError:
+            # La ventana venció entre el add y el incr.
+            cache.set(self._clave_fallos, 1, timeout=getattr(settings, "CIRCUITO_VENTANA", 60))
+            fallos = 1
+        if fallos >= getattr(settings, "CIRCUITO_FALLOS_PARA_ABRIR", 5):
+            self._abrir()
+
+    def _abrir(self) -> None:
+        tiempo_abierto = getattr(settings, "CIRCUITO_TIEMPO_ABIERTO", 30)
+        # La clave dura más que el período abierto para que el estado pase a
+        # semiabierto en lugar de desaparecer.
+        _cache().set(self._clave_abierto, time.time() + tiempo_abierto, timeout=tiempo_abierto * 10)
+        _cache().delete_many([self._clave_prueba, self._clave_fallos])
+        metricas.incrementar(f"circuito.{self.nombre}.abierto")
+
+
+_circuitos: Dict[str, Circuito] = {}
+
+
+def circuito(nombre: str) -> Circuito:
+    if nombre not in _circuitos:
+        _circuitos[nombre] = Circuito(nombre)
+    return _circuitos[nombre]
+
+
+def estados() -> Dict[str, str]:
+    return {nombre: actual.estado() for nombre, actual in sorted(_circuitos.items())}
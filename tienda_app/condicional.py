@@ -0,0 +1,102 @@
+"""GET condicional (ETag / Last-Modified) para las páginas del catálogo."""
+
+from __future__ import annotations
+
+import hashlib
+from datetime import datetime
+from functools import wraps
+from typing import Optional, Sequence, Tuple
+
+from django.db.models import Count, Max, Subquery
+from django.http import HttpRequest
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import condition
+
+from .cache_paginas import hay_mensajes_pendientes
+from .models import Category, Product
+
+# Subir este valor cuando cambien las plantillas, para no responder 304 con HTML viejo.
+VERSION_PLANTILLAS = "1"
+
+Firma = Tuple[Optional[datetime], Sequence]
+
+
+def _firma_catalogo(request: HttpRequest, *args, **kwargs) -> Firma:
+    """
+    Última modificación del catálogo en una sola consulta barata: el máximo de
+    updated_at de productos (indexado) y de categorías, más la cantidad de
+    categorías. Borrar un producto actualiza su categoría (ver signals).
+    """
+    ultimo_producto = Product.objects.order_by("-updated_at").values("updated_at")[:1]
+    estado = Category.objects.order_by().aggregate(
+        ultima_categoria=Max("updated_at"),
+        categorias=Count("pk"),
+        ultimo_producto=Max(Subquery(ultimo_producto)),
+    )
+    fechas = [f for f in (estado["ultimo_producto"], estado["ultima_categoria"]) if f]
+    return max(fechas, default=None), (
+        estado["ultimo_producto"],
+        estado["ultima_categoria"],
+        estado["categorias"],
+    )
+
+
+def _firma_producto(request: HttpRequest, slug: str) -> Firma:
+    fila = (
+        Product.objects.filter(slug=slug, is_active=True)
+        .values_list("updated_at", "category__updated_at")
+        .first()
+    )
+    if fila is None:
+        return None, ()
+    return max(fila), fila
+
+
+def _firma_memorizada(request: HttpRequest, calcular, args, kwargs) -> Firma:
+    # condition() pide por separado el ETag y la fecha: se calcula una sola vez.
+    if not hasattr(request, "_firma_condicional"):
+        request._firma_condicional = calcular(request, *args, **kwargs)
+    return request._firma_condicional
+
+
+def get_condicional(calcular_firma):
+    """
+    Responde 304 sin renderizar cuando el navegador (o la CDN) ya tiene la
+    versión actual. El ETag incluye al usuario porque la barra de navegación
+    cambia con la sesión; si hay mensajes pendientes no se usa.
+    """
+
+    def etag(request: HttpRequest, *args, **kwargs) -> Optional[str]:
+        if hay_mensajes_pendientes(request):
+            return None
+        ultima, datos = _firma_memorizada(request, calcular_firma, args, kwargs)
+        if ultima is None:
+            return None
+        partes = [VERSION_PLANTILLAS, request.user.pk or 0, *datos]
+        return hashlib.md5("|".join(str(parte) for parte in partes).encode("utf-8")).hexdigest()
+
+    def ultima_modificacion(request: HttpRequest, *args, **kwargs) -> Optional[datetime]:
+        if request.user.is_authenticated or hay_mensajes_pendientes(request):
+            return None
+        return _firma_memorizada(request, calcular_firma, args, kwargs)[0]
+
+    def decorador(vista):
+        vista_condicional = condition(etag_func=etag, last_modified_func=ultima_modificacion)(vista)
+
+        @wraps(vista)
+        def envoltura(request: HttpRequest, *args, **kwargs):
+            respuesta = vista_condicional(request, *args, **kwargs)
+            if respuesta.has_header("ETag"):
+                # Que el navegador revalide siempre en lugar de usar su copia a ciegas.
+                patch_cache_control(
+                    respuesta, no_cache=True, private=request.user.is_authenticated
+                )
+            return respuesta
+
+        return envoltura
+
+    return decorador
+
+
+condicional_catalogo = get_condicional(_firma_catalogo)
+condicional_producto = get_condicional(_firma_producto)
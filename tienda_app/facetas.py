@@ -0,0 +1,143 @@
+"""Conteos precalculados del catálogo para la barra de filtros."""
+
+from __future__ import annotations
+
+from collections import Counter
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Count, F, Q, QuerySet
+
+from .models import CatalogFacet, FacetKind, Product
+
+# (category_id, clave del rango de precio) de un producto activo.
+EstadoFaceta = Tuple[int, str]
+
+
+@dataclass(frozen=True)
+class RangoPrecio:
+    clave: str
+    etiqueta: str
+    desde: Optional[Decimal]
+    hasta: Optional[Decimal]
+
+    def filtro(self) -> Q:
+        condicion = Q()
+        if self.desde is not None:
+            condicion &= Q(price__gte=self.desde)
+        if self.hasta is not None:
+            condicion &= Q(price__lt=self.hasta)
+        return condicion
+
+
+def rangos_de_precio() -> List[RangoPrecio]:
+    """
+    Arma los rangos a partir de los límites de `CATALOGO_LIMITES_PRECIO`,
+    por ejemplo [10000, 30000] -> hasta 10000, de 10000 a 30000 y más de 30000.
+    """
+    limites = [Decimal(limite) for limite in getattr(settings, "CATALOGO_LIMITES_PRECIO", [])]
+    rangos = []
+    desde: Optional[Decimal] = None
+    for hasta in limites + [None]:
+        if desde is None:
+            clave, etiqueta = f"0-{hasta:.0f}", f"Hasta ${hasta:.0f}"
+        elif hasta is None:
+            clave, etiqueta = f"{desde:.0f}-mas", f"Más de ${desde:.0f}"
+        else:
+            clave, etiqueta = f"{desde:.0f}-{hasta:.0f}", f"${desde:.0f} a ${hasta:.0f}"
+        rangos.append(RangoPrecio(clave, etiqueta, desde, hasta))
+        desde = hasta
+    return rangos if limites else []
+
+
+def clave_de_precio(precio: Decimal) -> str:
+    for rango in rangos_de_precio():
+        if (rango.desde is None or precio >= rango.desde) and (
+            rango.hasta is None or precio < rango.hasta
+        ):
+            return rango.clave
+    return ""
+
+
+def filtrar_por_rango_precio(productos: QuerySet, clave: str) -> QuerySet:
+    for rango in rangos_de_precio():
+        if rango.clave == clave:
+            return productos.filter(rango.filtro())
+    return productos
+
+
+def estado_de_producto(category_id, price, is_active) -> Optional[EstadoFaceta]:
+    """
+    Estado que aporta un producto a las facetas; None si no cuenta (inactivo).
+    """
+    if not is_active:
+        return None
+    return (category_id, clave_de_precio(Decimal(price)))
+
+
+def _sumar(kind: str, key: str, delta: int) -> None:
+    if not key or not delta:
+        return
+    actualizadas = CatalogFacet.objects.filter(kind=kind, key=key).update(count=F("count") + delta)
+    if not actualizadas:
+        faceta, creada = CatalogFacet.objects.get_or_create(
+            kind=kind, key=key, defaults={"count": delta}
+        )
+        if not creada:
+            CatalogFacet.objects.filter(pk=faceta.pk).update(count=F("count") + delta)
+
+
+def aplicar_cambio(antes: Optional[EstadoFaceta], despues: Optional[EstadoFaceta]) -> None:
+    """
+    Ajusta los conteos con la diferencia entre el estado anterior y el nuevo
+    de un producto. Sólo toca las filas que efectivamente cambian.
+    """
+    if antes == despues:
+        return
+    deltas: Counter = Counter()
+    if antes is not None:
+        deltas[(FacetKind.CATEGORY, str(antes[0]))] -= 1
+        deltas[(FacetKind.PRICE, antes[1])] -= 1
+    if despues is not None:
+        deltas[(FacetKind.CATEGORY, str(despues[0]))] += 1
+        deltas[(FacetKind.PRICE, despues[1])] += 1
+    for (kind, key), delta in deltas.items():
+        _sumar(kind, key, delta)
+
+
+def recalcular_facetas(modelo_producto=Product, modelo_faceta=CatalogFacet) -> None:
+    """
+    Recalcula todos los conteos desde cero. Sirve para la migración inicial y
+    después de cargas masivas que no disparan señales (bulk_create, update).
+    """
+    activos = modelo_producto.objects.filter(is_active=True).order_by()
+    filas = [
+        modelo_faceta(kind=FacetKind.CATEGORY, key=str(fila["category_id"]), count=fila["total"])
+        for fila in activos.values("category_id").annotate(total=Count("pk"))
+    ]
+    for rango in rangos_de_precio():
+        filas.append(
+            modelo_faceta(
+                kind=FacetKind.PRICE,
+                key=rango.clave,
+                count=activos.filter(rango.filtro()).count(),
+            )
+        )
+    modelo_faceta.objects.all().delete()
+    modelo_faceta.objects.bulk_create(filas)
+
+
+def conteos() -> Dict[str, Dict[str, int]]:
+    """
+    Devuelve {"category": {id: cantidad}, "price": {clave: cantidad}} con una
+    sola consulta.
+    """
+    resultado: Dict[str, Dict[str, int]] = {
+        FacetKind.CATEGORY.value: {},
+        FacetKind.PRICE.value: {},
+    }
+    for kind, key, count in CatalogFacet.objects.values_list("kind", "key", "count"):
+        resultado.setdefault(kind, {})[key] = count
+    return resultado
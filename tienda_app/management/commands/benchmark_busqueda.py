@@ -0,0 +1,88 @@
+"""Compara la búsqueda con índice FTS5 contra el filtro icontains."""
+
+from __future__ import annotations
+
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tienda_app import busqueda
+from tienda_app.models import Category, Product
+
+TIPOS = ["remera", "camiseta", "zapatilla", "pantalón", "buzo", "campera", "short", "medias"]
+ADJETIVOS = [
+    "running", "algodón", "deportiva", "térmica", "liviana", "urbana", "negra",
+    "blanca", "azul", "roja", "training", "yoga", "outdoor", "dry-fit", "oversize",
+]
+TERMINOS = ["zapatillas", "camisetá", "pantalones negra", "buzo termico", "yoga"]
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera un catálogo sintético dentro de una transacción (que se revierte al "
+        "final) y mide la búsqueda por índice FTS5 contra icontains."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--productos", type=int, default=100_000)
+        parser.add_argument("--repeticiones", type=int, default=5)
+
+    def handle(self, *args, **opciones):
+        if not busqueda.indice_disponible():
+            self.stderr.write("El benchmark requiere SQLite con FTS5.")
+            return
+
+        with transaction.atomic():
+            self._cargar_catalogo(opciones["productos"])
+            base = Product.objects.filter(is_active=True)
+            for termino in TERMINOS:
+                por_indice = busqueda.buscar_productos(base, termino)
+                por_icontains = busqueda.filtrar_por_icontains(base, termino)
+                fts = self._medir(lambda: list(por_indice.all()[:24]), opciones["repeticiones"])
+                icontains = self._medir(lambda: list(por_icontains.all()[:24]), opciones["repeticiones"])
+                self.stdout.write(
+                    f"{termino!r:20} fts5={fts * 1000:8.2f} ms ({por_indice.count()} resultados)  "
+                    f"icontains={icontains * 1000:8.2f} ms ({por_icontains.count()} resultados)"
+                )
+            transaction.set_rollback(True)
+
+    def _cargar_catalogo(self, cantidad: int) -> None:
+        azar = random.Random(1234)
+        categorias = [
+            Category.objects.create(name=f"Benchmark {nombre}", slug=f"benchmark-{nombre}")
+            for nombre in ("remeras", "calzado", "abrigos", "accesorios")
+        ]
+        # Vocabulario amplio con marcas y modelos inventados para que cada término
+        # coincida con una fracción realista del catálogo.
+        marcas = [f"marca{numero:03d}" for numero in range(300)]
+        vocabulario = ADJETIVOS + [f"palabra{numero:04d}" for numero in range(3000)]
+        lote = []
+        for numero in range(cantidad):
+            nombre = f"{azar.choice(TIPOS)} {azar.choice(marcas)} {azar.choice(ADJETIVOS)}"
+            lote.append(
+                Product(
+                    category=azar.choice(categorias),
+                    name=nombre,
+                    slug=f"benchmark-{numero}",
+                    description=" ".join(azar.sample(vocabulario, 12)),
+                    price=Decimal(azar.randint(1000, 90000)),
+                    stock=azar.randint(0, 50),
+                )
+            )
+        Product.objects.bulk_create(lote, batch_size=2000)
+        inicio = time.perf_counter()
+        busqueda.reconstruir_indice()
+        self.stdout.write(
+            f"Catálogo de {cantidad} productos indexado en {time.perf_counter() - inicio:.2f} s"
+        )
+
+    @staticmethod
+    def _medir(funcion, repeticiones: int) -> float:
+        funcion()
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            funcion()
+        return (time.perf_counter() - inicio) / repeticiones
@@ -0,0 +1,53 @@
+"""Compara el cliente HTTP del SDK de Mercado Pago contra la sesión compartida."""
+
+from __future__ import annotations
+
+import time
+from typing import List
+
+from django.core.management.base import BaseCommand
+from mercadopago.http import HttpClient
+
+from tienda_app.mercadopago_falso import ServidorMercadoPagoFalso
+from tienda_app.services import ClienteHttpMercadoPago
+
+
+class Command(BaseCommand):
+    help = (
+        "Levanta un servidor HTTP local y mide consultas de pago con el cliente del "
+        "SDK (una conexión por llamada) y con la sesión compartida de services."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--consultas", type=int, default=200)
+        parser.add_argument(
+            "--latencia-ms",
+            type=float,
+            default=20.0,
+            help="Demora por conexión nueva, para simular el handshake con el servidor real.",
+        )
+
+    def handle(self, *args, **opciones):
+        consultas = opciones["consultas"]
+        with ServidorMercadoPagoFalso(latencia=opciones["latencia_ms"] / 1000) as servidor:
+            servidor.agregar_pago("1", pedido_id=1, estado="approved")
+            url = f"{servidor.url}/v1/payments/1"
+            for nombre, cliente in (("SDK", HttpClient()), ("compartido", ClienteHttpMercadoPago())):
+                servidor.conexiones = 0
+                tiempos = self._medir(cliente, url, consultas)
+                tiempos.sort()
+                self.stdout.write(
+                    f"{nombre:11} media={sum(tiempos) / len(tiempos) * 1000:7.2f} ms  "
+                    f"p95={tiempos[int(len(tiempos) * 0.95) - 1] * 1000:7.2f} ms  "
+                    f"conexiones={servidor.conexiones}"
+                )
+
+    @staticmethod
+    def _medir(cliente, url: str, consultas: int) -> List[float]:
+        tiempos = []
+        for _ in range(consultas):
+            inicio = time.perf_counter()
+            respuesta = cliente.get(url, headers={}, timeout=5)
+            tiempos.append(time.perf_counter() - inicio)
+            assert respuesta["status"] == 200
+        return tiempos
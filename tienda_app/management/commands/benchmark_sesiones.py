@@ -0,0 +1,157 @@
+"""Compara los motores de sesión con un recorrido de compra simulado."""
+
+from __future__ import annotations
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from tienda_app.models import Product
+
+MENSAJES_EN_SESION = "django.contrib.messages.storage.session.SessionStorage"
+MENSAJES_EN_COOKIE = "django.contrib.messages.storage.cookie.CookieStorage"
+
+OPCIONES = (
+    ("db de Django + mensajes en sesión", "django.contrib.sessions.backends.db", MENSAJES_EN_SESION),
+    ("db de Django", "django.contrib.sessions.backends.db", MENSAJES_EN_COOKIE),
+    ("db agrupada", "tienda_app.sesiones.db", MENSAJES_EN_COOKIE),
+    ("cached_db agrupada", "tienda_app.sesiones.cached_db", MENSAJES_EN_COOKIE),
+    ("cache agrupada", "tienda_app.sesiones.cache", MENSAJES_EN_COOKIE),
+    ("file agrupada", "tienda_app.sesiones.file", MENSAJES_EN_COOKIE),
+)
+
+
+@contextmanager
+def _base_descartable() -> Iterator[str]:
+    """
+    Copia la base a una carpeta temporal y apunta ahí todas las conexiones
+    (los hilos abren las suyas con la misma configuración) mientras dura la
+    medición. Los visitantes simulados crean sesiones y reservas de verdad, y
+    con varios hilos no alcanza una transacción que se deshace al final, como
+    en benchmark_busqueda. Devuelve la carpeta, que también sirve para las
+    sesiones en archivos.
+    """
+    original = connection.settings_dict["NAME"]
+    with tempfile.TemporaryDirectory(prefix="benchmark-sesiones-") as carpeta:
+        copia = os.path.join(carpeta, "tienda.sqlite3")
+        connection.ensure_connection()
+        destino = sqlite3.connect(copia)
+        try:
+            connection.connection.backup(destino)
+        finally:
+            destino.close()
+        connection.close()
+        connection.settings_dict["NAME"] = copia
+        try:
+            yield carpeta
+        finally:
+            connection.close()
+            connection.settings_dict["NAME"] = original
+
+
+class Command(BaseCommand):
+    help = (
+        "Recorre el catálogo y el carrito como visitantes anónimos con cada motor de "
+        "sesión y forma de guardar los mensajes, y mide pedidos por segundo y "
+        "escrituras en django_session. Corre sobre una copia descartable de la base: "
+        "no deja sesiones ni reservas en la base real."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--visitantes", type=int, default=100, help="Visitantes por opción.")
+        parser.add_argument("--hilos", type=int, default=4, help="Visitantes simultáneos.")
+
+    def handle(self, *args, **opciones):
+        if connection.vendor != "sqlite":
+            raise CommandError("La medición copia la base y sólo sabe hacerlo con SQLite.")
+        with _base_descartable() as carpeta:
+            self._medir(opciones, carpeta)
+
+    def _medir(self, opciones, carpeta: str) -> None:
+        producto = Product.objects.filter(is_active=True, stock__gt=0).first()
+        if producto is None:
+            raise CommandError("Hace falta al menos un producto activo con stock.")
+
+        visitantes = max(1, opciones["visitantes"])
+        hilos = max(1, opciones["hilos"])
+        hosts = [*settings.ALLOWED_HOSTS, "testserver"]
+        self.stdout.write(f"{visitantes} visitantes, {hilos} simultáneos, producto {producto.slug}\n")
+
+        for nombre, motor, mensajes in OPCIONES:
+            self.contadores: Dict[str, int] = {"pedidos": 0, "escrituras": 0, "errores": 0}
+            self.bloqueo = threading.Lock()
+            with override_settings(
+                SESSION_ENGINE=motor, MESSAGE_STORAGE=mensajes, ALLOWED_HOSTS=hosts, SESSION_FILE_PATH=carpeta
+            ):
+                self._recorrer(producto)  # Calienta caches y conexiones.
+                self.contadores.update(pedidos=0, escrituras=0, errores=0)
+                inicio = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=hilos) as pool:
+                    list(pool.map(lambda _: self._recorrer(producto), range(visitantes)))
+                duracion = time.perf_counter() - inicio
+            self.stdout.write(
+                f"{nombre:34} {self.contadores['pedidos'] / duracion:7.1f} pedidos/s  "
+                f"{self.contadores['escrituras'] / visitantes:5.1f} escrituras de sesión por visitante  "
+                f"errores={self.contadores['errores']}"
+            )
+
+    def _recorrer(self, producto: Product) -> None:
+        """
+        Un visitante: mira el catálogo y un producto, lo agrega, ve el carrito,
+        vuelve a fijar la misma cantidad, consulta el contador y lo quita.
+        """
+        escrituras = 0
+
+        def contar(execute, sql, params, many, context):
+            nonlocal escrituras
+            if "django_session" in sql and not sql.lstrip().upper().startswith("SELECT"):
+                escrituras += 1
+            return execute(sql, params, many, context)
+
+        cliente = Client()
+        pedidos = 0
+        errores = 0
+        try:
+            with connection.execute_wrapper(contar):
+                for metodo, url, datos, cabeceras in (
+                    ("get", reverse("tienda_app:home"), None, {}),
+                    ("get", producto.get_absolute_url(), None, {}),
+                    ("post", reverse("tienda_app:agregar_al_carrito", args=[producto.slug]), {"cantidad": 1}, {}),
+                    ("get", reverse("tienda_app:ver_carrito"), None, {}),
+                    (
+                        "post",
+                        reverse("tienda_app:actualizar_carrito", args=[producto.pk]),
+                        {"cantidad": 1},
+                        {"HTTP_ACCEPT": "application/json"},
+                    ),
+                    ("get", reverse("tienda_app:resumen_carrito"), None, {}),
+                    ("get", reverse("tienda_app:home"), None, {}),
+                    ("post", reverse("tienda_app:eliminar_del_carrito", args=[producto.pk]), {}, {}),
+                    ("get", reverse("tienda_app:ver_carrito"), None, {}),
+                ):
+                    pedidos += 1
+                    try:
+                        respuesta = getattr(cliente, metodo)(url, datos, **cabeceras)
+                    except Exception as error:  # Por ejemplo "database is locked".
+                        self.stderr.write(f"{url}: {error}")
+                        errores += 1
+                        continue
+                    if respuesta.status_code >= 400:
+                        errores += 1
+        finally:
+            connection.close()
+        with self.bloqueo:
+            self.contadores["pedidos"] += pedidos
+            self.contadores["escrituras"] += escrituras
+            self.contadores["errores"] += errores
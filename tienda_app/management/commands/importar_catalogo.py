@@ -0,0 +1,364 @@
+"""Importa productos en masa desde un archivo CSV, JSON o NDJSON del proveedor."""
+
+from __future__ import annotations
+
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.template.defaultfilters import slugify
+from django.utils import timezone
+
+from tienda_app import autocompletar, busqueda, cache_paginas, facetas
+from tienda_app.models import Category, Product, elegir_slug
+
+FORMATOS = ("csv", "json", "ndjson")
+
+# Con estas columnas la fila completa se puede escribir con un upsert: sin
+# alguna, el INSERT fallaría por NOT NULL antes de llegar al ON CONFLICT.
+CAMPOS_OBLIGATORIOS = {"category", "name", "price"}
+
+VALORES_VERDADEROS = {"1", "true", "si", "sí", "yes", "y", "s"}
+
+MAXIMO_ERRORES_MOSTRADOS = 10
+
+
+def _filas_csv(archivo) -> Iterator[Dict[str, Any]]:
+    yield from csv.DictReader(archivo)
+
+
+def _filas_ndjson(archivo) -> Iterator[Dict[str, Any]]:
+    for linea in archivo:
+        if linea.strip():
+            yield json.loads(linea)
+
+
+def _filas_json(archivo, tamano_bloque: int = 1 << 16) -> Iterator[Dict[str, Any]]:
+    """
+    Recorre un arreglo JSON objeto por objeto, leyendo el archivo por bloques
+    en lugar de cargarlo entero.
+    """
+    decodificador = json.JSONDecoder()
+    buffer = ""
+    inicio_visto = False
+    fin_del_archivo = False
+    while True:
+        buffer = buffer.lstrip(" \t\r\n,")
+        if not inicio_visto and buffer:
+            if buffer[0] != "[":
+                raise ValueError("El archivo JSON debe contener un arreglo de productos.")
+            buffer = buffer[1:].lstrip(" \t\r\n,")
+            inicio_visto = True
+        if buffer.startswith("]"):
+            return
+        if buffer and inicio_visto:
+            try:
+                objeto, fin = decodificador.raw_decode(buffer)
+            except json.JSONDecodeError:
+                if fin_del_archivo:
+                    raise
+            else:
+                yield objeto
+                buffer = buffer[fin:]
+                continue
+        if fin_del_archivo:
+            if buffer.strip():
+                raise ValueError("El archivo JSON está incompleto.")
+            return
+        bloque = archivo.read(tamano_bloque)
+        fin_del_archivo = not bloque
+        buffer += bloque
+
+
+LECTORES = {"csv": _filas_csv, "json": _filas_json, "ndjson": _filas_ndjson}
+
+
+def _texto(fila: Dict[str, Any], campo: str) -> str:
+    valor = fila.get(campo)
+    return "" if valor is None else str(valor).strip()
+
+
+class Command(BaseCommand):
+    help = (
+        "Importa (o actualiza) productos desde un archivo CSV, JSON o NDJSON. Los "
+        "productos existentes se identifican por SKU o, si no hay, por slug. Columnas: "
+        "sku, slug, name, category, description, price, stock, image_url, is_active."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("archivo", help="Ruta del archivo a importar.")
+        parser.add_argument(
+            "--formato",
+            choices=FORMATOS,
+            help="Formato del archivo. Por defecto se toma de la extensión.",
+        )
+        parser.add_argument("--lote", type=int, default=2000, help="Filas por escritura.")
+
+    def handle(self, *args, **opciones):
+        ruta = Path(opciones["archivo"])
+        formato = opciones["formato"] or ruta.suffix.lstrip(".").lower()
+        if formato not in FORMATOS:
+            raise CommandError(f"Formato no soportado: {formato!r}. Usá --formato.")
+        if not ruta.exists():
+            raise CommandError(f"No existe el archivo {ruta}.")
+
+        self.tamano_lote = max(1, opciones["lote"])
+        self.verbosidad = opciones["verbosity"]
+        self.inicio = time.perf_counter()
+        self.procesadas = self.creados = self.actualizados = 0
+        self.errores: List[str] = []
+
+        # Cada lote se confirma por separado (ver _escribir): así la importación
+        # no retiene el único lock de escritura de SQLite durante toda la
+        # corrida y los checkouts siguen entre un lote y otro.
+        self._precargar()
+        try:
+            with ruta.open(encoding="utf-8-sig", newline="") as archivo:
+                self._importar(LECTORES[formato](archivo))
+            self._escribir()
+        finally:
+            # bulk_create no dispara las señales que mantienen las facetas y el
+            # autocompletado: se recalculan una vez, con los lotes ya escritos.
+            with transaction.atomic():
+                facetas.recalcular_facetas()
+            autocompletar.reconstruir()
+            cache_paginas.invalidar()
+        self._informar()
+
+    def _importar(self, filas: Iterator[Dict[str, Any]]) -> None:
+        try:
+            for numero, fila in enumerate(filas, start=1):
+                self.procesadas += 1
+                try:
+                    self._procesar(fila)
+                except ValueError as error:
+                    self.errores.append(f"Fila {numero}: {error}")
+                if len(self.nuevos) + len(self.modificados) >= self.tamano_lote:
+                    self._escribir()
+        except (ValueError, csv.Error) as error:
+            # Errores del archivo en sí (JSON mal formado, CSV roto): se corta acá.
+            raise CommandError(
+                f"No se pudo leer el archivo: {error}. Los lotes anteriores quedaron "
+                f"guardados ({self.creados} creados, {self.actualizados} actualizados)."
+            ) from error
+
+    def _precargar(self) -> None:
+        """
+        Una sola lectura de los slugs, SKU y categorías existentes: después
+        todo se resuelve en memoria.
+        """
+        self.pk_por_sku: Dict[str, int] = {}
+        self.pk_por_slug: Dict[str, int] = {}
+        self.slug_por_pk: Dict[int, str] = {}
+        productos = Product.objects.values_list("pk", "sku", "slug")
+        for pk, sku, slug in productos.iterator(chunk_size=self.tamano_lote):
+            self.pk_por_slug[slug] = pk
+            self.slug_por_pk[pk] = slug
+            if sku:
+                self.pk_por_sku[sku] = pk
+        self.slugs_ocupados: Set[str] = set(self.pk_por_slug)
+
+        self.categorias: Dict[str, int] = {}
+        for pk, nombre, slug in Category.objects.values_list("pk", "name", "slug"):
+            self.categorias[nombre.lower()] = pk
+            self.categorias[slug] = pk
+
+        self.nuevos: List[Product] = []
+        self.nuevos_por_sku: Dict[str, Product] = {}
+        # Filas sin SKU ni slug ya vistas en el lote, por su contenido.
+        self.nuevos_por_fila: Set[Tuple[Tuple[str, str], ...]] = set()
+        # Por producto, sólo los campos que trajeron sus filas.
+        self.modificados: Dict[int, Dict[str, Any]] = {}
+
+    def _categoria(self, valor: str) -> int:
+        if not valor:
+            raise ValueError("falta la categoría")
+        pk = self.categorias.get(valor.lower()) or self.categorias.get(slugify(valor))
+        if pk is None:
+            categoria = Category.objects.create(name=valor)
+            pk = categoria.pk
+            self.categorias[valor.lower()] = pk
+            self.categorias[categoria.slug] = pk
+        return pk
+
+    def _campos(self, fila: Dict[str, Any], existente: bool) -> Dict[str, Any]:
+        """
+        Valida la fila y devuelve los campos del producto. Para un producto
+        existente sólo cuentan las columnas que vienen con valor: las que faltan
+        (o están vacías) conservan lo que ya tenía.
+        """
+        campos: Dict[str, Any] = {}
+
+        nombre = _texto(fila, "name")
+        if nombre:
+            campos["name"] = nombre
+        elif not existente:
+            raise ValueError("falta el nombre")
+
+        if _texto(fila, "price"):
+            try:
+                campos["price"] = Decimal(_texto(fila, "price"))
+            except InvalidOperation:
+                raise ValueError("precio inválido") from None
+            if campos["price"] < 0:
+                raise ValueError("el precio no puede ser negativo")
+        elif not existente:
+            raise ValueError("falta el precio")
+
+        if _texto(fila, "stock"):
+            try:
+                campos["stock"] = int(_texto(fila, "stock"))
+            except ValueError:
+                raise ValueError("stock inválido") from None
+            if campos["stock"] < 0:
+                raise ValueError("el stock no puede ser negativo")
+        elif not existente:
+            campos["stock"] = 0
+
+        activo = _texto(fila, "is_active")
+        if activo:
+            campos["is_active"] = activo.lower() in VALORES_VERDADEROS
+        elif not existente:
+            campos["is_active"] = True
+
+        for campo in ("sku", "description", "image_url"):
+            valor = _texto(fila, campo)
+            if valor or not existente:
+                campos[campo] = valor or (None if campo == "sku" else "")
+
+        # La categoría se resuelve al final para no crearla por una fila inválida.
+        categoria = _texto(fila, "category")
+        if categoria or not existente:
+            campos["category_id"] = self._categoria(categoria)
+        return campos
+
+    def _procesar(self, fila: Dict[str, Any]) -> None:
+        if not isinstance(fila, dict):
+            raise ValueError("cada producto tiene que ser un objeto")
+        sku = _texto(fila, "sku") or None
+        slug = _texto(fila, "slug")
+
+        pk: Optional[int] = None
+        if sku:
+            pk = self.pk_por_sku.get(sku)
+        if pk is None and slug:
+            pk = self.pk_por_slug.get(slug)
+
+        if pk is not None:
+            if sku:
+                self._reservar_sku(sku, pk)
+            # Si el producto se repite en el lote, se combinan sus filas.
+            self.modificados.setdefault(pk, {}).update(self._campos(fila, existente=True))
+            return
+
+        if not sku and not slug:
+            # Sin SKU ni slug no hay con qué reconocerla: una fila repetida
+            # tal cual en el lote es el mismo producto, no uno nuevo.
+            contenido = tuple(sorted((str(campo), _texto(fila, campo)) for campo in fila))
+            if contenido in self.nuevos_por_fila:
+                return
+            self.nuevos_por_fila.add(contenido)
+
+        campos = self._campos(fila, existente=False)
+        pendiente = self.nuevos_por_sku.get(sku) if sku else None
+        if pendiente is not None:
+            # El SKU se repite en el mismo lote: gana la última fila.
+            for campo, valor in campos.items():
+                setattr(pendiente, campo, valor)
+            return
+
+        if not slug or slug in self.slugs_ocupados:
+            slug = elegir_slug(slugify(campos["name"]), self.slugs_ocupados)
+        self.slugs_ocupados.add(slug)
+        producto = Product(slug=slug, **campos)
+        self.nuevos.append(producto)
+        if sku:
+            self.nuevos_por_sku[sku] = producto
+
+    def _reservar_sku(self, sku: str, pk: int) -> None:
+        """
+        Controla en memoria que el SKU que se le pone a un producto existente
+        no sea de otro producto (guardado o nuevo en este lote): si no, el
+        lote entero fallaría en la base por la restricción única.
+        """
+        duenio = self.pk_por_sku.get(sku)
+        if (duenio is not None and duenio != pk) or sku in self.nuevos_por_sku:
+            raise ValueError(f"el SKU {sku} ya es de otro producto")
+        # El SKU anterior del producto sigue apartado hasta que se escriba el lote.
+        self.pk_por_sku[sku] = pk
+
+    def _modificados_por_campos(self) -> Dict[Tuple[str, ...], List[Product]]:
+        """
+        Agrupa los productos existentes según qué campos se actualizan: cada
+        grupo se escribe con una sentencia que sólo toca esas columnas.
+        """
+        grupos: Dict[Tuple[str, ...], List[Product]] = {}
+        ahora = timezone.now()
+        for pk, campos in self.modificados.items():
+            nombres = tuple(sorted("category" if campo == "category_id" else campo for campo in campos))
+            # El slug no cambia, para no romper las URLs publicadas.
+            grupos.setdefault(nombres, []).append(
+                Product(pk=pk, slug=self.slug_por_pk[pk], updated_at=ahora, **campos)
+            )
+        return grupos
+
+    def _escribir(self) -> None:
+        """
+        Escribe el lote en su propia transacción, con el índice de búsqueda de
+        esos productos al día.
+        """
+        with transaction.atomic():
+            escritos: List[int] = []
+            if self.nuevos:
+                Product.objects.bulk_create(self.nuevos, batch_size=self.tamano_lote)
+                for producto in self.nuevos:
+                    self.pk_por_slug[producto.slug] = producto.pk
+                    self.slug_por_pk[producto.pk] = producto.slug
+                    if producto.sku:
+                        self.pk_por_sku[producto.sku] = producto.pk
+                    escritos.append(producto.pk)
+                self.creados += len(self.nuevos)
+            for campos, productos in self._modificados_por_campos().items():
+                if CAMPOS_OBLIGATORIOS.issubset(campos):
+                    # INSERT ... ON CONFLICT (id) DO UPDATE: una sentencia por
+                    # lote, en lugar del CASE por fila que arma bulk_update.
+                    Product.objects.bulk_create(
+                        productos,
+                        batch_size=self.tamano_lote,
+                        update_conflicts=True,
+                        unique_fields=["id"],
+                        update_fields=[*campos, "updated_at"],
+                    )
+                else:
+                    Product.objects.bulk_update(productos, [*campos, "updated_at"], batch_size=self.tamano_lote)
+                escritos.extend(producto.pk for producto in productos)
+            self.actualizados += len(self.modificados)
+            # bulk_create y bulk_update no disparan las señales del índice.
+            busqueda.indexar_productos(escritos)
+        self.nuevos, self.nuevos_por_sku, self.modificados = [], {}, {}
+        self.nuevos_por_fila = set()
+
+        if self.verbosidad >= 2:
+            self.stdout.write(f"{self.procesadas} filas ({self._filas_por_segundo():.0f} filas/s)")
+
+    def _filas_por_segundo(self) -> float:
+        return self.procesadas / max(time.perf_counter() - self.inicio, 1e-9)
+
+    def _informar(self) -> None:
+        for error in self.errores[:MAXIMO_ERRORES_MOSTRADOS]:
+            self.stderr.write(error)
+        if len(self.errores) > MAXIMO_ERRORES_MOSTRADOS:
+            self.stderr.write(f"... y {len(self.errores) - MAXIMO_ERRORES_MOSTRADOS} errores más.")
+        duracion = time.perf_counter() - self.inicio
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{self.procesadas} filas en {duracion:.1f} s ({self._filas_por_segundo():.0f} filas/s): "
+                f"{self.creados} creados, {self.actualizados} actualizados, "
+                f"{len(self.errores)} con errores."
+            )
+        )
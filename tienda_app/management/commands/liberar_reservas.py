@@ -0,0 +1,23 @@
+"""Borra las reservas de stock vencidas."""
+
+from __future__ import annotations
+
+from django.core.management.base import BaseCommand
+
+from tienda_app import reservas
+
+
+class Command(BaseCommand):
+    help = (
+        "Borra por lotes las reservas de stock vencidas. El worker de tareas ya lo "
+        "hace periódicamente; este comando sirve para cron si el worker no corre."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lote", type=int, default=reservas.TAMANO_LOTE_BARRIDO, help="Reservas borradas por sentencia."
+        )
+
+    def handle(self, *args, **opciones):
+        liberadas = reservas.liberar_vencidas(max(1, opciones["lote"]))
+        self.stdout.write(self.style.SUCCESS(f"{liberadas} reservas vencidas liberadas."))
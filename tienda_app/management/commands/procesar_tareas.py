@@ -0,0 +1,111 @@
+"""Worker de la cola de tareas en base de datos."""
+
+from __future__ import annotations
+
+import signal
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, close_old_connections, connection
+
+from tienda_app import reservas, tareas
+
+
+class Command(BaseCommand):
+    help = (
+        "Ejecuta las tareas pendientes de la cola (notificaciones, efectos de pagos) "
+        "con un pool de hilos, reintentos con espera exponencial y un límite de "
+        "concurrencia por tipo de tarea. De paso borra las reservas de stock vencidas."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hilos", type=int, default=4, help="Tamaño del pool de hilos.")
+        parser.add_argument(
+            "--intervalo",
+            type=float,
+            default=1.0,
+            help="Segundos de espera cuando no hay tareas pendientes.",
+        )
+        parser.add_argument(
+            "--una-vez",
+            action="store_true",
+            help="Procesa lo que esté vencido y termina (útil para cron o pruebas).",
+        )
+
+    def handle(self, *args, **opciones):
+        self.detener = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: self.detener.set())
+        signal.signal(signal.SIGINT, lambda *_: self.detener.set())
+
+        self.hilos = max(1, opciones["hilos"])
+        self.en_curso: Counter = Counter()
+        self.bloqueo = threading.Lock()
+        barrido = getattr(settings, "RESERVAS_BARRIDO_SEGUNDOS", 60)
+        proximo_barrido = 0.0
+
+        with ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix="tarea") as pool:
+            while not self.detener.is_set():
+                try:
+                    recuperadas = tareas.recuperar_abandonadas()
+                    if recuperadas:
+                        self.stdout.write(f"{recuperadas} tareas abandonadas vuelven a la cola.")
+                    if time.monotonic() >= proximo_barrido:
+                        proximo_barrido = time.monotonic() + barrido
+                        vencidas = reservas.liberar_vencidas()
+                        if vencidas:
+                            self.stdout.write(f"{vencidas} reservas de stock vencidas liberadas.")
+                    tomadas = self._repartir(pool)
+                except OperationalError as error:
+                    # SQLite bloqueada por otra escritura más allá del timeout:
+                    # no se corta el worker, se vuelve a intentar en la próxima vuelta.
+                    self.stderr.write(f"No se pudo leer la cola: {error}")
+                    tomadas = 0
+                if tomadas:
+                    continue
+                with self.bloqueo:
+                    ocupado = sum(self.en_curso.values()) > 0
+                if opciones["una_vez"] and not ocupado:
+                    break
+                close_old_connections()
+                self.detener.wait(opciones["intervalo"])
+            self.stdout.write("Esperando que terminen las tareas en curso...")
+        connection.close()
+
+    def _libres(self, tipo: tareas.TipoTarea) -> int:
+        # Nunca más tareas de un tipo que su concurrencia, ni más que hilos del pool.
+        with self.bloqueo:
+            return min(
+                tipo.concurrencia - self.en_curso[tipo.nombre],
+                self.hilos - sum(self.en_curso.values()),
+            )
+
+    def _repartir(self, pool: ThreadPoolExecutor) -> int:
+        """
+        Toma tantas tareas vencidas como lugares libres haya y las manda al pool.
+        """
+        tomadas = 0
+        for tipo in tareas.tipos_registrados().values():
+            for trabajo_id in tareas.vencidas([tipo.nombre], self._libres(tipo)):
+                if not tareas.tomar(trabajo_id):
+                    # Otro worker se la llevó primero.
+                    continue
+                with self.bloqueo:
+                    self.en_curso[tipo.nombre] += 1
+                tomadas += 1
+                pool.submit(self._ejecutar, trabajo_id, tipo.nombre)
+        return tomadas
+
+    def _ejecutar(self, trabajo_id: int, nombre: str) -> None:
+        try:
+            tareas.ejecutar(trabajo_id)
+        except Exception as error:  # Errores de base al registrar el resultado.
+            self.stderr.write(f"No se pudo registrar el resultado de la tarea {trabajo_id}: {error}")
+        finally:
+            with self.bloqueo:
+                self.en_curso[nombre] -= 1
+            # Cada hilo usa su propia conexión: se cierra para no dejarla abierta.
+            connection.close()
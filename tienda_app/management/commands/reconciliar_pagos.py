@@ -0,0 +1,188 @@
+"""Concilia con Mercado Pago los pedidos que quedaron pendientes de pago."""
+
+from __future__ import annotations
+
+import threading
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from tienda_app import circuito, pagos, services, tareas
+from tienda_app.pedidos import liberar_pedido_sin_pago
+from tienda_app.models import Order, OrderStatus
+
+
+class LimiteDeTasa:
+    """
+    Reparte las llamadas en el tiempo para no superar `por_segundo` entre
+    todos los hilos: cada llamada reserva el próximo turno libre.
+    """
+
+    def __init__(self, por_segundo: float):
+        self.intervalo = 1 / por_segundo if por_segundo > 0 else 0.0
+        self.proximo = time.monotonic()
+        self.bloqueo = threading.Lock()
+
+    def esperar(self) -> None:
+        with self.bloqueo:
+            ahora = time.monotonic()
+            turno = max(ahora, self.proximo)
+            self.proximo = turno + self.intervalo
+        if turno > ahora:
+            time.sleep(turno - ahora)
+
+
+class Command(BaseCommand):
+    help = (
+        "Busca en Mercado Pago los pagos de los pedidos que siguen pendientes (el "
+        "comprador no volvió a la tienda y no llegó el webhook) y actualiza su estado. "
+        "Los pendientes cuyo checkout se cortó antes de crear la preferencia se marcan "
+        "como fallidos y devuelven su stock."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lote", type=int, default=200, help="Pedidos leídos por consulta.")
+        parser.add_argument("--hilos", type=int, default=8, help="Consultas simultáneas a Mercado Pago.")
+        parser.add_argument(
+            "--por-segundo",
+            type=float,
+            default=10.0,
+            help="Máximo de consultas por segundo a Mercado Pago (0 = sin límite).",
+        )
+        parser.add_argument(
+            "--minutos",
+            type=int,
+            default=30,
+            help="Sólo pedidos creados hace al menos estos minutos (el comprador puede estar pagando).",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Muestra los cambios sin guardarlos.",
+        )
+
+    def handle(self, *args, **opciones):
+        self.simular = opciones["dry_run"]
+        self.limite = LimiteDeTasa(opciones["por_segundo"])
+        self.resumen: Counter = Counter()
+        self.bloqueo = threading.Lock()
+        inicio = time.perf_counter()
+
+        limite = timezone.now() - timedelta(minutes=opciones["minutos"])
+        self._liberar_sin_preferencia(limite)
+
+        pendientes = Order.objects.filter(
+            status=OrderStatus.PENDING,
+            payment_provider="mercadopago",
+            created_at__lte=limite,
+        ).order_by("pk")
+        lote = max(1, opciones["lote"])
+        ultimo = 0
+        with ThreadPoolExecutor(max_workers=max(1, opciones["hilos"]), thread_name_prefix="conciliar") as pool:
+            while True:
+                # Paginación por clave: cada lote sigue desde el último pk, sin
+                # OFFSET, y los pedidos que cambian de estado no corren la página.
+                ids = list(pendientes.filter(pk__gt=ultimo).values_list("pk", flat=True)[:lote])
+                if not ids:
+                    break
+                ultimo = ids[-1]
+                self._aplicar(list(pool.map(self._consultar, ids)))
+                if services.CIRCUITO_PAGO.estado() == circuito.ABIERTO:
+                    self.stderr.write("Mercado Pago no responde (circuito abierto): se corta la conciliación.")
+                    break
+
+        duracion = time.perf_counter() - inicio
+        cambios = ", ".join(
+            f"{cantidad} a {OrderStatus(estado).label}"
+            for estado, cantidad in sorted(self.resumen.items())
+            if estado in OrderStatus.values
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{'[simulación] ' if self.simular else ''}{self.resumen['revisados']} pedidos "
+                f"revisados en {duracion:.1f} s: {cambios or 'sin cambios'}; "
+                f"{self.resumen['sin_pago']} sin pagos, {self.resumen['errores']} con errores, "
+                f"{self.resumen['sin_preferencia']} sin pago iniciado liberados."
+            )
+        )
+
+    def _liberar_sin_preferencia(self, limite) -> None:
+        """
+        Pedidos que el checkout marcó para Mercado Pago al descontar el stock
+        pero que nunca recibieron la referencia de la preferencia (por ejemplo,
+        el worker murió): nadie los puede pagar, así que se liberan. Los
+        pedidos sin proveedor (cargados a mano) no descontaron stock y no se tocan.
+        """
+        huerfanos = Order.objects.filter(
+            status=OrderStatus.PENDING,
+            payment_provider="mercadopago",
+            payment_reference="",
+            created_at__lte=limite,
+        ).order_by("pk")
+        for pedido in huerfanos.only("pk", "status").iterator():
+            if self.simular:
+                self.stdout.write(f"Pedido #{pedido.pk}: sin pago iniciado -> {OrderStatus.FAILED.label}")
+                self.resumen["sin_preferencia"] += 1
+            elif liberar_pedido_sin_pago(pedido):
+                self.resumen["sin_preferencia"] += 1
+
+    def _consultar(self, pedido_id: int) -> Tuple[int, Optional[str]]:
+        """
+        Corre en los hilos del pool: sólo habla con Mercado Pago. La base la
+        toca el hilo principal, con las escrituras agrupadas.
+        """
+        self.limite.esperar()
+        try:
+            estado = pagos.estado_de_los_pagos(services.buscar_pagos_del_pedido(pedido_id))
+        except services.MercadoPagoError as error:
+            with self.bloqueo:
+                self.resumen["errores"] += 1
+            self.stderr.write(f"Pedido #{pedido_id}: {error}")
+            estado = None
+        else:
+            if estado is None:
+                with self.bloqueo:
+                    self.resumen["sin_pago"] += 1
+        finally:
+            # El cortacircuitos lee el cache en la base desde este hilo.
+            connection.close()
+        return pedido_id, estado
+
+    def _aplicar(self, resultados: List[Tuple[int, Optional[str]]]) -> None:
+        self.resumen["revisados"] += len(resultados)
+        por_estado: Dict[str, List[int]] = defaultdict(list)
+        for pedido_id, estado_pago in resultados:
+            if estado_pago is None:
+                continue
+            nuevo = pagos.estado_del_pedido(estado_pago)
+            if nuevo != OrderStatus.PENDING:
+                por_estado[nuevo].append(pedido_id)
+
+        for nuevo, ids in por_estado.items():
+            if self.simular:
+                for pedido_id in ids:
+                    self.stdout.write(f"Pedido #{pedido_id}: pendiente -> {OrderStatus(nuevo).label}")
+                self.resumen[nuevo] += len(ids)
+                continue
+            with transaction.atomic():
+                # Un UPDATE por estado; el webhook pudo haber actualizado
+                # alguno mientras tanto, por eso se filtra otra vez por pendiente.
+                cambiados = list(
+                    Order.objects.select_for_update()
+                    .filter(pk__in=ids, status=OrderStatus.PENDING)
+                    .values_list("pk", flat=True)
+                )
+                Order.objects.filter(pk__in=cambiados).update(status=nuevo, updated_at=timezone.now())
+                for pedido_id in cambiados:
+                    tareas.encolar(
+                        "telegram.notificar_pedido",
+                        pedido_id=pedido_id,
+                        titulo=services.TITULO_PAGO_ACTUALIZADO,
+                    )
+            self.resumen[nuevo] += len(cambiados)
@@ -0,0 +1,58 @@
+"""Compara los totales guardados de los pedidos con la suma de sus líneas."""
+
+from __future__ import annotations
+
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db.models import F, Q
+from django.db.models.functions import Abs
+
+from tienda_app.models import Order, totales_desde_items
+
+MAXIMO_MOSTRADOS = 20
+TAMANO_LOTE = 500
+
+
+class Command(BaseCommand):
+    help = (
+        "Busca pedidos cuyos totales guardados no coinciden con sus líneas (por "
+        "ejemplo, líneas cargadas sin pasar por el modelo) y, con --corregir, los arregla."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--corregir", action="store_true", help="Recalcula los pedidos con diferencias.")
+
+    def handle(self, *args, **opciones):
+        calculados = totales_desde_items()
+        # El monto se compara con tolerancia: SQLite guarda los decimales como REAL.
+        distintos = (
+            Order.objects.annotate(
+                items_reales=calculados["total_items"],
+                monto_real=calculados["total_amount"],
+            )
+            .annotate(diferencia=Abs(F("total_amount") - F("monto_real")))
+            .filter(~Q(total_items=F("items_reales")) | Q(diferencia__gte=Decimal("0.005")))
+            .order_by("pk")
+        )
+        filas = list(distintos.values_list("pk", "total_items", "items_reales", "total_amount", "monto_real"))
+
+        for pk, items, items_reales, monto, monto_real in filas[:MAXIMO_MOSTRADOS]:
+            self.stdout.write(
+                f"Pedido #{pk}: guardado {items} productos / ${monto}, "
+                f"según sus líneas {items_reales} productos / ${monto_real}"
+            )
+        if len(filas) > MAXIMO_MOSTRADOS:
+            self.stdout.write(f"... y {len(filas) - MAXIMO_MOSTRADOS} pedidos más.")
+
+        if not filas:
+            self.stdout.write(self.style.SUCCESS("Todos los pedidos tienen los totales al día."))
+        elif opciones["corregir"]:
+            ids = [fila[0] for fila in filas]
+            corregidos = sum(
+                Order.objects.filter(pk__in=ids[inicio : inicio + TAMANO_LOTE]).update(**calculados)
+                for inicio in range(0, len(ids), TAMANO_LOTE)
+            )
+            self.stdout.write(self.style.SUCCESS(f"{corregidos} pedidos corregidos."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(filas)} pedidos con diferencias. Usá --corregir."))
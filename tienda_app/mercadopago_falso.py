@@ -0,0 +1,97 @@
+"""Servidor HTTP local que imita la API de pagos de Mercado Pago, para tests y benchmarks."""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+from urllib.parse import parse_qs, urlparse
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Encabezados y cuerpo salen en escrituras separadas: sin esto, Nagle y el
+    # ACK demorado suman ~40 ms a cada respuesta de una conexión reutilizada.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        servidor: ServidorMercadoPagoFalso = self.server
+        with servidor.bloqueo:
+            servidor.consultas += 1
+        if servidor.demora:
+            time.sleep(servidor.demora)
+        ruta = urlparse(self.path)
+        if ruta.path == "/v1/payments/search":
+            referencia = parse_qs(ruta.query).get("external_reference", [""])[0]
+            resultados = servidor.pagos_de(referencia)
+            self._responder(200, {"results": resultados, "paging": {"total": len(resultados)}})
+        elif ruta.path.startswith("/v1/payments/"):
+            pago = servidor.pagos.get(ruta.path.rsplit("/", 1)[-1])
+            if pago is None:
+                self._responder(404, {"message": "Payment not found"})
+            else:
+                self._responder(200, pago)
+        else:
+            self._responder(404, {"message": "not found"})
+
+    def _responder(self, estado: int, datos: Any) -> None:
+        cuerpo = json.dumps(datos).encode()
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, *args):
+        pass
+
+
+class ServidorMercadoPagoFalso(ThreadingHTTPServer):
+    """
+    Responde `GET /v1/payments/<id>` y `GET /v1/payments/search` con los
+    pagos cargados en `pagos`. `latencia` se suma a cada conexión nueva (el
+    handshake TCP + TLS con el servidor real) y `demora` a cada respuesta.
+    Se usa como context manager; `url` va en `MERCADOPAGO_API_URL`.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latencia: float = 0.0, demora: float = 0.0):
+        super().__init__(("127.0.0.1", 0), _Manejador)
+        self.latencia = latencia
+        self.demora = demora
+        self.pagos: Dict[str, Dict[str, Any]] = {}
+        self.bloqueo = threading.Lock()
+        self.conexiones = 0
+        self.consultas = 0
+
+    def agregar_pago(self, pago_id: str, pedido_id: int, estado: str) -> None:
+        self.pagos[str(pago_id)] = {
+            "id": pago_id,
+            "status": estado,
+            "external_reference": str(pedido_id),
+        }
+
+    def pagos_de(self, referencia: str) -> List[Dict[str, Any]]:
+        return [pago for pago in self.pagos.values() if pago["external_reference"] == referencia]
+
+    def get_request(self):
+        conexion = super().get_request()
+        self.conexiones += 1
+        if self.latencia:
+            time.sleep(self.latencia)
+        return conexion
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,41 @@
+"""Contadores simples del proceso para observar caches e integraciones."""
+
+from __future__ import annotations
+
+import threading
+from collections import defaultdict
+from typing import DefaultDict, Dict
+
+_valores: DefaultDict[str, int] = defaultdict(int)
+_bloqueo = threading.Lock()
+
+
+def incrementar(nombre: str, cantidad: int = 1) -> None:
+    if not cantidad:
+        return
+    with _bloqueo:
+        _valores[nombre] += cantidad
+
+
+def instantanea(prefijo: str = "") -> Dict[str, int]:
+    """
+    Copia de los contadores (del proceso actual) cuyo nombre empieza con `prefijo`.
+    """
+    with _bloqueo:
+        return {nombre: valor for nombre, valor in sorted(_valores.items()) if nombre.startswith(prefijo)}
+
+
+def resumen_cache(prefijo: str) -> Dict[str, float]:
+    """
+    Aciertos, fallos y tasa de aciertos de un cache que cuenta con
+    `<prefijo>.aciertos` y `<prefijo>.fallos`.
+    """
+    valores = instantanea(prefijo)
+    aciertos = valores.get(f"{prefijo}.aciertos", 0)
+    fallos = valores.get(f"{prefijo}.fallos", 0)
+    total = aciertos + fallos
+    return {
+        "aciertos": aciertos,
+        "fallos": fallos,
+        "tasa_aciertos": round(aciertos / total, 4) if total else 0.0,
+    }
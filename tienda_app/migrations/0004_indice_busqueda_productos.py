@@ -0,0 +1,25 @@
+from django.db import migrations
+
+
+def crear_indice(apps, schema_editor):
+    from tienda_app.busqueda import crear_indice, reconstruir_indice
+
+    if crear_indice(schema_editor):
+        reconstruir_indice(schema_editor)
+
+
+def eliminar_indice(apps, schema_editor):
+    from tienda_app.busqueda import eliminar_indice
+
+    eliminar_indice(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda_app', '0003_alter_category_options_alter_order_options_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, eliminar_indice),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:14
+
+from django.db import migrations, models
+
+
+def calcular_facetas(apps, schema_editor):
+    from tienda_app.facetas import recalcular_facetas
+
+    recalcular_facetas(
+        apps.get_model('tienda_app', 'Product'),
+        apps.get_model('tienda_app', 'CatalogFacet'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda_app', '0004_indice_busqueda_productos'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('category', 'Categoría'), ('price', 'Rango de precio')], max_length=20, verbose_name='Tipo')),
+                ('key', models.CharField(max_length=60, verbose_name='Clave')),
+                ('count', models.IntegerField(default=0, verbose_name='Cantidad')),
+            ],
+            options={
+                'verbose_name': 'Faceta del catálogo',
+                'verbose_name_plural': 'Facetas del catálogo',
+                'constraints': [models.UniqueConstraint(fields=('kind', 'key'), name='faceta_tipo_clave_unica')],
+            },
+        ),
+        migrations.RunPython(calcular_facetas, migrations.RunPython.noop),
+    ]
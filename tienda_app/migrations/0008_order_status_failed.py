@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda_app', '0007_product_sku'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pendiente'), ('processing', 'En preparación'), ('shipped', 'Enviado'), ('completed', 'Completado'), ('cancelled', 'Cancelado'), ('failed', 'Pago no iniciado')], default='pending', max_length=20, verbose_name='Estado'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:37
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda_app', '0008_order_status_failed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BackgroundJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=80, verbose_name='Tipo')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='Datos')),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('running', 'En ejecución'), ('done', 'Terminada'), ('dead', 'Fallida (sin más reintentos)')], default='pending', max_length=20, verbose_name='Estado')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Intentos')),
+                ('max_attempts', models.PositiveIntegerField(default=5, verbose_name='Máximo de intentos')),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Ejecutar desde')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='Tomada el')),
+                ('last_error', models.TextField(blank=True, verbose_name='Último error')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Creada el')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Actualizada el')),
+            ],
+            options={
+                'verbose_name': 'Tarea en segundo plano',
+                'verbose_name_plural': 'Tareas en segundo plano',
+                'ordering': ('-created_at',),
+                'indexes': [models.Index(fields=['status', 'run_after'], name='tarea_estado_vence_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda_app', '0009_tareas_en_segundo_plano'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=160, unique=True, verbose_name='Clave')),
+                ('topic', models.CharField(max_length=40, verbose_name='Tema')),
+                ('resource_id', models.CharField(max_length=64, verbose_name='ID del recurso')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='Datos recibidos')),
+                ('status', models.CharField(choices=[('received', 'Recibida'), ('processed', 'Procesada'), ('ignored', 'Ignorada')], default='received', max_length=20, verbose_name='Estado')),
+                ('payment_status', models.CharField(blank=True, max_length=40, verbose_name='Estado del pago')),
+                ('received_at', models.DateTimeField(auto_now_add=True, verbose_name='Recibida el')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Procesada el')),
+                ('order', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='payment_notifications', to='tienda_app.order', verbose_name='Pedido')),
+            ],
+            options={
+                'verbose_name': 'Notificación de pago',
+                'verbose_name_plural': 'Notificaciones de pago',
+                'ordering': ('-received_at',),
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:49
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def completar_totales(apps, schema_editor):
+    # Un solo UPDATE con subconsultas, sin recorrer los pedidos en Python.
+    Order = apps.get_model('tienda_app', 'Order')
+    OrderItem = apps.get_model('tienda_app', 'OrderItem')
+    lineas = OrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+    monto = models.DecimalField(max_digits=12, decimal_places=2)
+    Order.objects.update(
+        total_items=Coalesce(
+            Subquery(lineas.annotate(cantidad=Sum('quantity')).values('cantidad')),
+            0,
+            output_field=models.PositiveIntegerField(),
+        ),
+        total_amount=Coalesce(
+            Subquery(lineas.annotate(monto=Sum(F('quantity') * F('price'), output_field=monto)).values('monto')),
+            Value(Decimal('0.00')),
+            output_field=monto,
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda_app', '0010_notificaciones_de_pago'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12, verbose_name='Total'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='total_items',
+            field=models.PositiveIntegerField(default=0, verbose_name='Cantidad de productos'),
+        ),
+        migrations.RunPython(completar_totales, migrations.RunPython.noop),
+    ]
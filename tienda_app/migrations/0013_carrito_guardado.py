@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-18 06:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda_app', '0012_indices_consultas'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CartItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField(default=1, verbose_name='Cantidad')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Actualizado el')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_items', to='tienda_app.product', verbose_name='Producto')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cart_items', to=settings.AUTH_USER_MODEL, verbose_name='Usuario')),
+            ],
+            options={
+                'verbose_name': 'Línea de carrito',
+                'verbose_name_plural': 'Líneas de carrito',
+                'constraints': [models.UniqueConstraint(fields=('user', 'product'), name='carrito_usuario_producto_unico')],
+            },
+        ),
+    ]
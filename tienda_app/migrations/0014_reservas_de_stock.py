@@ -0,0 +1,31 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda_app', '0013_carrito_guardado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner', models.CharField(max_length=64, verbose_name='Titular')),
+                ('quantity', models.PositiveIntegerField(verbose_name='Cantidad')),
+                ('expires_at', models.DateTimeField(verbose_name='Vence el')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Actualizada el')),
+                ('product', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='tienda_app.product', verbose_name='Producto')),
+            ],
+            options={
+                'verbose_name': 'Reserva de stock',
+                'verbose_name_plural': 'Reservas de stock',
+                'indexes': [models.Index(fields=['product', 'expires_at', 'quantity'], name='reserva_producto_vence_idx'), models.Index(fields=['expires_at'], name='reserva_vence_idx')],
+                'constraints': [models.UniqueConstraint(fields=('owner', 'product'), name='reserva_titular_producto_unica')],
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.8 on 2026-10-18 07:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tienda_app', '0014_reservas_de_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AutocompleteChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=20, verbose_name='Tipo')),
+                ('object_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='Id del objeto')),
+                ('name', models.CharField(blank=True, max_length=160, null=True, verbose_name='Nombre')),
+                ('slug', models.CharField(blank=True, max_length=180, verbose_name='Slug')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Publicado el')),
+            ],
+            options={
+                'verbose_name': 'Cambio de autocompletar',
+                'verbose_name_plural': 'Cambios de autocompletar',
+            },
+        ),
+    ]
@@ -3,12 +3,28 @@
 from __future__ import annotations
 
 from decimal import Decimal
+from typing import Dict
 
 from django.conf import settings
 from django.db import models
-from django.db.models import DecimalField, F, Sum
+from django.db.models import DecimalField, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.template.defaultfilters import slugify
 from django.urls import reverse
+from django.utils import timezone
+
+
+def elegir_slug(base_slug: str, ocupados) -> str:
+    """
+    Primer slug libre entre `base_slug`, `base_slug-1`, `base_slug-2`, ...
+    según el conjunto de slugs ya usados, sin consultar la base.
+    """
+    slug = base_slug
+    counter = 1
+    while slug in ocupados:
+        slug = f"{base_slug}-{counter}"
+        counter += 1
+    return slug
 
 
 class Category(models.Model):
@@ -19,6 +35,7 @@ class Category(models.Model):
     name = models.CharField("Nombre", max_length=120, unique=True)
     slug = models.SlugField("Slug", max_length=140, unique=True, editable=False)
     description = models.TextField("Descripción", blank=True)
+    updated_at = models.DateTimeField("Actualizado el", auto_now=True)
 
     class Meta:
         verbose_name = "Categoría"
@@ -46,6 +63,7 @@ class Product(models.Model):
     )
     name = models.CharField("Nombre", max_length=160)
     slug = models.SlugField("Slug", max_length=180, unique=True, editable=False)
+    sku = models.CharField("SKU", max_length=64, unique=True, null=True, blank=True)
     description = models.TextField("Descripción", blank=True)
     price = models.DecimalField("Precio", max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField("Stock", default=0)
@@ -58,19 +76,38 @@ class Product(models.Model):
         verbose_name = "Producto"
         verbose_name_plural = "Productos"
         ordering = ("name",)
+        indexes = [
+            # Última modificación del catálogo para el GET condicional.
+            models.Index(fields=("updated_at",), name="producto_actualizado_idx"),
+            # El catálogo sólo lista activos, ordenados por (nombre, id) para el
+            # cursor: con y sin filtro de categoría. Son parciales porque los
+            # inactivos nunca se listan; en bases sin índices parciales Django
+            # los omite.
+            models.Index(
+                fields=("category", "name", "id"),
+                condition=Q(is_active=True),
+                name="producto_activo_cat_idx",
+            ),
+            models.Index(
+                fields=("name", "id"),
+                condition=Q(is_active=True),
+                name="producto_activo_nombre_idx",
+            ),
+        ]
 
     def __str__(self) -> str:
         return self.name
 
     def save(self, *args, **kwargs):
         if not self.slug:
+            # Una sola consulta trae todos los slugs que podrían chocar.
             base_slug = slugify(self.name)
-            slug = base_slug
-            counter = 1
-            while Product.objects.filter(slug=slug).exclude(pk=self.pk).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            self.slug = slug
+            ocupados = set(
+                Product.objects.filter(slug__startswith=base_slug)
+                .exclude(pk=self.pk)
+                .values_list("slug", flat=True)
+            )
+            self.slug = elegir_slug(base_slug, ocupados)
         super().save(*args, **kwargs)
 
     @property
@@ -81,6 +118,54 @@ class Product(models.Model):
         return reverse("tienda_app:product_detail", kwargs={"slug": self.slug})
 
 
+class FacetKind(models.TextChoices):
+    CATEGORY = "category", "Categoría"
+    PRICE = "price", "Rango de precio"
+
+
+class CatalogFacet(models.Model):
+    """
+    Cantidad precalculada de productos activos por categoría o rango de precio.
+    Se mantiene de forma incremental desde las señales de Product.
+    """
+
+    kind = models.CharField("Tipo", max_length=20, choices=FacetKind.choices)
+    key = models.CharField("Clave", max_length=60)
+    count = models.IntegerField("Cantidad", default=0)
+
+    class Meta:
+        verbose_name = "Faceta del catálogo"
+        verbose_name_plural = "Facetas del catálogo"
+        constraints = [
+            models.UniqueConstraint(fields=("kind", "key"), name="faceta_tipo_clave_unica"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.get_kind_display()} {self.key}: {self.count}"
+
+
+class AutocompleteChange(models.Model):
+    """
+    Cambio publicado para el índice de autocompletar que cada worker tiene en
+    memoria. El id hace de número de versión: cada proceso aplica los cambios
+    que todavía no vio antes de responder.
+    """
+
+    kind = models.CharField("Tipo", max_length=20)
+    object_id = models.PositiveIntegerField("Id del objeto", null=True, blank=True)
+    # Sin nombre, el cambio quita la entrada del índice.
+    name = models.CharField("Nombre", max_length=160, null=True, blank=True)
+    slug = models.CharField("Slug", max_length=180, blank=True)
+    created_at = models.DateTimeField("Publicado el", auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Cambio de autocompletar"
+        verbose_name_plural = "Cambios de autocompletar"
+
+    def __str__(self) -> str:
+        return f"{self.kind} {self.object_id} (versión {self.pk})"
+
+
 class CustomerProfile(models.Model):
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL,
@@ -102,12 +187,82 @@ class CustomerProfile(models.Model):
         return f"Perfil de {self.user.get_username()}"
 
 
+class CartItem(models.Model):
+    """
+    Línea del carrito de un cliente registrado: sólo producto y cantidad. El
+    precio y el stock se leen del producto al mostrar el carrito.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="cart_items",
+        verbose_name="Usuario",
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name="cart_items",
+        verbose_name="Producto",
+    )
+    quantity = models.PositiveIntegerField("Cantidad", default=1)
+    updated_at = models.DateTimeField("Actualizado el", auto_now=True)
+
+    class Meta:
+        verbose_name = "Línea de carrito"
+        verbose_name_plural = "Líneas de carrito"
+        constraints = [
+            models.UniqueConstraint(fields=("user", "product"), name="carrito_usuario_producto_unico"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.product_id} x {self.quantity}"
+
+
+class StockReservation(models.Model):
+    """
+    Unidades de un producto apartadas por un carrito hasta `expires_at`. Lo
+    que pueden comprar los demás es el stock menos las reservas vigentes.
+    """
+
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name="reservations",
+        verbose_name="Producto",
+        # Lo reemplaza reserva_producto_vence_idx, que empieza por product.
+        db_index=False,
+    )
+    # "usuario:<id>" o "visitante:<token guardado en la sesión>".
+    owner = models.CharField("Titular", max_length=64)
+    quantity = models.PositiveIntegerField("Cantidad")
+    expires_at = models.DateTimeField("Vence el")
+    updated_at = models.DateTimeField("Actualizada el", auto_now=True)
+
+    class Meta:
+        verbose_name = "Reserva de stock"
+        verbose_name_plural = "Reservas de stock"
+        constraints = [
+            models.UniqueConstraint(fields=("owner", "product"), name="reserva_titular_producto_unica"),
+        ]
+        indexes = [
+            # Suma de las reservas vigentes por producto, sin leer la tabla.
+            models.Index(fields=("product", "expires_at", "quantity"), name="reserva_producto_vence_idx"),
+            # El barrido de reservas vencidas.
+            models.Index(fields=("expires_at",), name="reserva_vence_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.quantity} x {self.product_id} para {self.owner}"
+
+
 class OrderStatus(models.TextChoices):
     PENDING = "pending", "Pendiente"
     PROCESSING = "processing", "En preparación"
     SHIPPED = "shipped", "Enviado"
     COMPLETED = "completed", "Completado"
     CANCELLED = "cancelled", "Cancelado"
+    FAILED = "failed", "Pago no iniciado"
 
 
 class Order(models.Model):
@@ -120,6 +275,8 @@ class Order(models.Model):
         on_delete=models.CASCADE,
         related_name="orders",
         verbose_name="Usuario",
+        # Lo reemplaza pedido_usuario_fecha_idx, que empieza por user.
+        db_index=False,
     )
     created_at = models.DateTimeField("Creado el", auto_now_add=True)
     updated_at = models.DateTimeField("Actualizado el", auto_now=True)
@@ -133,31 +290,27 @@ class Order(models.Model):
     observations = models.TextField("Observaciones", blank=True)
     payment_provider = models.CharField("Proveedor de pago", max_length=40, blank=True)
     payment_reference = models.CharField("Referencia de pago", max_length=120, blank=True)
+    # Totales guardados para no sumar las líneas en cada listado; los mantienen
+    # las señales de OrderItem y el checkout (ver totales_desde_items).
+    total_items = models.PositiveIntegerField("Cantidad de productos", default=0)
+    total_amount = models.DecimalField("Total", max_digits=12, decimal_places=2, default=Decimal("0.00"))
 
     class Meta:
         verbose_name = "Pedido"
         verbose_name_plural = "Pedidos"
         ordering = ("-created_at",)
+        indexes = [
+            # "Mis pedidos": los de un usuario, del más nuevo al más viejo.
+            # También cubre las búsquedas por user_id del FK.
+            models.Index(fields=("user", "created_at", "id"), name="pedido_usuario_fecha_idx"),
+            # Admin y conciliación: por estado y fecha, y sólo por fecha.
+            models.Index(fields=("status", "created_at", "id"), name="pedido_estado_fecha_idx"),
+            models.Index(fields=("created_at", "id"), name="pedido_fecha_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"Pedido #{self.pk} de {self.user.get_username()}"
 
-    @property
-    def total_items(self) -> int:
-        return self.items.aggregate(total=Sum("quantity"))["total"] or 0
-
-    @property
-    def total_amount(self) -> Decimal:
-        return (
-            self.items.aggregate(
-                total=Sum(
-                    F("quantity") * F("price"),
-                    output_field=DecimalField(max_digits=12, decimal_places=2),
-                )
-            )["total"]
-            or Decimal("0.00")
-        )
-
 
 class OrderItem(models.Model):
     """
@@ -189,3 +342,113 @@ class OrderItem(models.Model):
     @property
     def subtotal(self) -> Decimal:
         return self.quantity * self.price
+
+
+def totales_desde_items() -> Dict[str, Coalesce]:
+    """
+    Cantidad y monto de las líneas de cada pedido como subconsultas, para un
+    update() o annotate() sobre Order en una sola sentencia.
+    """
+    lineas = OrderItem.objects.filter(order=OuterRef("pk")).order_by().values("order")
+    monto = DecimalField(max_digits=12, decimal_places=2)
+    return {
+        "total_items": Coalesce(
+            Subquery(lineas.annotate(cantidad=Sum("quantity")).values("cantidad")),
+            0,
+            output_field=models.PositiveIntegerField(),
+        ),
+        "total_amount": Coalesce(
+            Subquery(
+                lineas.annotate(monto=Sum(F("quantity") * F("price"), output_field=monto)).values("monto")
+            ),
+            Value(Decimal("0.00")),
+            output_field=monto,
+        ),
+    }
+
+
+class JobStatus(models.TextChoices):
+    PENDING = "pending", "Pendiente"
+    RUNNING = "running", "En ejecución"
+    DONE = "done", "Terminada"
+    DEAD = "dead", "Fallida (sin más reintentos)"
+
+
+class BackgroundJob(models.Model):
+    """
+    Tarea pendiente de la cola en base de datos (outbox). Se escribe en la
+    misma transacción que el cambio que la origina y la ejecuta el worker
+    `procesar_tareas`.
+    """
+
+    kind = models.CharField("Tipo", max_length=80)
+    payload = models.JSONField("Datos", default=dict, blank=True)
+    status = models.CharField(
+        "Estado",
+        max_length=20,
+        choices=JobStatus.choices,
+        default=JobStatus.PENDING,
+    )
+    attempts = models.PositiveIntegerField("Intentos", default=0)
+    max_attempts = models.PositiveIntegerField("Máximo de intentos", default=5)
+    run_after = models.DateTimeField("Ejecutar desde", default=timezone.now)
+    locked_at = models.DateTimeField("Tomada el", null=True, blank=True)
+    last_error = models.TextField("Último error", blank=True)
+    created_at = models.DateTimeField("Creada el", auto_now_add=True)
+    updated_at = models.DateTimeField("Actualizada el", auto_now=True)
+
+    class Meta:
+        verbose_name = "Tarea en segundo plano"
+        verbose_name_plural = "Tareas en segundo plano"
+        ordering = ("-created_at",)
+        indexes = [
+            # Lo que consulta el worker en cada vuelta: pendientes ya vencidas.
+            models.Index(fields=("status", "run_after"), name="tarea_estado_vence_idx"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.kind} #{self.pk} ({self.get_status_display()})"
+
+
+class NotificationStatus(models.TextChoices):
+    RECEIVED = "received", "Recibida"
+    PROCESSED = "processed", "Procesada"
+    IGNORED = "ignored", "Ignorada"
+
+
+class PaymentNotification(models.Model):
+    """
+    Aviso de Mercado Pago recibido por webhook. La clave única descarta los
+    reenvíos; el procesamiento (consultar el pago y actualizar el pedido) lo
+    hace la cola de tareas.
+    """
+
+    key = models.CharField("Clave", max_length=160, unique=True)
+    topic = models.CharField("Tema", max_length=40)
+    resource_id = models.CharField("ID del recurso", max_length=64)
+    payload = models.JSONField("Datos recibidos", default=dict, blank=True)
+    status = models.CharField(
+        "Estado",
+        max_length=20,
+        choices=NotificationStatus.choices,
+        default=NotificationStatus.RECEIVED,
+    )
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="payment_notifications",
+        verbose_name="Pedido",
+    )
+    payment_status = models.CharField("Estado del pago", max_length=40, blank=True)
+    received_at = models.DateTimeField("Recibida el", auto_now_add=True)
+    processed_at = models.DateTimeField("Procesada el", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "Notificación de pago"
+        verbose_name_plural = "Notificaciones de pago"
+        ordering = ("-received_at",)
+
+    def __str__(self) -> str:
+        return f"{self.topic} {self.resource_id} ({self.get_status_display()})"
@@ -0,0 +1,117 @@
+"""Paginación por cursor (keyset) para listados que crecen sin límite."""
+
+from __future__ import annotations
+
+import datetime
+import json
+from dataclasses import dataclass, field
+from typing import Any, List, Optional, Sequence
+
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q, QuerySet
+
+SALT_CURSOR = "tienda_app.paginacion.cursor"
+
+
+@dataclass
+class PaginaCursor:
+    """
+    Resultado de una página: los objetos y el cursor para pedir la siguiente.
+    """
+
+    objetos: List[Any] = field(default_factory=list)
+    cursor_siguiente: Optional[str] = None
+
+    @property
+    def hay_mas(self) -> bool:
+        return self.cursor_siguiente is not None
+
+    def __iter__(self):
+        return iter(self.objetos)
+
+    def __len__(self) -> int:
+        return len(self.objetos)
+
+
+class _CodificadorCursor(DjangoJSONEncoder):
+    # DjangoJSONEncoder recorta las fechas a milisegundos: con esa precisión
+    # el cursor podría saltear filas creadas en el mismo milisegundo.
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class _SerializadorCursor:
+    """
+    Igual al serializador JSON de `django.core.signing`, pero acepta fechas y
+    decimales para poder paginar por esos campos.
+    """
+
+    def dumps(self, obj):
+        return _CodificadorCursor(separators=(",", ":")).encode(obj).encode("latin-1")
+
+    def loads(self, data):
+        return json.loads(data.decode("latin-1"))
+
+
+def codificar_cursor(valores: Sequence[Any]) -> str:
+    return signing.dumps(list(valores), salt=SALT_CURSOR, compress=True, serializer=_SerializadorCursor)
+
+
+def decodificar_cursor(cursor: Optional[str]) -> Optional[list]:
+    """
+    Devuelve los valores del cursor o None si falta o fue alterado.
+    """
+    if not cursor:
+        return None
+    try:
+        return signing.loads(cursor, salt=SALT_CURSOR, serializer=_SerializadorCursor)
+    except signing.BadSignature:
+        return None
+
+
+def _filtro_posterior(campos: Sequence[str], valores: Sequence[Any]) -> Q:
+    """
+    Arma la condición "fila posterior al cursor" para un orden por varios campos:
+    (a > x) OR (a = x AND b > y) OR ... Los campos con "-" usan "<".
+    """
+    nombres = [campo.lstrip("-") for campo in campos]
+    condicion = Q()
+    for indice, campo in enumerate(campos):
+        iguales = dict(zip(nombres[:indice], valores[:indice]))
+        operador = "lt" if campo.startswith("-") else "gt"
+        condicion |= Q(**iguales, **{f"{nombres[indice]}__{operador}": valores[indice]})
+    return condicion
+
+
+def paginar_por_cursor(
+    queryset: QuerySet,
+    cursor: Optional[str],
+    tamano: int,
+    campos: Sequence[str] = ("name", "pk"),
+) -> PaginaCursor:
+    """
+    Devuelve la página que sigue al cursor recibido, ordenando por `campos`
+    (con "-" para orden descendente). El último campo tiene que ser único,
+    normalmente la clave primaria, para que el orden sea estable.
+    """
+    queryset = queryset.order_by(*campos)
+    valores = decodificar_cursor(cursor)
+    if valores is not None and len(valores) == len(campos):
+        queryset = queryset.filter(_filtro_posterior(campos, valores))
+
+    objetos = list(queryset[: tamano + 1])
+    pagina = PaginaCursor(objetos=objetos[:tamano])
+    if len(objetos) > tamano:
+        ultimo = pagina.objetos[-1]
+        pagina.cursor_siguiente = codificar_cursor([_valor(ultimo, campo) for campo in campos])
+    return pagina
+
+
+def _valor(objeto: Any, campo: str) -> Any:
+    campo = campo.lstrip("-")
+    if isinstance(objeto, dict):
+        return objeto[campo]
+    return getattr(objeto, campo)
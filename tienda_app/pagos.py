@@ -0,0 +1,182 @@
+"""Avisos de Mercado Pago (webhook) y su efecto sobre el estado de los pedidos."""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Mapping, Optional
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import NotificationStatus, Order, OrderStatus, PaymentNotification
+
+TEMA_PAGO = "payment"
+
+ESTADOS_PENDIENTES = {"pending", "in_process", "authorized"}
+# Únicos estados que pueden sacar de "Completado" a un pedido: un aviso
+# atrasado de un intento rechazado no deshace un pago aprobado.
+ESTADOS_DEVUELTOS = {"refunded", "charged_back"}
+
+
+@dataclass(frozen=True)
+class Aviso:
+    clave: str
+    tema: str
+    recurso: str
+    datos: Dict[str, Any]
+    # Las IPN no traen ID de evento: su clave es la del pago y se repite en
+    # cada cambio de estado, no sólo en los reenvíos.
+    por_recurso: bool = False
+
+
+def estado_del_pedido(estado_pago: Optional[str]) -> str:
+    if estado_pago == "approved":
+        return OrderStatus.COMPLETED
+    if estado_pago in ESTADOS_PENDIENTES:
+        return OrderStatus.PENDING
+    return OrderStatus.CANCELLED
+
+
+def estado_de_los_pagos(pagos: List[Dict[str, Any]]) -> Optional[str]:
+    """
+    Estado que decide un pedido con varios intentos de pago: alcanza con uno
+    aprobado; si no, cualquiera en curso lo deja pendiente; si no, vale el
+    más reciente. None si todavía no hay ningún pago.
+    """
+    estados = [pago.get("status") for pago in pagos]
+    if "approved" in estados:
+        return "approved"
+    for estado in estados:
+        if estado in ESTADOS_PENDIENTES:
+            return estado
+    return estados[0] if estados else None
+
+
+def actualizar_pedido(pedido_id: int, estado_pago: Optional[str]) -> bool:
+    """
+    Lleva el pedido al estado que corresponde al pago con un UPDATE
+    condicional. Devuelve True si el estado cambió. No toca pedidos sin pago
+    iniciado ni los que el administrador ya pasó a preparación o envío,
+    salvo por una devolución.
+    """
+    nuevo = estado_del_pedido(estado_pago)
+    if estado_pago in ESTADOS_DEVUELTOS:
+        condicion = ~Q(status=OrderStatus.FAILED)
+    else:
+        condicion = Q(status__in=(OrderStatus.PENDING, OrderStatus.CANCELLED))
+    cambiados = (
+        Order.objects.filter(condicion, pk=pedido_id)
+        .exclude(status=nuevo)
+        .update(status=nuevo, updated_at=timezone.now())
+    )
+    return bool(cambiados)
+
+
+def leer_aviso(parametros: Mapping[str, str], cuerpo: bytes) -> Optional[Aviso]:
+    """
+    Interpreta tanto los webhooks (`{"type": "payment", "data": {"id": ...}}`)
+    como las IPN (`?topic=payment&id=...`). Devuelve None si no se reconoce
+    el tema o el recurso.
+    """
+    try:
+        datos = json.loads(cuerpo) if cuerpo else {}
+    except (UnicodeDecodeError, ValueError):
+        return None
+    if not isinstance(datos, dict):
+        return None
+
+    tema = datos.get("type") or datos.get("topic") or parametros.get("type") or parametros.get("topic")
+    data = datos.get("data")
+    recurso = (
+        (data.get("id") if isinstance(data, dict) else None)
+        or parametros.get("data.id")
+        or parametros.get("id")
+    )
+    if not tema or not recurso:
+        return None
+    tema, recurso = str(tema)[:40], str(recurso)[:64]
+
+    # Los webhooks traen un ID de evento que se repite en cada reenvío; las
+    # IPN no, así que se usa el recurso (ver `reabrir_aviso`).
+    evento = datos.get("id") if "data" in datos else None
+    clave = f"evento:{evento}" if evento else f"{tema}:{recurso}"
+    return Aviso(
+        clave=clave[:160], tema=tema, recurso=recurso, datos=datos, por_recurso=not evento
+    )
+
+
+def reabrir_aviso(aviso: Aviso) -> Optional[int]:
+    """
+    Una IPN con la clave de un aviso ya procesado puede traer otro estado del
+    mismo pago (por ejemplo, pendiente y después aprobado): la notificación
+    vuelve a quedar recibida para consultar el pago de nuevo. Si todavía está
+    en la cola, el aviso es un reenvío y no se hace nada. Devuelve el ID de la
+    notificación reabierta. Llamar dentro de una transacción.
+    """
+    if not aviso.por_recurso:
+        return None
+    anteriores = PaymentNotification.objects.filter(key=aviso.clave)
+    reabiertas = anteriores.exclude(status=NotificationStatus.RECEIVED).update(
+        status=NotificationStatus.RECEIVED,
+        payload=aviso.datos,
+        received_at=timezone.now(),
+        processed_at=None,
+    )
+    return anteriores.values_list("pk", flat=True).first() if reabiertas else None
+
+
+def firma_valida(encabezados: Mapping[str, str], aviso: Aviso) -> bool:
+    """
+    Verifica el encabezado `x-signature` si hay un secreto configurado
+    (`MERCADOPAGO_WEBHOOK_SECRET`). Sin secreto se aceptan todos los avisos:
+    de todas formas el estado se toma de la API, nunca del aviso.
+    """
+    secreto = getattr(settings, "MERCADOPAGO_WEBHOOK_SECRET", "") or ""
+    if not secreto:
+        return True
+    partes = dict(
+        parte.strip().split("=", 1)
+        for parte in encabezados.get("x-signature", "").split(",")
+        if "=" in parte
+    )
+    if "ts" not in partes or "v1" not in partes:
+        return False
+    manifiesto = (
+        f"id:{aviso.recurso.lower()};request-id:{encabezados.get('x-request-id', '')};ts:{partes['ts']};"
+    )
+    esperado = hmac.new(secreto.encode(), manifiesto.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(esperado, partes["v1"])
+
+
+def pedido_del_pago(pago: Dict[str, Any]) -> Optional[int]:
+    referencia = pago.get("external_reference") or (pago.get("metadata") or {}).get("order_id")
+    try:
+        return int(referencia)
+    except (TypeError, ValueError):
+        return None
+
+
+def aplicar_pago(notificacion: PaymentNotification, pago: Optional[Dict[str, Any]]) -> Optional[int]:
+    """
+    Registra el resultado de un aviso ya consultado en la API. Devuelve el ID
+    del pedido si su estado cambió. Llamar dentro de una transacción.
+    """
+    pedido_id = pedido_del_pago(pago) if pago else None
+    if pedido_id is not None and not Order.objects.filter(pk=pedido_id).exists():
+        pedido_id = None
+    estado_pago = (pago or {}).get("status") or ""
+    # Una IPN reabierta cuyo pago sigue igual ya está aplicada.
+    repetido = bool(notificacion.payment_status) and notificacion.payment_status == estado_pago
+    cambio = pedido_id is not None and not repetido and actualizar_pedido(pedido_id, estado_pago)
+
+    PaymentNotification.objects.filter(pk=notificacion.pk).update(
+        status=NotificationStatus.PROCESSED if pedido_id else NotificationStatus.IGNORED,
+        order_id=pedido_id,
+        payment_status=estado_pago[:40],
+        processed_at=timezone.now(),
+    )
+    return pedido_id if cambio else None
@@ -0,0 +1,176 @@
+"""Armado de pedidos y descuento de stock durante el checkout."""
+
+from __future__ import annotations
+
+from decimal import Decimal
+from typing import Dict, List, Optional
+
+from django.db import transaction
+from django.db.models import (
+    Case,
+    Count,
+    F,
+    OuterRef,
+    PositiveIntegerField,
+    Q,
+    QuerySet,
+    Subquery,
+    When,
+    Window,
+)
+from django.db.models.functions import Coalesce, RowNumber
+from django.utils import timezone
+
+from . import cache_paginas, reservas
+from .models import Order, OrderItem, OrderStatus, Product
+
+
+class StockInsuficienteError(Exception):
+    """No alcanza el stock (o el producto ya no está a la venta) para una línea del carrito."""
+
+    def __init__(self, nombre: str):
+        super().__init__(f"No hay stock suficiente de {nombre}.")
+        self.nombre = nombre
+
+
+def _stock_ajustado(cantidades: Dict[int, int], signo: int) -> Case:
+    """
+    Expresión para un UPDATE que suma (signo 1) o resta (signo -1) a cada
+    producto su cantidad, todo en una sola sentencia.
+    """
+    return Case(
+        *(When(pk=pk, then=F("stock") + signo * cantidad) for pk, cantidad in cantidades.items()),
+        default=F("stock"),
+        output_field=PositiveIntegerField(),
+    )
+
+
+def descontar_stock_y_crear_items(
+    pedido: Order, cantidades: Dict[int, int], titular: Optional[str] = None
+) -> List[OrderItem]:
+    """
+    Bloquea los productos del carrito en una sola consulta (ordenada por pk
+    para que dos compras simultáneas no se bloqueen mutuamente), descuenta el
+    stock con un único UPDATE condicional y crea todas las líneas juntas.
+    Las unidades reservadas por otros titulares no se pueden comprar; las de
+    `titular` se liberan al descontar. Si algún producto no alcanza, no se
+    descuenta nada.
+    """
+    with transaction.atomic():
+        productos = list(
+            Product.objects.select_for_update()
+            .filter(pk__in=cantidades, is_active=True)
+            .order_by("pk")
+            .only("pk", "name", "price", "stock")
+        )
+        encontrados = {producto.pk for producto in productos}
+        for pk in cantidades:
+            if pk not in encontrados:
+                raise StockInsuficienteError("un producto que ya no está disponible")
+        otros = reservas.reservado_por_otros(encontrados, titular)
+        for producto in productos:
+            if cantidades[producto.pk] > producto.stock - otros.get(producto.pk, 0):
+                raise StockInsuficienteError(producto.name)
+
+        # El UPDATE sólo toca las filas que todavía tienen stock suficiente: si
+        # otra compra se adelantó, cambian menos filas y se revierte todo.
+        alcanza = Q()
+        for pk, cantidad in cantidades.items():
+            alcanza |= Q(pk=pk, stock__gte=cantidad)
+        actualizados = Product.objects.filter(alcanza).update(
+            stock=_stock_ajustado(cantidades, -1),
+            # update() no pasa por auto_now; las tarjetas cacheadas dependen de esta fecha.
+            updated_at=timezone.now(),
+        )
+        if actualizados != len(cantidades):
+            raise StockInsuficienteError("uno de los productos")
+
+        items = OrderItem.objects.bulk_create(
+            [
+                OrderItem(
+                    order=pedido,
+                    product=producto,
+                    quantity=cantidades[producto.pk],
+                    price=producto.price,
+                )
+                for producto in productos
+            ]
+        )
+        # bulk_create no dispara las señales de OrderItem: los totales se
+        # calculan acá, con los precios ya leídos.
+        pedido.total_items = sum(item.quantity for item in items)
+        pedido.total_amount = sum((item.subtotal for item in items), Decimal("0.00"))
+        Order.objects.filter(pk=pedido.pk).update(
+            total_items=pedido.total_items, total_amount=pedido.total_amount
+        )
+        # Lo reservado ya es stock descontado.
+        reservas.liberar(titular, cantidades)
+    # Las páginas cacheadas muestran el stock: se descartan al confirmar.
+    transaction.on_commit(cache_paginas.invalidar)
+    return items
+
+
+def liberar_pedido_sin_pago(pedido: Order) -> bool:
+    """
+    Compensa un pedido cuyo pago no se pudo iniciar: lo marca como fallido y
+    devuelve el stock de sus líneas. Sólo actúa sobre pedidos pendientes, así
+    que llamarla dos veces no devuelve el stock dos veces.
+    """
+    with transaction.atomic():
+        marcado = Order.objects.filter(pk=pedido.pk, status=OrderStatus.PENDING).update(
+            status=OrderStatus.FAILED, updated_at=timezone.now()
+        )
+        if not marcado:
+            return False
+        cantidades: Dict[int, int] = {}
+        for producto_id, cantidad in OrderItem.objects.filter(order=pedido).values_list(
+            "product_id", "quantity"
+        ):
+            cantidades[producto_id] = cantidades.get(producto_id, 0) + cantidad
+        if cantidades:
+            Product.objects.filter(pk__in=cantidades).update(
+                stock=_stock_ajustado(cantidades, 1), updated_at=timezone.now()
+            )
+    pedido.status = OrderStatus.FAILED
+    transaction.on_commit(cache_paginas.invalidar)
+    return True
+
+
+def con_cantidad_de_lineas(pedidos: QuerySet) -> QuerySet:
+    """
+    Anota `cantidad_lineas` con una subconsulta por pedido en lugar de un
+    JOIN con GROUP BY: así sólo se cuentan las líneas de los pedidos de la
+    página, no las de todo el historial.
+    """
+    lineas = (
+        OrderItem.objects.filter(order=OuterRef("pk"))
+        .order_by()
+        .values("order")
+        .annotate(cantidad=Count("pk"))
+        .values("cantidad")
+    )
+    return pedidos.annotate(cantidad_lineas=Coalesce(Subquery(lineas), 0))
+
+
+def primeros_items(pedidos: List[Order], limite: int) -> None:
+    """
+    Carga en cada pedido sus primeras `limite` líneas (`pedido.primeros_items`)
+    con una sola consulta para toda la página, numerando las líneas de cada
+    pedido con una función de ventana. `pedido.items_restantes` queda con las
+    que no se muestran; requiere la anotación `cantidad_lineas`.
+    """
+    por_pedido: Dict[int, List[OrderItem]] = {pedido.pk: [] for pedido in pedidos}
+    if por_pedido:
+        items = (
+            OrderItem.objects.filter(order_id__in=por_pedido)
+            .annotate(posicion=Window(RowNumber(), partition_by=F("order_id"), order_by=F("pk").asc()))
+            .filter(posicion__lte=limite)
+            .select_related("product")
+            .only("order_id", "quantity", "product__name")
+            .order_by("order_id", "posicion")
+        )
+        for item in items:
+            por_pedido[item.order_id].append(item)
+    for pedido in pedidos:
+        pedido.primeros_items = por_pedido[pedido.pk]
+        pedido.items_restantes = max(pedido.cantidad_lineas - len(pedido.primeros_items), 0)
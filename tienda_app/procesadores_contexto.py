@@ -2,17 +2,20 @@ from __future__ import annotations
 
 from typing import Any, Dict
 
+from django.utils.functional import SimpleLazyObject
+
+from . import carrito as carrito_de_compras
+
 
 def carrito(request) -> Dict[str, Any]:
     """
-    Expone en todas las plantillas los datos principales del carrito
-    almacenado en la sesión.
+    Expone en todas las plantillas los datos principales del carrito. Son
+    perezosos: la sesión sólo se lee si la plantilla los usa, así las páginas
+    que no muestran el carrito (el admin, por ejemplo) no pagan la consulta.
     """
-    carrito = request.session.get("carrito", {})
-    cantidad_total = sum(item.get("cantidad", 0) for item in carrito.values())
-    monto_total = sum(item.get("cantidad", 0) * item.get("precio", 0) for item in carrito.values())
+    resumen = SimpleLazyObject(lambda: carrito_de_compras.obtener(request).resumen())
     return {
-        "carrito_cantidad_total": cantidad_total,
-        "carrito_monto_total": monto_total,
+        "carrito_resumen": resumen,
+        "carrito_cantidad_total": SimpleLazyObject(lambda: resumen.unidades),
+        "carrito_monto_total": SimpleLazyObject(lambda: resumen.monto),
     }
-
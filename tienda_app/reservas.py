@@ -0,0 +1,162 @@
+"""Reservas temporales de stock: el carrito aparta las unidades hasta el checkout."""
+
+from __future__ import annotations
+
+import uuid
+from datetime import timedelta
+from typing import Dict, Iterable, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.http import HttpRequest
+from django.utils import timezone
+
+from .models import Product, StockReservation
+
+# Token del visitante en la sesión: sobrevive al cambio de clave al ingresar.
+CLAVE_TITULAR = "reservas_titular"
+
+TAMANO_LOTE_BARRIDO = 1000
+
+
+def titular_de_usuario(usuario) -> str:
+    return f"usuario:{usuario.pk}"
+
+
+def titular(request: HttpRequest, crear: bool = True) -> Optional[str]:
+    """
+    Quién reserva: el usuario, o un token guardado en la sesión del visitante
+    (creado la primera vez que reserva si `crear`).
+    """
+    if request.user.is_authenticated:
+        return titular_de_usuario(request.user)
+    token = request.session.get(CLAVE_TITULAR)
+    if token is None and crear:
+        token = f"visitante:{uuid.uuid4().hex}"
+        request.session[CLAVE_TITULAR] = token
+    return token
+
+
+def reservado_por_otros(producto_ids: Iterable[int], titular: Optional[str]) -> Dict[int, int]:
+    """
+    Unidades con reserva vigente de otros titulares, por producto. Una sola
+    consulta que se resuelve con reserva_producto_vence_idx.
+    """
+    vigentes = StockReservation.objects.filter(product_id__in=list(producto_ids), expires_at__gt=timezone.now())
+    if titular:
+        vigentes = vigentes.exclude(owner=titular)
+    return dict(
+        vigentes.order_by().values("product_id").annotate(total=Sum("quantity")).values_list("product_id", "total")
+    )
+
+
+def disponibles(productos: Iterable[Product], titular: Optional[str]) -> Dict[int, int]:
+    """
+    Stock que puede llevarse `titular` de cada producto: el stock menos lo
+    que reservaron los demás.
+    """
+    productos = list(productos)
+    otros = reservado_por_otros([producto.pk for producto in productos], titular)
+    return {producto.pk: max(0, producto.stock - otros.get(producto.pk, 0)) for producto in productos}
+
+
+def reservar(titular: str, cantidades: Dict[int, int], minutos: Optional[int] = None) -> None:
+    """
+    Deja reservadas exactamente esas cantidades (0 quita la reserva) y renueva
+    el vencimiento. Una sentencia para las altas y cambios y otra para las bajas.
+    """
+    if minutos is None:
+        minutos = getattr(settings, "RESERVAS_MINUTOS_CARRITO", 15)
+    vence = timezone.now() + timedelta(minutes=minutos)
+    quitar = [pk for pk, cantidad in cantidades.items() if cantidad <= 0]
+    if quitar:
+        liberar(titular, quitar)
+    StockReservation.objects.bulk_create(
+        [
+            StockReservation(owner=titular, product_id=pk, quantity=cantidad, expires_at=vence)
+            for pk, cantidad in sorted(cantidades.items())
+            if cantidad > 0
+        ],
+        update_conflicts=True,
+        unique_fields=("owner", "product"),
+        update_fields=("quantity", "expires_at", "updated_at"),
+    )
+
+
+def maximo_del_titular(request: HttpRequest) -> Optional[int]:
+    """
+    Unidades que puede tener reservadas a la vez quien hace el pedido: los
+    visitantes tienen un tope (`RESERVAS_MAXIMO_VISITANTE`), para que un
+    carrito anónimo no aparte todo el stock; los clientes, no.
+    """
+    if request.user.is_authenticated:
+        return None
+    return getattr(settings, "RESERVAS_MAXIMO_VISITANTE", 3)
+
+
+def reservar_si_alcanza(
+    titular: str,
+    producto_id: int,
+    cantidad: int,
+    minutos: Optional[int] = None,
+    maximo: Optional[int] = None,
+) -> int:
+    """
+    Reserva `cantidad` unidades del producto sólo si alcanzan y devuelve
+    cuántas tenía disponibles `titular`. La reserva se escribe antes de contar
+    las de los demás: en SQLite esa escritura toma el bloqueo de la base (en
+    otras bases lo hace el select_for_update del producto), así que dos
+    compradores no se llevan la misma última unidad. Si no alcanza, se deshace.
+    Con `maximo`, sólo se reserva hasta ese total de unidades del titular,
+    aunque se controla la cantidad completa. La cantidad tiene que venir ya
+    acotada al stock.
+    """
+    reservada = cantidad
+    if maximo is not None:
+        # Se lee antes de abrir la transacción: en SQLite, leer primero y
+        # escribir después puede fallar en lugar de esperar el bloqueo.
+        otras = (
+            StockReservation.objects.filter(owner=titular, expires_at__gt=timezone.now())
+            .exclude(product_id=producto_id)
+            .aggregate(total=Sum("quantity"))["total"]
+        ) or 0
+        reservada = max(0, min(cantidad, maximo - otras))
+    with transaction.atomic():
+        reservar(titular, {producto_id: reservada}, minutos)
+        stock = (
+            Product.objects.select_for_update().filter(pk=producto_id).values_list("stock", flat=True).first()
+        ) or 0
+        disponible = max(0, stock - reservado_por_otros([producto_id], titular).get(producto_id, 0))
+        if cantidad > disponible:
+            transaction.set_rollback(True)
+    return disponible
+
+
+def liberar(titular: Optional[str], producto_ids: Optional[Iterable[int]] = None) -> int:
+    """
+    Borra las reservas de `titular` (de esos productos o de todos).
+    """
+    if not titular:
+        return 0
+    reservas = StockReservation.objects.filter(owner=titular)
+    if producto_ids is not None:
+        reservas = reservas.filter(product_id__in=list(producto_ids))
+    return reservas.delete()[0]
+
+
+def liberar_vencidas(lote: int = TAMANO_LOTE_BARRIDO) -> int:
+    """
+    Borra las reservas vencidas por lotes, para no tomar la base por mucho
+    tiempo. Las vencidas ya no cuentan; esto sólo mantiene chica la tabla.
+    """
+    total = 0
+    while True:
+        ids = list(
+            StockReservation.objects.filter(expires_at__lte=timezone.now())
+            .order_by("expires_at")
+            .values_list("pk", flat=True)[:lote]
+        )
+        if not ids:
+            return total
+        total += StockReservation.objects.filter(pk__in=ids).delete()[0]
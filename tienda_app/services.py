@@ -1,14 +1,21 @@
 from __future__ import annotations
 
 import logging
-from typing import Any, Dict, Optional
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
 from urllib.parse import urlparse
 
 import mercadopago
 import requests
 from django.conf import settings
 from django.urls import reverse
+from mercadopago.config import RequestOptions
+from mercadopago.http import HttpClient
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
 
+from . import circuito
 from .models import Order
 
 logger = logging.getLogger(__name__)
@@ -18,11 +25,159 @@ class MercadoPagoError(Exception):
     """Errores de integración con Mercado Pago."""
 
 
+class MercadoPagoNoDisponibleError(MercadoPagoError):
+    """Mercado Pago no responde o el circuito está abierto: no tiene sentido reintentar ya."""
+
+
+class TelegramError(Exception):
+    """No se pudo entregar una notificación a Telegram."""
+
+
+TITULO_PEDIDO_NUEVO = "NUEVO PEDIDO"
+TITULO_PAGO_ACTUALIZADO = "PAGO ACTUALIZADO"
+
+
+# --- Clientes HTTP ------------------------------------------------------------------
+#
+# Una sesión de requests por servicio y por proceso: las conexiones (TCP + TLS)
+# quedan abiertas y se reutilizan entre requests en lugar de negociarse cada vez.
+
+ESTADOS_REINTENTABLES = (429, 500, 502, 503, 504)
+
+_sesiones: Dict[str, requests.Session] = {}
+_bloqueo_sesiones = threading.Lock()
+
+
+def _olvidar_sesiones() -> None:
+    """
+    Después de un fork (gunicorn con --preload) el hijo no debe compartir los
+    sockets del padre: descarta las sesiones sin cerrarlas y arma las suyas.
+    """
+    global _bloqueo_sesiones
+    _bloqueo_sesiones = threading.Lock()
+    _sesiones.clear()
+
+
+os.register_at_fork(after_in_child=_olvidar_sesiones)
+
+
+def timeouts_http() -> Tuple[float, float]:
+    return (
+        getattr(settings, "HTTP_TIMEOUT_CONEXION", 3.05),
+        getattr(settings, "HTTP_TIMEOUT_LECTURA", 10.0),
+    )
+
+
+def _nueva_sesion() -> requests.Session:
+    # Sólo se reintentan los GET (idempotentes); los POST que fallan a
+    # mitad de camino no se repiten para no duplicar preferencias ni mensajes.
+    reintentos = Retry(
+        total=getattr(settings, "HTTP_REINTENTOS_GET", 2),
+        allowed_methods=frozenset({"GET"}),
+        status_forcelist=ESTADOS_REINTENTABLES,
+        backoff_factor=0.2,
+        backoff_jitter=0.2,
+        raise_on_status=False,
+    )
+    adaptador = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=getattr(settings, "HTTP_TAMANO_POOL", 10),
+        max_retries=reintentos,
+    )
+    sesion = requests.Session()
+    sesion.mount("https://", adaptador)
+    sesion.mount("http://", adaptador)
+    return sesion
+
+
+def sesion_http(servicio: str) -> requests.Session:
+    """
+    Sesión compartida del proceso para un servicio externo ("mercadopago",
+    "telegram"). Las sesiones de requests se pueden usar desde varios hilos.
+    """
+    sesion = _sesiones.get(servicio)
+    if sesion is None:
+        with _bloqueo_sesiones:
+            sesion = _sesiones.get(servicio)
+            if sesion is None:
+                sesion = _sesiones[servicio] = _nueva_sesion()
+    return sesion
+
+
+class ClienteHttpMercadoPago(HttpClient):
+    """
+    Cliente HTTP para el SDK de Mercado Pago. El del SDK crea una sesión
+    nueva por llamada (y con 60 s de timeout); éste usa la sesión compartida.
+    """
+
+    URL_API = "https://api.mercadopago.com"
+
+    def request(self, method, url, maxretries=None, **kwargs):
+        # El SDK tiene la URL de la API fija; MERCADOPAGO_API_URL permite
+        # apuntarlo a un servidor de prueba (ver mercadopago_falso).
+        otra_url = getattr(settings, "MERCADOPAGO_API_URL", "")
+        if otra_url and url.startswith(self.URL_API):
+            url = otra_url.rstrip("/") + url[len(self.URL_API) :]
+        # El SDK pasa como `timeout` el presupuesto de lectura de cada llamada.
+        conexion, lectura = timeouts_http()
+        kwargs["timeout"] = (conexion, kwargs.get("timeout") or lectura)
+        respuesta = sesion_http("mercadopago").request(method, url, **kwargs)
+        datos = None
+        if respuesta.status_code != 204 and respuesta.content:
+            try:
+                datos = respuesta.json()
+            except ValueError:
+                logger.warning("Mercado Pago devolvió una respuesta que no es JSON (%s)", url)
+        return {"status": respuesta.status_code, "response": datos}
+
+
+_cliente_mercadopago = ClienteHttpMercadoPago()
+
+
 def _get_sdk() -> mercadopago.SDK:
     access_token = getattr(settings, "MERCADOPAGO_ACCESS_TOKEN", "")
     if not access_token:
         raise MercadoPagoError("No hay un Access Token configurado para Mercado Pago.")
-    return mercadopago.SDK(access_token)
+    return mercadopago.SDK(access_token, http_client=_cliente_mercadopago)
+
+
+# Un circuito por endpoint: si falla la consulta de pagos se puede seguir
+# cobrando, y al revés.
+CIRCUITO_PREFERENCIA = circuito.circuito("mercadopago.preferencia")
+CIRCUITO_PAGO = circuito.circuito("mercadopago.pago")
+
+
+def _presupuesto(nombre: str, por_defecto: float) -> RequestOptions:
+    return RequestOptions(connection_timeout=float(getattr(settings, nombre, por_defecto)))
+
+
+def _llamar_mercadopago(circuito_endpoint: circuito.Circuito, llamada) -> Dict[str, Any]:
+    """
+    Ejecuta una llamada del SDK a través del circuito. Los errores de red y
+    las respuestas 429/5xx cuentan como fallos del servicio; un 4xx no.
+    """
+    if not circuito_endpoint.permitir():
+        raise MercadoPagoNoDisponibleError("Mercado Pago no está disponible en este momento.")
+    try:
+        response = llamada()
+    except requests.RequestException as error:
+        circuito_endpoint.fallo()
+        raise MercadoPagoNoDisponibleError(f"No se pudo contactar a Mercado Pago: {error}") from error
+    if response.get("status") in ESTADOS_REINTENTABLES:
+        circuito_endpoint.fallo()
+        raise MercadoPagoNoDisponibleError(
+            f"Mercado Pago respondió con el estado {response.get('status')}."
+        )
+    circuito_endpoint.exito()
+    return response
+
+
+def mercadopago_disponible() -> bool:
+    """
+    False si el circuito para crear preferencias está abierto: el checkout
+    avisa antes de reservar stock.
+    """
+    return CIRCUITO_PREFERENCIA.estado() != circuito.ABIERTO
 
 
 def _build_callback_url(request) -> str:
@@ -80,7 +235,10 @@ def crear_preferencia_para_pedido(pedido: Order, request) -> Dict[str, Any]:
     notification_url = getattr(settings, "MERCADOPAGO_NOTIFICATION_URL", "")
     if notification_url:
         preference_data["notification_url"] = notification_url
-    response = sdk.preference().create(preference_data)
+    opciones = _presupuesto("MERCADOPAGO_PRESUPUESTO_PREFERENCIA", 8.0)
+    response = _llamar_mercadopago(
+        CIRCUITO_PREFERENCIA, lambda: sdk.preference().create(preference_data, opciones)
+    )
     if response.get("status") not in (200, 201):
         details = response.get("response") or {}
         raise MercadoPagoError(
@@ -98,16 +256,32 @@ def obtener_pago(payment_id: Optional[str]) -> Optional[Dict[str, Any]]:
         return None
 
     sdk = _get_sdk()
-    response = sdk.payment().get(payment_id)
+    opciones = _presupuesto("MERCADOPAGO_PRESUPUESTO_PAGO", 3.0)
+    response = _llamar_mercadopago(CIRCUITO_PAGO, lambda: sdk.payment().get(payment_id, opciones))
     if response.get("status") != 200:
         raise MercadoPagoError("No se pudo consultar el pago en Mercado Pago.")
     return response["response"]
 
 
-def enviar_notificacion_telegram(pedido: Order) -> bool:
+def buscar_pagos_del_pedido(pedido_id: int) -> List[Dict[str, Any]]:
+    """
+    Pagos que Mercado Pago tiene registrados para un pedido (por
+    `external_reference`), del más reciente al más viejo.
+    """
+    sdk = _get_sdk()
+    filtros = {"external_reference": str(pedido_id), "sort": "date_created", "criteria": "desc"}
+    opciones = _presupuesto("MERCADOPAGO_PRESUPUESTO_PAGO", 3.0)
+    response = _llamar_mercadopago(CIRCUITO_PAGO, lambda: sdk.payment().search(filtros, opciones))
+    if response.get("status") != 200:
+        raise MercadoPagoError("No se pudieron buscar los pagos del pedido en Mercado Pago.")
+    return (response.get("response") or {}).get("results") or []
+
+
+def enviar_notificacion_telegram(pedido: Order, titulo: str = TITULO_PEDIDO_NUEVO) -> bool:
     """
     Envía una notificación a Telegram con los datos del pedido y comprador.
-    Retorna True si se envió exitosamente, False en caso contrario.
+    Retorna False si Telegram no está configurado y lanza TelegramError si el
+    envío falla, para que la cola de tareas lo reintente.
     """
     token = getattr(settings, "TELEGRAM_BOT_TOKEN", "")
     chat_id = getattr(settings, "TELEGRAM_CHAT_ID", "")
@@ -122,7 +296,7 @@ def enviar_notificacion_telegram(pedido: Order) -> bool:
         perfil = getattr(usuario, "profile", None)
 
         # Construir mensaje
-        mensaje = f"🛒 *NUEVO PEDIDO* 🛒\n\n"
+        mensaje = f"🛒 *{titulo}* 🛒\n\n"
         mensaje += f"📦 *Pedido #{pedido.pk}*\n"
         mensaje += f"📅 Fecha: {pedido.created_at.strftime('%d/%m/%Y %H:%M')}\n"
         mensaje += f"📊 Estado: {pedido.get_status_display()}\n\n"
@@ -165,15 +339,12 @@ def enviar_notificacion_telegram(pedido: Order) -> bool:
             "parse_mode": "Markdown",
         }
 
-        response = requests.post(url, json=payload, timeout=10)
+        response = sesion_http("telegram").post(url, json=payload, timeout=timeouts_http())
         response.raise_for_status()
         logger.info(f"Notificación de Telegram enviada para pedido #{pedido.pk}")
         return True
 
     except requests.RequestException as e:
         logger.error(f"Error al enviar notificación a Telegram: {e}", exc_info=True)
-        return False
-    except Exception as e:
-        logger.error(f"Error inesperado al notificar a Telegram: {e}", exc_info=True)
-        return False
+        raise TelegramError(str(e)) from e
 
@@ -0,0 +1,41 @@
+"""
+Motores de sesión de Django con escritura agrupada: la sesión sólo se guarda
+si su contenido cambió. Cada módulo envuelve un motor de Django y se elige
+con `SESSION_ENGINE` (por ejemplo `tienda_app.sesiones.db`).
+"""
+
+from __future__ import annotations
+
+import copy
+
+from tienda_app import metricas
+
+
+class EscrituraAgrupada:
+    """
+    Recuerda el contenido leído del almacenamiento y, al guardar, no escribe
+    si no cambió. Django marca la sesión como modificada con cualquier
+    asignación (por ejemplo, el carrito con las mismas cantidades o un
+    mensaje que se lee en el mismo pedido) y sin esto cada una es un
+    UPDATE de `django_session`.
+    """
+
+    _guardado = None
+
+    def load(self):
+        datos = super().load()
+        self._guardado = copy.deepcopy(datos) if self.session_key else None
+        return datos
+
+    def save(self, must_create=False):
+        if (
+            not must_create
+            and self._guardado is not None
+            and self.session_key
+            and self._get_session() == self._guardado
+        ):
+            metricas.incrementar("sesiones.escrituras_evitadas")
+            return
+        super().save(must_create=must_create)
+        metricas.incrementar("sesiones.escrituras")
+        self._guardado = copy.deepcopy(self._get_session())
@@ -0,0 +1,7 @@
+from django.contrib.sessions.backends import cache
+
+from . import EscrituraAgrupada
+
+
+class SessionStore(EscrituraAgrupada, cache.SessionStore):
+    pass
@@ -0,0 +1,7 @@
+from django.contrib.sessions.backends import cached_db
+
+from . import EscrituraAgrupada
+
+
+class SessionStore(EscrituraAgrupada, cached_db.SessionStore):
+    pass
@@ -0,0 +1,7 @@
+from django.contrib.sessions.backends import db
+
+from . import EscrituraAgrupada
+
+
+class SessionStore(EscrituraAgrupada, db.SessionStore):
+    pass
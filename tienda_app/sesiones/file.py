@@ -0,0 +1,7 @@
+from django.contrib.sessions.backends import file
+
+from . import EscrituraAgrupada
+
+
+class SessionStore(EscrituraAgrupada, file.SessionStore):
+    pass
@@ -1,10 +1,22 @@
 from __future__ import annotations
 
 from django.contrib.auth import get_user_model
-from django.db.models.signals import post_save
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
+from django.utils import timezone
 
-from .models import CustomerProfile
+from . import autocompletar, busqueda, cache_paginas, cache_tarjetas, carrito, facetas
+from .models import (
+    CatalogFacet,
+    Category,
+    CustomerProfile,
+    FacetKind,
+    Order,
+    OrderItem,
+    Product,
+    totales_desde_items,
+)
 
 User = get_user_model()
 
@@ -18,3 +30,139 @@ def crear_perfil_para_usuario(sender, instance, created, **kwargs):
     if created and not instance.is_staff:
         CustomerProfile.objects.create(user=instance, full_name=instance.get_full_name())
 
+
+@receiver(user_logged_in)
+def fusionar_carrito(sender, request, user, **kwargs):
+    """
+    Lo agregado al carrito antes de ingresar se suma al carrito guardado.
+    """
+    if request is not None and hasattr(request, "session"):
+        carrito.fusionar_al_ingresar(request, user)
+
+
+@receiver(post_save, sender=Product)
+def indexar_producto(sender, instance, **kwargs):
+    """
+    Mantiene el índice de búsqueda sincronizado con el producto guardado.
+    """
+    busqueda.indexar_productos([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def desindexar_producto(sender, instance, **kwargs):
+    busqueda.desindexar_productos([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def reindexar_categoria(sender, instance, created, **kwargs):
+    """
+    El nombre de la categoría forma parte del índice: al editarla se
+    reindexan sus productos.
+    """
+    if not created:
+        busqueda.indexar_categoria(instance.pk)
+
+
+@receiver(pre_save, sender=Product)
+def recordar_estado_faceta(sender, instance, **kwargs):
+    """
+    Guarda el estado previo del producto para ajustar los conteos por diferencia.
+    """
+    anterior = None
+    if instance.pk:
+        fila = (
+            Product.objects.filter(pk=instance.pk)
+            .values_list("category_id", "price", "is_active")
+            .first()
+        )
+        if fila:
+            anterior = facetas.estado_de_producto(*fila)
+    instance._faceta_anterior = anterior
+
+
+@receiver(post_save, sender=Product)
+def actualizar_facetas_producto(sender, instance, **kwargs):
+    facetas.aplicar_cambio(
+        getattr(instance, "_faceta_anterior", None),
+        facetas.estado_de_producto(instance.category_id, instance.price, instance.is_active),
+    )
+
+
+@receiver(post_delete, sender=Product)
+def descontar_facetas_producto(sender, instance, **kwargs):
+    facetas.aplicar_cambio(
+        facetas.estado_de_producto(instance.category_id, instance.price, instance.is_active),
+        None,
+    )
+
+
+@receiver(post_delete, sender=Category)
+def eliminar_faceta_categoria(sender, instance, **kwargs):
+    CatalogFacet.objects.filter(kind=FacetKind.CATEGORY, key=str(instance.pk)).delete()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidar_tarjeta_producto(sender, instance, **kwargs):
+    cache_tarjetas.invalidar_productos([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def invalidar_tarjetas_categoria(sender, instance, created, **kwargs):
+    """
+    Las tarjetas muestran datos de la categoría: al editarla se descartan las
+    de todos sus productos.
+    """
+    if not created:
+        cache_tarjetas.invalidar_productos(instance.products.values_list("pk", flat=True))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidar_paginas_catalogo(sender, **kwargs):
+    """
+    Cualquier cambio del catálogo descarta las páginas cacheadas para anónimos.
+    """
+    cache_paginas.invalidar()
+
+
+@receiver(post_delete, sender=Product)
+def marcar_categoria_modificada(sender, instance, **kwargs):
+    """
+    Un borrado no cambia el máximo de updated_at de los productos: se actualiza
+    la categoría para que el ETag del catálogo cambie igual.
+    """
+    Category.objects.filter(pk=instance.category_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Product)
+def actualizar_autocompletar_producto(sender, instance, **kwargs):
+    autocompletar.actualizar_producto(instance.pk, instance.name, instance.slug, instance.is_active)
+
+
+@receiver(post_delete, sender=Product)
+def quitar_autocompletar_producto(sender, instance, **kwargs):
+    autocompletar.quitar_producto(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def actualizar_autocompletar_categoria(sender, instance, **kwargs):
+    autocompletar.actualizar_categoria(instance.pk, instance.name, instance.slug)
+
+
+@receiver(post_delete, sender=Category)
+def quitar_autocompletar_categoria(sender, instance, **kwargs):
+    autocompletar.quitar_categoria(instance.pk)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def actualizar_totales_del_pedido(sender, instance, **kwargs):
+    """
+    Mantiene los totales guardados en el pedido cuando se edita una línea
+    (por ejemplo, desde el admin). El checkout crea las líneas con
+    bulk_create y calcula los totales por su cuenta.
+    """
+    Order.objects.filter(pk=instance.order_id).update(**totales_desde_items())
@@ -0,0 +1,202 @@
+"""Cola de tareas en base de datos (outbox) para los efectos secundarios lentos."""
+
+from __future__ import annotations
+
+import logging
+import random
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import Any, Callable, Dict, List
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import metricas, pagos, services
+from .models import BackgroundJob, JobStatus, NotificationStatus, Order, PaymentNotification
+
+logger = logging.getLogger(__name__)
+
+# Tiempo que puede quedar "en ejecución" una tarea antes de suponer que su
+# worker murió y devolverla a la cola.
+TIEMPO_MAXIMO_EJECUCION = timedelta(minutes=10)
+
+
+@dataclass(frozen=True)
+class TipoTarea:
+    nombre: str
+    funcion: Callable[..., Any]
+    concurrencia: int
+    reintentos: int
+    espera_base: float
+
+
+_tipos: Dict[str, TipoTarea] = {}
+
+
+def tarea(nombre: str, concurrencia: int = 4, reintentos: int = 5, espera_base: float = 10.0):
+    """
+    Registra una función como tipo de tarea. `concurrencia` limita cuántas del
+    mismo tipo ejecuta a la vez cada worker; `reintentos` es el total de
+    intentos antes de darla por fallida, con espera exponencial desde
+    `espera_base` segundos.
+    """
+
+    def registrar(funcion):
+        _tipos[nombre] = TipoTarea(nombre, funcion, concurrencia, reintentos, espera_base)
+        return funcion
+
+    return registrar
+
+
+def tipos_registrados() -> Dict[str, TipoTarea]:
+    return dict(_tipos)
+
+
+def _modo_sincronico() -> bool:
+    return getattr(settings, "TAREAS_SINCRONICAS", False)
+
+
+def encolar(nombre: str, **datos: Any) -> BackgroundJob:
+    """
+    Guarda la tarea en la transacción actual: si el cambio que la origina se
+    revierte, la tarea tampoco existe. En modo sincrónico (tests) se ejecuta
+    en el mismo proceso al confirmarse la transacción.
+    """
+    tipo = _tipos[nombre]
+    trabajo = BackgroundJob.objects.create(kind=nombre, payload=datos, max_attempts=tipo.reintentos)
+    metricas.incrementar(f"tareas.{nombre}.encoladas")
+    if _modo_sincronico():
+        transaction.on_commit(lambda: ejecutar_pendiente(trabajo.pk))
+    return trabajo
+
+
+def espera_para_reintento(tipo: TipoTarea, intentos: int) -> timedelta:
+    """
+    Espera exponencial con jitter (10 s, 20 s, 40 s, ... hasta una hora) para
+    no reintentar todas a la vez contra un servicio que se está recuperando.
+    """
+    segundos = min(tipo.espera_base * 2 ** max(intentos - 1, 0), 3600)
+    return timedelta(seconds=segundos * random.uniform(0.5, 1.0))
+
+
+def tomar(trabajo_id: int) -> bool:
+    """
+    Marca la tarea como en ejecución si sigue pendiente. El UPDATE condicional
+    garantiza que dos workers no tomen la misma tarea.
+    """
+    return bool(
+        BackgroundJob.objects.filter(pk=trabajo_id, status=JobStatus.PENDING).update(
+            status=JobStatus.RUNNING,
+            locked_at=timezone.now(),
+            attempts=F("attempts") + 1,
+            updated_at=timezone.now(),
+        )
+    )
+
+
+def ejecutar(trabajo_id: int) -> None:
+    """
+    Ejecuta una tarea ya tomada y registra el resultado: terminada, de vuelta
+    en la cola con una espera, o fallida si se agotaron los intentos.
+    """
+    trabajo = BackgroundJob.objects.get(pk=trabajo_id)
+    tipo = _tipos.get(trabajo.kind)
+    try:
+        if tipo is None:
+            raise LookupError(f"No hay una tarea registrada con el nombre {trabajo.kind!r}.")
+        tipo.funcion(**trabajo.payload)
+    except Exception as error:
+        logger.warning("Falló la tarea %s (intento %s): %s", trabajo, trabajo.attempts, error)
+        cambios = {"last_error": f"{type(error).__name__}: {error}", "locked_at": None}
+        if tipo is not None and trabajo.attempts < trabajo.max_attempts:
+            cambios.update(
+                status=JobStatus.PENDING,
+                run_after=timezone.now() + espera_para_reintento(tipo, trabajo.attempts),
+            )
+            metricas.incrementar(f"tareas.{trabajo.kind}.reintentos")
+        else:
+            cambios["status"] = JobStatus.DEAD
+            metricas.incrementar(f"tareas.{trabajo.kind}.fallidas")
+            logger.error("La tarea %s quedó fallida: %s", trabajo, error)
+    else:
+        cambios = {"status": JobStatus.DONE, "locked_at": None, "last_error": ""}
+        metricas.incrementar(f"tareas.{trabajo.kind}.terminadas")
+    BackgroundJob.objects.filter(pk=trabajo.pk).update(updated_at=timezone.now(), **cambios)
+
+
+def ejecutar_pendiente(trabajo_id: int) -> bool:
+    """
+    Toma y ejecuta una tarea concreta en el proceso actual (modo sincrónico).
+    """
+    if not tomar(trabajo_id):
+        return False
+    ejecutar(trabajo_id)
+    return True
+
+
+def vencidas(tipos: List[str], limite: int) -> List[int]:
+    """
+    IDs de las tareas pendientes que ya se pueden ejecutar, las más viejas primero.
+    """
+    if not tipos or limite <= 0:
+        return []
+    return list(
+        BackgroundJob.objects.filter(
+            status=JobStatus.PENDING, run_after__lte=timezone.now(), kind__in=tipos
+        )
+        .order_by("run_after", "pk")
+        .values_list("pk", flat=True)[:limite]
+    )
+
+
+def recuperar_abandonadas() -> int:
+    """
+    Devuelve a la cola las tareas que quedaron en ejecución más tiempo del
+    permitido (el worker que las tomó se cayó o se reinició).
+    """
+    limite = timezone.now() - TIEMPO_MAXIMO_EJECUCION
+    return BackgroundJob.objects.filter(status=JobStatus.RUNNING, locked_at__lt=limite).update(
+        status=JobStatus.PENDING, locked_at=None, run_after=timezone.now()
+    )
+
+
+def reintentar(trabajos) -> int:
+    """
+    Vuelve a poner en la cola tareas fallidas, con los intentos en cero.
+    """
+    return trabajos.filter(status=JobStatus.DEAD).update(
+        status=JobStatus.PENDING, attempts=0, run_after=timezone.now(), last_error=""
+    )
+
+
+# --- Tareas de la tienda -------------------------------------------------------------
+
+
+@tarea("telegram.notificar_pedido", concurrencia=2)
+def notificar_pedido_por_telegram(
+    pedido_id: int, titulo: str = services.TITULO_PEDIDO_NUEVO
+) -> None:
+    pedido = Order.objects.select_related("user__profile").get(pk=pedido_id)
+    services.enviar_notificacion_telegram(pedido, titulo=titulo)
+
+
+@tarea("mercadopago.procesar_notificacion")
+def procesar_notificacion_de_pago(notificacion_id: int) -> None:
+    """
+    Consulta en la API el pago de un aviso del webhook y actualiza el pedido.
+    Si Mercado Pago no responde, la excepción deja la tarea para reintentar.
+    """
+    notificacion = PaymentNotification.objects.get(pk=notificacion_id)
+    if notificacion.status != NotificationStatus.RECEIVED:
+        return
+    pago = services.obtener_pago(notificacion.resource_id)
+    with transaction.atomic():
+        pedido_id = pagos.aplicar_pago(notificacion, pago)
+        if pedido_id is not None:
+            encolar(
+                "telegram.notificar_pedido",
+                pedido_id=pedido_id,
+                titulo=services.TITULO_PAGO_ACTUALIZADO,
+            )
@@ -1,3 +1,1572 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import OperationalError, connection
+from django.db.models import Q
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    autocompletar,
+    busqueda,
+    cache_paginas,
+    cache_tarjetas,
+    carrito,
+    circuito,
+    facetas,
+    metricas,
+    pagos,
+    reservas,
+    services,
+    tareas,
+)
+from .busqueda import indice_disponible
+from .catalogo import filtrar_productos
+from .mercadopago_falso import ServidorMercadoPagoFalso
+from .pedidos import descontar_stock_y_crear_items
+from .paginacion import _filtro_posterior, codificar_cursor, paginar_por_cursor
+from .models import (
+    AutocompleteChange,
+    BackgroundJob,
+    CartItem,
+    OrderItem,
+    Category,
+    FacetKind,
+    JobStatus,
+    NotificationStatus,
+    Order,
+    OrderStatus,
+    PaymentNotification,
+    Product,
+    StockReservation,
+)
+from .services import MercadoPagoError, MercadoPagoNoDisponibleError, TelegramError
+
+
+def crear_catalogo(cantidad_por_categoria: int = 10, sufijo: str = "") -> None:
+    for nombre in ("Remeras", "Calzado", "Abrigos"):
+        categoria = Category.objects.create(name=f"{nombre}{sufijo}")
+        for numero in range(cantidad_por_categoria):
+            Product.objects.create(
+                category=categoria,
+                name=f"{nombre} modelo {numero}",
+                description="Producto de prueba para el catálogo",
+                price=Decimal("1000.00"),
+                stock=numero % 3,
+            )
+
+
+class PresupuestoConsultasCatalogoTests(TestCase):
+    """
+    Cantidad máxima de consultas por vista del catálogo. Si un cambio agrega
+    consultas por producto (N+1) estos tests fallan antes del deploy.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_catalogo()
+        cls.producto = Product.objects.first()
+        # La verificación del índice de búsqueda se hace una sola vez por proceso.
+        indice_disponible()
+
+    def setUp(self):
+        # Se mide el costo de armar la página, no el de servirla desde el cache.
+        caches[cache_paginas.ALIAS_CACHE].clear()
+
+    def test_inicio(self):
+        # Firma del catálogo (ETag) + categorías + facetas + página de productos
+        # (con su categoría en el mismo JOIN).
+        with self.assertNumQueries(4):
+            respuesta = self.client.get(reverse("tienda_app:home"))
+        self.assertEqual(respuesta.status_code, 200)
+
+    def test_inicio_no_depende_de_la_cantidad_de_productos(self):
+        crear_catalogo(cantidad_por_categoria=30, sufijo=" extra")
+        with self.assertNumQueries(4):
+            self.client.get(reverse("tienda_app:home"))
+
+    def test_inicio_filtrado_y_con_busqueda(self):
+        with self.assertNumQueries(4):
+            self.client.get(reverse("tienda_app:home"), {"categoria": "calzado", "precio": "0-10000"})
+        with self.assertNumQueries(4):
+            self.client.get(reverse("tienda_app:home"), {"buscar": "remeras"})
+
+    def test_fragmentos_del_catalogo(self):
+        with self.assertNumQueries(4):
+            self.client.get(reverse("tienda_app:catalogo"), {"categoria": "calzado"})
+        with self.assertNumQueries(2):
+            self.client.get(reverse("tienda_app:catalogo_pagina"))
+
+    def test_detalle_producto(self):
+        with self.assertNumQueries(2):
+            respuesta = self.client.get(self.producto.get_absolute_url())
+        self.assertContains(respuesta, self.producto.category.name)
+
+
+class BusquedaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        ropa = Category.objects.create(name="Ropa")
+        calzado = Category.objects.create(name="Calzado")
+        cls.termica = Product.objects.create(
+            category=ropa, name="Camiseta térmica", description="Para el frío", price=Decimal("100")
+        )
+        cls.remera = Product.objects.create(
+            category=ropa, name="Remera lisa", description="Algodón peinado", price=Decimal("100")
+        )
+        cls.zapatillas = Product.objects.create(
+            category=calzado, name="Zapatillas urbanas", description="Suela de goma", price=Decimal("100")
+        )
+        cls.medias = Product.objects.create(
+            category=ropa, name="Medias", description="Van bien con las zapatillas", price=Decimal("100")
+        )
+
+    def buscar(self, termino):
+        return list(busqueda.buscar_productos(Product.objects.all(), termino))
+
+    def test_construye_una_consulta_segura(self):
+        self.assertEqual(busqueda.construir_consulta('Remeras "Camisetá" OR'), '"remera"* "camiseta"* "or"*')
+        self.assertEqual(busqueda.construir_consulta("¡¿?!"), "")
+        self.assertEqual(busqueda._raiz("pantalones"), "pantalon")
+        self.assertEqual(busqueda._raiz("gas"), "gas")
+
+    def test_ignora_acentos_y_mayusculas(self):
+        self.assertEqual(self.buscar("TERMICA"), [self.termica])
+        self.assertEqual(self.buscar("térmica"), [self.termica])
+
+    def test_plurales_y_prefijos(self):
+        self.assertEqual(self.buscar("remeras"), [self.remera])
+        self.assertEqual(self.buscar("camis"), [self.termica])
+        # Todas las palabras tienen que aparecer.
+        self.assertEqual(self.buscar("remera termica"), [])
+
+    def test_ordena_por_relevancia(self):
+        # "zapatillas" está en el nombre de uno y sólo en la descripción del otro.
+        self.assertEqual(self.buscar("zapatillas"), [self.zapatillas, self.medias])
+
+    def test_sin_termino_no_devuelve_nada(self):
+        self.assertEqual(self.buscar("  ¿? "), [])
+
+    def test_sin_indice_usa_icontains(self):
+        with patch("tienda_app.busqueda.indice_disponible", return_value=False):
+            with CaptureQueriesContext(connection) as consultas:
+                encontrados = self.buscar("lisa")
+        self.assertEqual(encontrados, [self.remera])
+        self.assertNotIn(busqueda.TABLA_INDICE, consultas.captured_queries[-1]["sql"])
+        self.assertIn("LIKE", consultas.captured_queries[-1]["sql"])
+
+
+class PaginacionCursorTests(TestCase):
+    def setUp(self):
+        caches[cache_paginas.ALIAS_CACHE].clear()
+        crear_catalogo(cantidad_por_categoria=10)
+
+    def recorrer(self, queryset, tamano, campos=("name", "pk"), entre_paginas=None):
+        vistos, cursor = [], None
+        while True:
+            pagina = paginar_por_cursor(queryset, cursor, tamano, campos)
+            vistos.extend(objeto.pk for objeto in pagina)
+            if not pagina.hay_mas:
+                return vistos
+            cursor = pagina.cursor_siguiente
+            if entre_paginas:
+                entre_paginas()
+
+    def test_recorre_todo_sin_repetir(self):
+        esperados = list(Product.objects.order_by("name", "pk").values_list("pk", flat=True))
+        self.assertEqual(self.recorrer(Product.objects.all(), 7), esperados)
+
+    def test_filtro_posterior_por_varios_campos(self):
+        self.assertEqual(
+            _filtro_posterior(("name", "-pk"), ["b", 5]),
+            Q(name__gt="b") | Q(name="b", pk__lt=5),
+        )
+
+    def test_fechas_del_mismo_milisegundo(self):
+        usuario = User.objects.create_user("cliente")
+        base = timezone.now().replace(microsecond=1000)
+        for micro in (100, 200, 300):
+            pedido = Order.objects.create(user=usuario)
+            Order.objects.filter(pk=pedido.pk).update(created_at=base + timedelta(microseconds=micro))
+        self.assertEqual(len(self.recorrer(Order.objects.all(), 1, ("-created_at", "-pk"))), 3)
+
+    def test_cursor_alterado_o_invalido_vuelve_al_principio(self):
+        primera = [p.pk for p in paginar_por_cursor(Product.objects.all(), None, 5)]
+        valido = paginar_por_cursor(Product.objects.all(), None, 5).cursor_siguiente
+        alterado = valido[:-1] + ("A" if valido[-1] != "A" else "B")
+        for cursor in ("basura", alterado, codificar_cursor(["Remeras modelo 1"])):
+            self.assertEqual([p.pk for p in paginar_por_cursor(Product.objects.all(), cursor, 5)], primera)
+
+    def test_fragmento_trae_la_pagina_siguiente(self):
+        respuesta = self.client.get(reverse("tienda_app:home"), {"por_pagina": 4})
+        primeros = {producto.pk for producto in respuesta.context["productos"]}
+        url = respuesta.context["url_fragmento_siguiente"]
+        self.assertIn("cursor=", url)
+
+        fragmento = self.client.get(url)
+        self.assertTemplateUsed(fragmento, "tienda_app/fragmentos/productos.html")
+        siguientes = {producto.pk for producto in fragmento.context["productos"]}
+        self.assertEqual(len(siguientes), 4)
+        self.assertFalse(primeros & siguientes)
+        self.assertFalse(fragmento.context["es_primera_pagina"])
+
+        alterado = self.client.get(reverse("tienda_app:catalogo_pagina"), {"por_pagina": 4, "cursor": "x"})
+        self.assertEqual({producto.pk for producto in alterado.context["productos"]}, primeros)
+
+    def test_la_busqueda_no_saltea_ni_repite_si_cambia_el_indice(self):
+        remeras = set(Product.objects.filter(name__startswith="Remeras").values_list("pk", flat=True))
+        categoria = Category.objects.get(name="Calzado")
+
+        def agregar_productos():
+            # Cambian las estadísticas del índice (y con ellas los puntajes bm25).
+            for numero in range(5):
+                Product.objects.create(
+                    category=categoria,
+                    name=f"Ojotas {Product.objects.count()} {numero}",
+                    description="remera " * 20,
+                    price=Decimal("10"),
+                )
+
+        productos, orden = filtrar_productos(Product.objects.all(), {"buscar": "remeras"})
+        vistos = self.recorrer(productos, 3, orden, entre_paginas=agregar_productos)
+        self.assertEqual(len(vistos), len(set(vistos)))
+        self.assertEqual(set(vistos) & remeras, remeras)
+        # Los que sólo la nombran en la descripción van después de los que la tienen en el nombre.
+        self.assertEqual(set(vistos[: len(remeras)]), remeras)
+
+
+@override_settings(CATALOGO_LIMITES_PRECIO=[10000])
+class FacetasCatalogoTests(TestCase):
+    def assertFacetasCoinciden(self):
+        def sin_ceros(conteos):
+            return {
+                kind: {key: count for key, count in valores.items() if count}
+                for kind, valores in conteos.items()
+            }
+
+        incrementales = sin_ceros(facetas.conteos())
+        facetas.recalcular_facetas()
+        recalculadas = sin_ceros(facetas.conteos())
+        self.assertEqual(incrementales, recalculadas)
+        return recalculadas
+
+    def test_conteos_se_mantienen_al_modificar_productos(self):
+        remeras = Category.objects.create(name="Remeras")
+        calzado = Category.objects.create(name="Calzado")
+        producto = Product.objects.create(category=remeras, name="Remera", price=Decimal("5000"))
+        Product.objects.create(category=calzado, name="Zapatilla", price=Decimal("50000"))
+        self.assertFacetasCoinciden()
+
+        producto.category = calzado
+        producto.price = Decimal("20000")
+        producto.save()
+        conteos = self.assertFacetasCoinciden()
+        self.assertEqual(conteos[FacetKind.CATEGORY.value][str(calzado.pk)], 2)
+        self.assertEqual(conteos[FacetKind.PRICE.value]["10000-mas"], 2)
+
+        producto.is_active = False
+        producto.save()
+        self.assertFacetasCoinciden()
+
+        producto.delete()
+        remeras.delete()
+        self.assertFacetasCoinciden()
+
+
+class CacheTarjetasTests(TestCase):
+    def setUp(self):
+        caches[cache_tarjetas.ALIAS_CACHE].clear()
+        caches[cache_paginas.ALIAS_CACHE].clear()
+        crear_catalogo(cantidad_por_categoria=2)
+
+    def test_tarjetas_se_reutilizan_y_se_invalidan_al_guardar(self):
+        antes = cache_tarjetas.estadisticas()
+        self.client.get(reverse("tienda_app:home"))
+        caches[cache_paginas.ALIAS_CACHE].clear()
+        respuesta = self.client.get(reverse("tienda_app:home"))
+        despues = cache_tarjetas.estadisticas()
+        self.assertEqual(despues["fallos"] - antes["fallos"], 6)
+        self.assertEqual(despues["aciertos"] - antes["aciertos"], 6)
+        self.assertNotContains(respuesta, cache_tarjetas.MARCADOR_CSRF)
+
+        producto = Product.objects.get(name="Calzado modelo 0")
+        producto.name = "Calzado renovado"
+        producto.save()
+        self.assertContains(self.client.get(reverse("tienda_app:home")), "Calzado renovado")
+
+
+class CachePaginasAnonimasTests(TestCase):
+    def setUp(self):
+        caches[cache_paginas.ALIAS_CACHE].clear()
+        crear_catalogo(cantidad_por_categoria=2)
+        self.producto = Product.objects.filter(stock__gt=0).first()
+
+    def test_pagina_repetida_no_consulta_la_base(self):
+        self.client.get(self.producto.get_absolute_url())
+        # Sólo la consulta de la firma para el ETag.
+        with self.assertNumQueries(1):
+            respuesta = self.client.get(self.producto.get_absolute_url())
+        self.assertContains(respuesta, 'name="csrfmiddlewaretoken"')
+        self.assertNotContains(respuesta, cache_tarjetas.MARCADOR_CSRF)
+
+    def test_cambios_del_catalogo_invalidan_las_paginas(self):
+        self.client.get(reverse("tienda_app:home"))
+        self.producto.name = "Producto renombrado"
+        self.producto.save()
+        self.assertContains(self.client.get(reverse("tienda_app:home")), "Producto renombrado")
+
+    def test_usuarios_autenticados_no_usan_el_cache(self):
+        usuario = User.objects.create_user("cliente", password="clave-segura-123")
+        self.client.force_login(usuario)
+        antes = metricas.resumen_cache("cache_paginas")
+        self.client.get(reverse("tienda_app:home"))
+        self.assertEqual(metricas.resumen_cache("cache_paginas"), antes)
+
+    def test_metricas_para_el_personal(self):
+        self.client.get(reverse("tienda_app:home"))
+        personal = User.objects.create_user("personal", password="clave-segura-123", is_staff=True)
+        self.client.force_login(personal)
+        datos = self.client.get(reverse("tienda_app:metricas")).json()
+        self.assertEqual(datos["cache_paginas"], metricas.resumen_cache("cache_paginas"))
+
+
+class GetCondicionalTests(TestCase):
+    def setUp(self):
+        caches[cache_paginas.ALIAS_CACHE].clear()
+        crear_catalogo(cantidad_por_categoria=2)
+        self.producto = Product.objects.first()
+
+    def test_detalle_responde_304_si_no_cambio(self):
+        respuesta = self.client.get(self.producto.get_absolute_url())
+        etag = respuesta["ETag"]
+        with self.assertNumQueries(1):
+            respuesta = self.client.get(self.producto.get_absolute_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 304)
+
+        self.producto.save()
+        respuesta = self.client.get(self.producto.get_absolute_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+
+    def test_listado_cambia_de_etag_al_borrar_un_producto(self):
+        etag = self.client.get(reverse("tienda_app:home"))["ETag"]
+        self.assertEqual(
+            self.client.get(reverse("tienda_app:home"), HTTP_IF_NONE_MATCH=etag).status_code, 304
+        )
+        Product.objects.last().delete()
+        self.assertEqual(
+            self.client.get(reverse("tienda_app:home"), HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+
+
+class ApiCatalogoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        crear_catalogo(cantidad_por_categoria=5)
+        indice_disponible()
+
+    def test_lista_paginada_por_cursor_con_presupuesto_fijo(self):
+        vistos = []
+        url = reverse("tienda_app:api_productos") + "?por_pagina=4&categoria=remeras"
+        while url:
+            # Firma del catálogo (ETag) + página de productos.
+            with self.assertNumQueries(2):
+                datos = self.client.get(url).json()
+            vistos.extend(producto["slug"] for producto in datos["resultados"])
+            url = datos["siguiente"]
+        self.assertEqual(len(vistos), 5)
+        self.assertEqual(len(set(vistos)), 5)
+
+    def test_filtro_en_stock_y_busqueda(self):
+        datos = self.client.get(reverse("tienda_app:api_productos"), {"en_stock": "1"}).json()
+        self.assertTrue(all(producto["in_stock"] for producto in datos["resultados"]))
+        datos = self.client.get(reverse("tienda_app:api_productos"), {"buscar": "calzado"}).json()
+        self.assertEqual({producto["category"] for producto in datos["resultados"]}, {"calzado"})
+
+    def test_detalle_y_categorias(self):
+        producto = Product.objects.first()
+        url = reverse("tienda_app:api_producto", args=[producto.slug])
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.json()["id"], producto.pk)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=respuesta["ETag"]).status_code, 304)
+        self.assertEqual(
+            self.client.get(reverse("tienda_app:api_producto", args=["no-existe"])).status_code, 404
+        )
+        categorias = self.client.get(reverse("tienda_app:api_categorias")).json()["resultados"]
+        self.assertEqual(sorted(categoria["products"] for categoria in categorias), [5, 5, 5])
+
+    def test_exportacion_ndjson(self):
+        respuesta = self.client.get(reverse("tienda_app:api_exportar_productos"))
+        self.assertTrue(respuesta.streaming)
+        self.assertTrue(respuesta.has_header("ETag"))
+        lineas = b"".join(respuesta.streaming_content).decode("utf-8").splitlines()
+        self.assertEqual(len(lineas), 15)
+        self.assertIn("description", json.loads(lineas[0]))
+
+
+class AutocompletarTests(TestCase):
+    def setUp(self):
+        # Como un worker recién arrancado.
+        autocompletar._indice = None
+        crear_catalogo(cantidad_por_categoria=3)
+
+    def sugerir(self, texto):
+        respuesta = self.client.get(reverse("tienda_app:api_autocompletar"), {"q": texto})
+        return [resultado["nombre"] for resultado in respuesta.json()["resultados"]]
+
+    def test_responde_desde_memoria_sin_consultar_la_base(self):
+        self.sugerir("rem")
+        with self.assertNumQueries(0):
+            nombres = self.sugerir("Rem")
+        self.assertEqual(nombres[0], "Remeras")
+        self.assertIn("Remeras modelo 0", nombres)
+        self.assertIn("Calzado modelo 1", self.sugerir("modelo 1"))
+
+    def test_se_actualiza_al_guardar_y_borrar(self):
+        self.sugerir("rem")
+        producto = Product.objects.get(name="Remeras modelo 0")
+        with self.captureOnCommitCallbacks(execute=True):
+            producto.name = "Campera impermeable"
+            producto.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.sugerir("imper"), ["Campera impermeable"])
+        self.assertNotIn("Remeras modelo 0", self.sugerir("remeras modelo"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            producto.is_active = False
+            producto.save()
+        self.assertEqual(self.sugerir("imper"), [])
+
+    def test_los_cambios_de_otro_worker_se_ven_antes_de_responder(self):
+        self.sugerir("rem")
+        producto = Product.objects.get(name="Remeras modelo 0")
+        # Otro proceso guardó estos cambios: éste sólo los ve en la tabla.
+        Product.objects.filter(pk=producto.pk).delete()
+        AutocompleteChange.objects.create(kind=autocompletar.PRODUCTO, object_id=producto.pk)
+        AutocompleteChange.objects.create(kind=autocompletar.CATEGORIA, object_id=999, name="Accesorios", slug="acc")
+        # Dentro del intervalo se responde de memoria, todavía sin los cambios.
+        with self.assertNumQueries(0):
+            self.assertEqual(self.sugerir("acc"), [])
+        autocompletar._consultado_en -= settings.AUTOCOMPLETAR_SEGUNDOS_SINCRONIZACION
+        with self.assertNumQueries(1):
+            self.assertEqual(self.sugerir("acc"), ["Accesorios"])
+        self.assertNotIn("Remeras modelo 0", self.sugerir("remeras modelo"))
+
+    def test_no_espera_al_hilo_que_esta_consultando(self):
+        self.sugerir("rem")
+        autocompletar._consultado_en = 0.0
+        tomado, soltar = threading.Event(), threading.Event()
+
+        def consultando():
+            with autocompletar._bloqueo:
+                tomado.set()
+                soltar.wait(5)
+
+        hilo = threading.Thread(target=consultando)
+        hilo.start()
+        tomado.wait(5)
+        try:
+            with self.assertNumQueries(0):
+                self.assertIn("Remeras", self.sugerir("rem"))
+        finally:
+            soltar.set()
+            hilo.join()
+
+    def test_reconstruir_avisa_a_los_demas_workers(self):
+        self.sugerir("rem")
+        viejo, version_vieja = autocompletar._indice, autocompletar._version_local
+        # Carga masiva sin señales en otro proceso, que después reconstruye.
+        Product.objects.filter(name__startswith="Remeras").update(name="Bermuda")
+        autocompletar.reconstruir()
+        autocompletar._indice, autocompletar._version_local = viejo, version_vieja
+        autocompletar._consultado_en = 0.0
+        self.assertIn("Bermuda", self.sugerir("berm"))
+        self.assertEqual(self.sugerir("remeras modelo"), [])
+
+
+class ImportarCatalogoTests(TestCase):
+    def importar(self, contenido, extension="csv"):
+        with tempfile.NamedTemporaryFile(
+            "w", suffix=f".{extension}", delete=False, encoding="utf-8"
+        ) as archivo:
+            archivo.write(contenido)
+        self.addCleanup(os.remove, archivo.name)
+        salida, errores = StringIO(), StringIO()
+        call_command("importar_catalogo", archivo.name, stdout=salida, stderr=errores)
+        return salida.getvalue(), errores.getvalue()
+
+    def test_crea_actualiza_por_sku_y_resuelve_slugs_en_memoria(self):
+        existente = Product.objects.create(
+            category=Category.objects.create(name="Remeras"), name="Remera lisa", price=Decimal("10")
+        )
+        csv_inicial = (
+            "sku,name,category,price,stock\n"
+            "A1,Remera lisa,Remeras,1500,3\n"
+            "A2,Remera lisa,Remeras,1600,0\n"
+            "A3,Zapatilla,Calzado,abc,1\n"
+        )
+        salida, errores = self.importar(csv_inicial)
+        self.assertIn("2 creados", salida)
+        self.assertIn("Fila 3: precio inválido", errores)
+        self.assertEqual(
+            set(Product.objects.exclude(pk=existente.pk).values_list("slug", flat=True)),
+            {"remera-lisa-1", "remera-lisa-2"},
+        )
+        self.assertFalse(Category.objects.filter(name="Calzado").exists())
+
+        ndjson = json.dumps(
+            {"sku": "A1", "name": "Remera lisa azul", "category": "remeras", "price": "1700"}
+        )
+        salida, _errores = self.importar(ndjson + "\n", extension="ndjson")
+        self.assertIn("1 actualizados", salida)
+        producto = Product.objects.get(sku="A1")
+        self.assertEqual(
+            (producto.name, producto.price, producto.slug),
+            ("Remera lisa azul", Decimal("1700"), "remera-lisa-1"),
+        )
+        self.assertEqual(facetas.conteos()[FacetKind.CATEGORY.value][str(producto.category_id)], 3)
+
+    def test_json_por_bloques(self):
+        filas = [
+            {"sku": f"J{numero}", "name": f"Buzo {numero}", "category": "Abrigos", "price": 100 + numero}
+            for numero in range(50)
+        ]
+        self.importar(json.dumps(filas, indent=2), extension="json")
+        self.assertEqual(Product.objects.filter(category__name="Abrigos").count(), 50)
+
+    def test_actualizacion_parcial_conserva_lo_que_no_viene(self):
+        remeras = Category.objects.create(name="Remeras")
+        producto = Product.objects.create(
+            category=remeras,
+            name="Remera lisa",
+            sku="P1",
+            description="Algodón peinado",
+            image_url="https://example.com/remera.png",
+            price=Decimal("1500"),
+            stock=7,
+            is_active=False,
+        )
+        salida, errores = self.importar(json.dumps({"sku": "P1", "price": "2000"}) + "\n", extension="ndjson")
+        self.assertIn("1 actualizados", salida)
+        self.assertEqual(errores, "")
+        # En CSV las celdas vacías también conservan el valor anterior.
+        self.importar("sku,name,price,stock,description,is_active\nP1,Remera térmica,,3,,\n")
+
+        producto.refresh_from_db()
+        self.assertEqual(
+            (producto.name, producto.price, producto.stock, producto.description, producto.image_url),
+            ("Remera térmica", Decimal("2000"), 3, "Algodón peinado", "https://example.com/remera.png"),
+        )
+        self.assertFalse(producto.is_active)
+        self.assertEqual(producto.category, remeras)
+        self.assertEqual(list(busqueda.buscar_productos(Product.objects.all(), "termica")), [producto])
+
+    def test_cada_lote_se_confirma_por_separado(self):
+        filas = "\n".join(
+            json.dumps({"sku": f"L{numero}", "name": f"Buzo {numero}", "category": "Abrigos", "price": 100})
+            for numero in range(4)
+        )
+        with tempfile.NamedTemporaryFile("w", suffix=".ndjson", delete=False, encoding="utf-8") as archivo:
+            archivo.write(filas + "\n{roto\n")
+        self.addCleanup(os.remove, archivo.name)
+        with self.assertRaisesMessage(CommandError, "4 creados"):
+            call_command("importar_catalogo", archivo.name, "--lote", "2", stdout=StringIO(), stderr=StringIO())
+        # Los lotes ya escritos quedan, con sus facetas al día.
+        abrigos = Category.objects.get(name="Abrigos")
+        self.assertEqual(abrigos.products.count(), 4)
+        self.assertEqual(facetas.conteos()[FacetKind.CATEGORY.value][str(abrigos.pk)], 4)
+
+
+    def test_un_sku_de_otro_producto_es_un_error_de_fila(self):
+        remeras = Category.objects.create(name="Remeras")
+        primero = Product.objects.create(category=remeras, name="Remera", price=Decimal("10"))
+        segundo = Product.objects.create(category=remeras, name="Buzo", price=Decimal("20"))
+        salida, errores = self.importar(
+            "slug,sku,name,category,price\n"
+            ",N1,Nuevo,Remeras,5\n"
+            f"{segundo.slug},N1,,,\n"
+            f"{primero.slug},X1,,,\n"
+            ",X1,Remera X,,\n"
+        )
+        # Sin el control en memoria, la fila 2 cortaba la importación con un IntegrityError.
+        self.assertIn("Fila 2: el SKU N1 ya es de otro producto", errores)
+        self.assertIn("1 creados, 1 actualizados", salida)
+        self.assertIsNone(Product.objects.get(pk=segundo.pk).sku)
+        primero.refresh_from_db()
+        self.assertEqual((primero.sku, primero.name), ("X1", "Remera X"))
+
+    def test_filas_repetidas_sin_sku_ni_slug_crean_un_solo_producto(self):
+        salida, _errores = self.importar(
+            "name,category,price\nGorro,Abrigos,10\nGorro,Abrigos,10\nGorro,Abrigos,12\n"
+        )
+        self.assertIn("2 creados", salida)
+        self.assertEqual(Product.objects.filter(name="Gorro").count(), 2)
+
+@patch("tienda_app.services.enviar_notificacion_telegram")
+@patch(
+    "tienda_app.views.crear_preferencia_para_pedido",
+    return_value={"id": "pref-1", "init_point": "https://mercadopago.test/pagar"},
+)
+class CheckoutStockTests(TestCase):
+    def setUp(self):
+        crear_catalogo(cantidad_por_categoria=7)
+        Product.objects.update(stock=5)
+        self.usuario = User.objects.create_user("comprador", password="clave-segura-123")
+        self.client.force_login(self.usuario)
+        self.productos = list(Product.objects.order_by("pk")[:20])
+
+    def cargar_carrito(self, cantidades):
+        CartItem.objects.bulk_create(
+            CartItem(user=self.usuario, product=producto, quantity=cantidad)
+            for producto, cantidad in cantidades
+        )
+
+    def comprar(self):
+        return self.client.post(reverse("tienda_app:checkout"), {"shipping_address": "Calle 123"})
+
+    def test_carrito_de_20_lineas_con_consultas_constantes(self, _preferencia, _telegram):
+        self.cargar_carrito((producto, 2) for producto in self.productos)
+        # Con 20 líneas: un SELECT ... FOR UPDATE y un UPDATE de productos, y un
+        # solo INSERT de items (antes eran unas 60 consultas).
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.comprar()
+        self.assertEqual(respuesta.status_code, 302)
+        sentencias = [consulta["sql"] for consulta in consultas.captured_queries]
+        self.assertEqual(
+            len([sql for sql in sentencias if sql.split(" WHERE ")[0].endswith('FROM "tienda_app_product"')
+                 or sql.startswith('UPDATE "tienda_app_product"')]),
+            2,
+        )
+        inserciones = [sql for sql in sentencias if sql.startswith('INSERT INTO "tienda_app_orderitem"')]
+        self.assertEqual(len(inserciones), 1)
+        pedido = Order.objects.get(user=self.usuario)
+        self.assertEqual(pedido.items.count(), 20)
+        self.assertEqual(pedido.total_items, 40)
+        self.assertEqual(pedido.total_amount, sum(producto.price * 2 for producto in self.productos))
+        stocks = Product.objects.filter(pk__in=[p.pk for p in self.productos]).values_list("stock", flat=True)
+        self.assertEqual(set(stocks), {3})
+
+    def test_sin_stock_no_descuenta_nada(self, _preferencia, _telegram):
+        self.cargar_carrito([(self.productos[0], 2), (self.productos[1], 2)])
+        # Otra compra se llevó el stock entre que se armó el carrito y el checkout.
+        Product.objects.filter(pk=self.productos[1].pk).update(stock=1)
+        respuesta = self.comprar()
+        self.assertRedirects(
+            respuesta, reverse("tienda_app:ver_carrito"), fetch_redirect_response=False
+        )
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Product.objects.get(pk=self.productos[0].pk).stock, 5)
+
+    def test_si_mercado_pago_falla_se_devuelve_el_stock(self, preferencia, telegram):
+        stock_durante_la_llamada = []
+
+        def fallar(pedido, request):
+            # El pedido y el stock ya están confirmados cuando se llama a Mercado Pago.
+            stock_durante_la_llamada.append(Product.objects.get(pk=self.productos[0].pk).stock)
+            raise MercadoPagoError("Servicio no disponible.")
+
+        preferencia.side_effect = fallar
+        self.cargar_carrito([(self.productos[0], 2)])
+        respuesta = self.comprar()
+        self.assertRedirects(
+            respuesta, reverse("tienda_app:ver_carrito"), fetch_redirect_response=False
+        )
+        self.assertEqual(Order.objects.get().status, OrderStatus.FAILED)
+        self.assertEqual(Product.objects.get(pk=self.productos[0].pk).stock, 5)
+        self.assertEqual(stock_durante_la_llamada, [3])
+        self.assertFalse(BackgroundJob.objects.exists())
+        self.assertTrue(CartItem.objects.filter(user=self.usuario).exists())
+
+    def test_cualquier_error_al_iniciar_el_pago_devuelve_el_stock(self, preferencia, _telegram):
+        # Una respuesta inesperada no es un MercadoPagoError: el error sigue de
+        # largo, pero el pedido no puede quedar pendiente con el stock tomado.
+        preferencia.return_value = ["respuesta", "inesperada"]
+        self.cargar_carrito([(self.productos[0], 2)])
+        with self.assertRaises(AttributeError):
+            self.comprar()
+        self.assertEqual(Order.objects.get().status, OrderStatus.FAILED)
+        self.assertEqual(Product.objects.get(pk=self.productos[0].pk).stock, 5)
+        self.assertFalse(BackgroundJob.objects.exists())
+
+    def test_con_el_circuito_abierto_no_se_reserva_stock(self, preferencia, _telegram):
+        services.CIRCUITO_PREFERENCIA._abrir()
+        self.cargar_carrito([(self.productos[0], 2)])
+        respuesta = self.comprar()
+        self.assertRedirects(
+            respuesta, reverse("tienda_app:ver_carrito"), fetch_redirect_response=False
+        )
+        preferencia.assert_not_called()
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Product.objects.get(pk=self.productos[0].pk).stock, 5)
+
+
+class CarritoTests(TestCase):
+    def setUp(self):
+        crear_catalogo(cantidad_por_categoria=4)
+        Product.objects.update(stock=5)
+        self.productos = list(Product.objects.order_by("pk")[:6])
+        self.usuario = User.objects.create_user("cliente", password="clave-segura-123")
+
+    def agregar(self, producto, cantidad=1):
+        return self.client.post(
+            reverse("tienda_app:agregar_al_carrito", args=[producto.slug]), {"cantidad": cantidad}
+        )
+
+    def test_un_carrito_incompleto_falla_al_crearse(self):
+        class SinVaciar(carrito.Carrito):
+            def cantidades(self):
+                return {}
+
+            def fijar(self, producto_id, cantidad):
+                pass
+
+        with self.assertRaises(TypeError):
+            SinVaciar()
+
+    def test_visitante_guarda_solo_cantidades_en_la_sesion(self):
+        self.agregar(self.productos[0], 2)
+        self.agregar(self.productos[0], 1)
+        self.agregar(self.productos[1])
+        self.assertEqual(
+            self.client.session["carrito"],
+            {str(self.productos[0].pk): 3, str(self.productos[1].pk): 1},
+        )
+        respuesta = self.agregar(self.productos[0], 3)
+        self.assertRedirects(respuesta, self.productos[0].get_absolute_url(), fetch_redirect_response=False)
+        self.assertEqual(self.client.session["carrito"][str(self.productos[0].pk)], 3)
+
+    def test_muestra_precio_y_stock_actuales_en_una_consulta(self):
+        self.client.force_login(self.usuario)
+        for producto in self.productos:
+            self.agregar(producto, 2)
+        Product.objects.filter(pk=self.productos[0].pk).update(price=Decimal("1500.00"))
+        Product.objects.filter(pk=self.productos[1].pk).update(stock=1)
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse("tienda_app:ver_carrito"))
+        lineas = respuesta.context["items_carrito"]
+        self.assertEqual(len(lineas), 6)
+        self.assertEqual(lineas[0].precio, Decimal("1500.00"))
+        self.assertEqual(respuesta.context["total"], Decimal("1500.00") * 2 + Decimal("1000.00") * 10)
+        self.assertContains(respuesta, "Sólo quedan 1 unidades.")
+        productos = [c for c in consultas.captured_queries if 'FROM "tienda_app_product"' in c["sql"]]
+        self.assertEqual(len(productos), 1)
+
+    def test_al_ingresar_se_suma_el_carrito_del_visitante(self):
+        CartItem.objects.create(user=self.usuario, product=self.productos[0], quantity=1)
+        self.agregar(self.productos[0], 2)
+        self.agregar(self.productos[2], 1)
+        self.client.login(username="cliente", password="clave-segura-123")
+        self.assertEqual(
+            dict(CartItem.objects.filter(user=self.usuario).values_list("product_id", "quantity")),
+            {self.productos[0].pk: 3, self.productos[2].pk: 1},
+        )
+        self.assertNotIn("carrito", self.client.session)
+
+    def test_lee_el_formato_anterior_de_la_sesion(self):
+        sesion = self.client.session
+        sesion["carrito"] = {
+            str(self.productos[0].pk): {"nombre": "x", "precio": 1.0, "cantidad": 2, "imagen": "", "slug": "x"}
+        }
+        sesion.save()
+        respuesta = self.client.get(reverse("tienda_app:ver_carrito"))
+        self.assertEqual(respuesta.context["total"], Decimal("2000.00"))
+        self.client.post(reverse("tienda_app:eliminar_del_carrito", args=[self.productos[0].pk]))
+        self.assertEqual(self.client.session["carrito"], {})
+
+    def resumen(self):
+        return self.client.get(reverse("tienda_app:resumen_carrito")).json()
+
+    def test_resumen_precalculado_sin_consultar_productos(self):
+        self.client.force_login(self.usuario)
+        self.agregar(self.productos[0], 2)
+        self.agregar(self.productos[1], 1)
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self.resumen(), {"cantidad": 3, "monto": "3000.00"})
+        self.assertFalse([c for c in consultas.captured_queries if "tienda_app_" in c["sql"]])
+
+        self.client.post(reverse("tienda_app:eliminar_del_carrito", args=[self.productos[0].pk]))
+        self.assertEqual(self.resumen(), {"cantidad": 1, "monto": "1000.00"})
+        self.client.post(reverse("tienda_app:vaciar_carrito"))
+        self.assertEqual(self.resumen(), {"cantidad": 0, "monto": "0.00"})
+
+    def test_ver_el_carrito_corrige_el_resumen(self):
+        self.agregar(self.productos[0], 2)
+        Product.objects.filter(pk=self.productos[0].pk).update(price=Decimal("1250.50"))
+        self.assertEqual(self.resumen()["monto"], "2000.00")
+        self.client.get(reverse("tienda_app:ver_carrito"))
+        self.assertEqual(self.resumen(), {"cantidad": 2, "monto": "2501.00"})
+
+    def test_al_ingresar_el_resumen_es_el_del_cliente(self):
+        CartItem.objects.create(user=self.usuario, product=self.productos[0], quantity=4)
+        self.agregar(self.productos[1], 1)
+        self.client.login(username="cliente", password="clave-segura-123")
+        self.assertEqual(self.resumen()["cantidad"], 5)
+
+    def test_las_paginas_que_no_muestran_el_carrito_no_lo_leen(self):
+        self.client.force_login(self.usuario)
+        self.agregar(self.productos[0], 2)
+        sesion = self.client.session
+        del sesion["carrito_resumen"]
+        sesion.save()
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(reverse("tienda_app:mis_pedidos"))
+        self.assertFalse([c for c in consultas.captured_queries if "tienda_app_cartitem" in c["sql"]])
+        self.assertNotIn("carrito_resumen", self.client.session)
+
+
+    def test_acciones_en_json_sin_redireccion(self):
+        self.client.force_login(self.usuario)
+        url = reverse("tienda_app:agregar_al_carrito", args=[self.productos[0].slug])
+        respuesta = self.client.post(url, {"cantidad": 2}, HTTP_ACCEPT="application/json")
+        self.assertEqual(respuesta.status_code, 200)
+        datos = respuesta.json()
+        self.assertEqual(datos["linea"]["cantidad"], 2)
+        self.assertEqual(datos["linea"]["subtotal"], "2000.00")
+        self.assertEqual(datos["carrito"], {"cantidad": 2, "monto": "2000.00"})
+        # Sin redirección no queda un mensaje guardado para la página siguiente.
+        self.assertNotIn("_messages", self.client.session)
+
+        actualizar = reverse("tienda_app:actualizar_carrito", args=[self.productos[0].pk])
+        respuesta = self.client.post(actualizar, {"cantidad": 9}, HTTP_ACCEPT="application/json")
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertTrue(respuesta.json()["error"])
+        self.assertEqual(respuesta.json()["linea"]["cantidad"], 2)
+
+        respuesta = self.client.post(actualizar, {"cantidad": 4}, HTTP_ACCEPT="application/json")
+        self.assertEqual(respuesta.json()["carrito"], {"cantidad": 4, "monto": "4000.00"})
+        respuesta = self.client.post(actualizar, {"cantidad": 0}, HTTP_ACCEPT="application/json")
+        self.assertEqual(respuesta.json()["carrito"]["cantidad"], 0)
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_acciones_devuelven_el_fragmento_del_carrito(self):
+        self.agregar(self.productos[0], 2)
+        self.agregar(self.productos[1], 1)
+        respuesta = self.client.post(
+            reverse("tienda_app:eliminar_del_carrito", args=[self.productos[0].pk]),
+            HTTP_X_REQUESTED_WITH="XMLHttpRequest",
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTemplateUsed(respuesta, "tienda_app/fragmentos/carrito.html")
+        self.assertTemplateNotUsed(respuesta, "base.html")
+        self.assertContains(respuesta, "fue retirado del carrito")
+        self.assertContains(respuesta, 'data-carrito-cantidad="1"')
+        self.assertNotContains(respuesta, self.productos[0].get_absolute_url())
+
+        respuesta = self.client.post(reverse("tienda_app:vaciar_carrito"), HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        self.assertContains(respuesta, "Tu carrito está vacío")
+
+    def test_sin_javascript_se_mantiene_la_redireccion(self):
+        self.agregar(self.productos[0], 2)
+        respuesta = self.client.post(
+            reverse("tienda_app:actualizar_carrito", args=[self.productos[0].pk]), {"cantidad": 3}
+        )
+        self.assertRedirects(respuesta, reverse("tienda_app:ver_carrito"))
+        self.assertEqual(self.client.session["carrito"], {str(self.productos[0].pk): 3})
+
+
+@patch("tienda_app.services.enviar_notificacion_telegram")
+@patch(
+    "tienda_app.views.crear_preferencia_para_pedido",
+    return_value={"id": "pref-1", "init_point": "https://mercadopago.test/pagar"},
+)
+class ReservasStockTests(TestCase):
+    def setUp(self):
+        crear_catalogo(cantidad_por_categoria=2)
+        self.producto = Product.objects.order_by("pk").first()
+        Product.objects.filter(pk=self.producto.pk).update(stock=2)
+        self.usuario = User.objects.create_user("cliente", password="clave-segura-123")
+        self.otro = self.client_class()
+
+    def agregar(self, cliente, cantidad):
+        return cliente.post(
+            reverse("tienda_app:agregar_al_carrito", args=[self.producto.slug]),
+            {"cantidad": cantidad},
+            HTTP_ACCEPT="application/json",
+        )
+
+    def test_las_ultimas_unidades_quedan_reservadas_para_el_primero(self, _preferencia, _telegram):
+        self.assertEqual(self.agregar(self.otro, 2).status_code, 200)
+        reserva = StockReservation.objects.get()
+        self.assertEqual(reserva.quantity, 2)
+        self.assertTrue(reserva.owner.startswith("visitante:"))
+
+        respuesta = self.agregar(self.client, 1)
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertIn("reservadas en otros carritos", respuesta.json()["mensaje"])
+        self.assertNotIn("carrito", self.client.session)
+
+        # Al quitarlo del carrito, la reserva se libera.
+        self.otro.post(reverse("tienda_app:eliminar_del_carrito", args=[self.producto.pk]))
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(self.agregar(self.client, 1).status_code, 200)
+
+    def test_una_reserva_vencida_no_cuenta(self, _preferencia, _telegram):
+        self.agregar(self.otro, 2)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.agregar(self.client, 2).status_code, 200)
+
+    def test_el_barrido_borra_las_vencidas_por_lotes(self, _preferencia, _telegram):
+        productos = list(Product.objects.order_by("pk"))
+        vencida = timezone.now() - timedelta(minutes=1)
+        StockReservation.objects.bulk_create(
+            StockReservation(owner=f"visitante:{numero}", product=producto, quantity=1, expires_at=vencida)
+            for numero, producto in enumerate(productos[:5])
+        )
+        reservas.reservar("visitante:vigente", {productos[0].pk: 1})
+        salida = StringIO()
+        call_command("liberar_reservas", "--lote", "2", stdout=salida)
+        self.assertIn("5 reservas vencidas liberadas", salida.getvalue())
+        self.assertEqual(list(StockReservation.objects.values_list("owner", flat=True)), ["visitante:vigente"])
+
+    def test_al_ingresar_la_reserva_pasa_al_cliente(self, _preferencia, _telegram):
+        self.agregar(self.client, 2)
+        self.client.login(username="cliente", password="clave-segura-123")
+        reserva = StockReservation.objects.get()
+        self.assertEqual((reserva.owner, reserva.quantity), (f"usuario:{self.usuario.pk}", 2))
+
+    def test_el_checkout_extiende_la_reserva_y_la_libera_al_comprar(self, _preferencia, _telegram):
+        self.client.force_login(self.usuario)
+        self.agregar(self.client, 2)
+        self.assertEqual(self.client.get(reverse("tienda_app:checkout")).status_code, 200)
+        vence = StockReservation.objects.get().expires_at
+        self.assertGreater(vence, timezone.now() + timedelta(minutes=19))
+
+        self.client.post(reverse("tienda_app:checkout"), {"shipping_address": "Calle 123"})
+        self.assertEqual(Order.objects.get().total_items, 2)
+        self.assertEqual(Product.objects.get(pk=self.producto.pk).stock, 0)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_el_checkout_no_vende_lo_reservado_por_otros(self, preferencia, _telegram):
+        self.client.force_login(self.usuario)
+        CartItem.objects.create(user=self.usuario, product=self.producto, quantity=2)
+        self.agregar(self.otro, 1)
+
+        respuesta = self.client.get(reverse("tienda_app:checkout"))
+        self.assertRedirects(respuesta, reverse("tienda_app:ver_carrito"), fetch_redirect_response=False)
+        respuesta = self.client.post(reverse("tienda_app:checkout"), {"shipping_address": "Calle 123"})
+        self.assertRedirects(respuesta, reverse("tienda_app:ver_carrito"), fetch_redirect_response=False)
+        preferencia.assert_not_called()
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(Product.objects.get(pk=self.producto.pk).stock, 2)
+        self.assertContains(self.client.get(reverse("tienda_app:ver_carrito")), "Sólo quedan 1 unidades")
+
+    def test_agregar_por_get_no_reserva(self, _preferencia, _telegram):
+        respuesta = self.client.get(reverse("tienda_app:agregar_al_carrito", args=[self.producto.slug]))
+        self.assertEqual(respuesta.status_code, 405)
+        self.assertFalse(StockReservation.objects.exists())
+
+    @override_settings(RESERVAS_MAXIMO_VISITANTE=1)
+    def test_un_visitante_no_reserva_mas_que_el_tope(self, _preferencia, _telegram):
+        self.assertEqual(self.agregar(self.otro, 2).status_code, 200)
+        self.assertEqual(StockReservation.objects.get().quantity, 1)
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.agregar(self.client, 1).status_code, 200)
+        self.assertEqual(self.agregar(self.client, 1).status_code, 409)
+
+    def test_cantidades_enormes_se_rechazan_sin_reservar(self, _preferencia, _telegram):
+        enorme = 10**20
+        self.assertEqual(self.agregar(self.client, enorme).status_code, 409)
+        self.agregar(self.client, 1)
+        respuesta = self.client.post(
+            reverse("tienda_app:actualizar_carrito", args=[self.producto.pk]),
+            {"cantidad": enorme},
+            HTTP_ACCEPT="application/json",
+        )
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(StockReservation.objects.get().quantity, 1)
+
+    def test_el_checkout_extiende_las_reservas_bajo_bloqueo(self, _preferencia, _telegram):
+        self.client.force_login(self.usuario)
+        CartItem.objects.create(user=self.usuario, product=self.producto, quantity=2)
+        self.agregar(self.otro, 1)
+        # La revisión del carrito no bloquea: si llega a ver todo libre, la
+        # reserva bajo bloqueo encuentra la unidad de otro carrito.
+        with patch("tienda_app.reservas.disponibles", return_value={self.producto.pk: 2}):
+            respuesta = self.client.get(reverse("tienda_app:checkout"))
+        self.assertRedirects(respuesta, reverse("tienda_app:ver_carrito"), fetch_redirect_response=False)
+        self.assertEqual(list(StockReservation.objects.values_list("quantity", flat=True)), [1])
+
+    def test_lo_disponible_se_calcula_con_el_indice(self, _preferencia, _telegram):
+        with CaptureQueriesContext(connection) as consultas:
+            reservas.reservado_por_otros([self.producto.pk], "visitante:yo")
+        sql = consultas.captured_queries[-1]["sql"]
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+            pasos = " ".join(fila[-1] for fila in cursor.fetchall())
+        self.assertIn("reserva_producto_vence_idx", pasos)
+        self.assertNotIn("SCAN tienda_app_stockreservation", pasos)
+
+
+class ReservasConcurrentesTests(TransactionTestCase):
+    """
+    Dos compradores piden la última unidad a la vez, cada uno en su hilo y con
+    su propia conexión a la base.
+    """
+
+    def setUp(self):
+        crear_catalogo(cantidad_por_categoria=1)
+        self.producto = Product.objects.order_by("pk").first()
+        Product.objects.filter(pk=self.producto.pk).update(stock=1)
+
+    def test_la_ultima_unidad_se_reserva_una_sola_vez(self):
+        url = reverse("tienda_app:agregar_al_carrito", args=[self.producto.slug])
+        contar = reservas.reservado_por_otros
+        # Cada uno espera al otro después de contar lo reservado: sin bloqueo,
+        # los dos cuentan cero y reservan. Con bloqueo, el segundo no llega a
+        # contar hasta que el primero confirma, y la espera vence.
+        ambos_contaron = threading.Barrier(2, timeout=1)
+        respuestas = []
+
+        def contar_y_esperar(*argumentos, **opciones):
+            resultado = contar(*argumentos, **opciones)
+            try:
+                ambos_contaron.wait()
+            except threading.BrokenBarrierError:
+                pass
+            return resultado
+
+        def comprar():
+            try:
+                respuestas.append(
+                    self.client_class().post(url, {"cantidad": 1}, HTTP_ACCEPT="application/json").status_code
+                )
+            finally:
+                connection.close()
+
+        with patch("tienda_app.reservas.reservado_por_otros", side_effect=contar_y_esperar):
+            hilos = [threading.Thread(target=comprar) for _ in range(2)]
+            for hilo in hilos:
+                hilo.start()
+            for hilo in hilos:
+                hilo.join()
+
+        self.assertEqual(sorted(respuestas), [200, 409])
+        self.assertEqual(StockReservation.objects.get().quantity, 1)
+
+
+class SesionesTests(TestCase):
+    def setUp(self):
+        crear_catalogo(cantidad_por_categoria=2)
+        Product.objects.update(stock=5)
+        self.producto = Product.objects.first()
+
+    def escrituras_de_sesion(self, *args, **kwargs):
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.post(*args, **kwargs)
+        return [
+            c["sql"] for c in consultas.captured_queries
+            if "django_session" in c["sql"] and not c["sql"].startswith("SELECT")
+        ]
+
+    @override_settings(SESSION_ENGINE="tienda_app.sesiones.db")
+    def test_solo_se_escribe_si_cambia_el_contenido(self):
+        agregar = reverse("tienda_app:agregar_al_carrito", args=[self.producto.slug])
+        actualizar = reverse("tienda_app:actualizar_carrito", args=[self.producto.pk])
+        self.assertEqual(len(self.escrituras_de_sesion(agregar, {"cantidad": 1})), 1)
+        # La misma cantidad: Django marca la sesión como modificada, pero no cambió.
+        self.assertEqual(
+            self.escrituras_de_sesion(actualizar, {"cantidad": 1}, HTTP_ACCEPT="application/json"), []
+        )
+        self.assertEqual(
+            len(self.escrituras_de_sesion(actualizar, {"cantidad": 2}, HTTP_ACCEPT="application/json")), 1
+        )
+        self.assertEqual(self.client.session["carrito"], {str(self.producto.pk): 2})
+
+    def test_los_mensajes_no_se_guardan_en_la_sesion(self):
+        respuesta = self.client.post(reverse("tienda_app:agregar_al_carrito", args=[self.producto.slug]))
+        self.assertIn("messages", respuesta.cookies)
+        self.assertNotIn("_messages", self.client.session)
+        self.assertContains(self.client.get(respuesta.url), "se agregó al carrito")
+
+@override_settings(TAREAS_SINCRONICAS=True)
+class ColaDeTareasTests(TestCase):
+    def setUp(self):
+        usuario = User.objects.create_user("cliente", password="clave-segura-123")
+        self.pedido = Order.objects.create(user=usuario)
+
+    @patch("tienda_app.services.enviar_notificacion_telegram")
+    def test_modo_sincronico_ejecuta_al_confirmar(self, telegram):
+        with self.captureOnCommitCallbacks(execute=True):
+            trabajo = tareas.encolar("telegram.notificar_pedido", pedido_id=self.pedido.pk)
+        telegram.assert_called_once()
+        self.assertEqual(BackgroundJob.objects.get(pk=trabajo.pk).status, JobStatus.DONE)
+
+    @patch("tienda_app.services.enviar_notificacion_telegram", side_effect=TelegramError("timeout"))
+    def test_reintenta_con_espera_y_despues_queda_fallida(self, _telegram):
+        with self.assertLogs("tienda_app.tareas", "WARNING"):
+            with self.captureOnCommitCallbacks(execute=True):
+                trabajo = tareas.encolar("telegram.notificar_pedido", pedido_id=self.pedido.pk)
+        trabajo.refresh_from_db()
+        self.assertEqual((trabajo.status, trabajo.attempts), (JobStatus.PENDING, 1))
+        self.assertGreater(trabajo.run_after, timezone.now())
+        self.assertIn("timeout", trabajo.last_error)
+
+        with self.assertLogs("tienda_app.tareas", "ERROR"):
+            for _intento in range(trabajo.max_attempts - 1):
+                tareas.ejecutar_pendiente(trabajo.pk)
+        trabajo.refresh_from_db()
+        self.assertEqual(trabajo.status, JobStatus.DEAD)
+
+        self.assertEqual(tareas.reintentar(BackgroundJob.objects.all()), 1)
+
+
+class WorkerDeTareasTests(TransactionTestCase):
+    """
+    El worker usa hilos con su propia conexión: necesita datos ya confirmados.
+    """
+
+    @patch("tienda_app.services.enviar_notificacion_telegram")
+    def test_procesa_las_vencidas(self, telegram):
+        pedido = Order.objects.create(user=User.objects.create_user("cliente"))
+        tareas.encolar("telegram.notificar_pedido", pedido_id=pedido.pk)
+        tareas.encolar("telegram.notificar_pedido", pedido_id=pedido.pk)
+        call_command("procesar_tareas", "--una-vez", stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(telegram.call_count, 2)
+        self.assertEqual(BackgroundJob.objects.filter(status=JobStatus.DONE).count(), 2)
+
+    def test_la_base_bloqueada_no_corta_el_worker(self):
+        errores = StringIO()
+        with patch.object(tareas, "recuperar_abandonadas", side_effect=OperationalError("database is locked")):
+            call_command("procesar_tareas", "--una-vez", stdout=StringIO(), stderr=errores)
+        self.assertIn("database is locked", errores.getvalue())
+
+
+@override_settings(TAREAS_SINCRONICAS=True)
+class WebhookMercadoPagoTests(TestCase):
+    def setUp(self):
+        usuario = User.objects.create_user("cliente", password="clave-segura-123")
+        self.pedido = Order.objects.create(user=usuario)
+        self.url = reverse("tienda_app:mercadopago_webhook")
+
+    def _avisar(self, evento="evt-1", pago="123", **extra):
+        cuerpo = {"id": evento, "type": "payment", "action": "payment.updated", "data": {"id": pago}}
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                f"{self.url}?data.id={pago}&type=payment",
+                data=json.dumps(cuerpo),
+                content_type="application/json",
+                **extra,
+            )
+
+    @patch("tienda_app.services.enviar_notificacion_telegram")
+    @patch("tienda_app.services.obtener_pago")
+    def test_actualiza_el_pedido_y_descarta_reenvios(self, obtener_pago, telegram):
+        obtener_pago.return_value = {"status": "approved", "external_reference": str(self.pedido.pk)}
+        self.assertEqual(self._avisar().status_code, 200)
+        self.assertEqual(self._avisar().status_code, 200)
+
+        obtener_pago.assert_called_once_with("123")
+        telegram.assert_called_once()
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.status, OrderStatus.COMPLETED)
+        notificacion = PaymentNotification.objects.get()
+        self.assertEqual(
+            (notificacion.status, notificacion.order_id, notificacion.payment_status),
+            (NotificationStatus.PROCESSED, self.pedido.pk, "approved"),
+        )
+
+    def _avisar_ipn(self, pago="123"):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(
+                f"{self.url}?topic=payment&id={pago}", data="", content_type="application/json"
+            )
+
+    @patch("tienda_app.services.enviar_notificacion_telegram")
+    @patch("tienda_app.services.obtener_pago")
+    def test_cada_ipn_del_mismo_pago_se_vuelve_a_consultar(self, obtener_pago, telegram):
+        # Las IPN no dicen qué cambió: pendiente y aprobado llegan con la misma clave.
+        obtener_pago.return_value = {"status": "pending", "external_reference": str(self.pedido.pk)}
+        self.assertEqual(self._avisar_ipn().status_code, 200)
+        obtener_pago.return_value = {"status": "approved", "external_reference": str(self.pedido.pk)}
+        self.assertEqual(self._avisar_ipn().status_code, 200)
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.status, OrderStatus.COMPLETED)
+        telegram.assert_called_once()
+
+        # Otra IPN con el mismo estado ya aplicado no vuelve a notificar.
+        self._avisar_ipn()
+        self.assertEqual(obtener_pago.call_count, 3)
+        telegram.assert_called_once()
+        notificacion = PaymentNotification.objects.get()
+        self.assertEqual(
+            (notificacion.status, notificacion.payment_status),
+            (NotificationStatus.PROCESSED, "approved"),
+        )
+
+    @override_settings(TAREAS_SINCRONICAS=False)
+    def test_ipn_reenviada_mientras_espera_en_la_cola_se_descarta(self):
+        self._avisar_ipn()
+        self._avisar_ipn()
+        self.assertEqual(BackgroundJob.objects.count(), 1)
+        self.assertEqual(PaymentNotification.objects.get().status, NotificationStatus.RECEIVED)
+
+    @override_settings(TAREAS_SINCRONICAS=False)
+    def test_responde_sin_consultar_a_mercado_pago(self):
+        with patch("tienda_app.services.obtener_pago") as obtener_pago:
+            with self.assertNumQueries(4):
+                respuesta = self._avisar()
+        self.assertEqual(respuesta.status_code, 200)
+        obtener_pago.assert_not_called()
+        self.assertEqual(BackgroundJob.objects.get().kind, "mercadopago.procesar_notificacion")
+
+    @patch("tienda_app.services.obtener_pago")
+    def test_un_rechazo_atrasado_no_deshace_un_pago_aprobado(self, obtener_pago):
+        Order.objects.filter(pk=self.pedido.pk).update(status=OrderStatus.COMPLETED)
+        obtener_pago.return_value = {"status": "rejected", "external_reference": str(self.pedido.pk)}
+        self._avisar()
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.status, OrderStatus.COMPLETED)
+
+        self.assertTrue(pagos.actualizar_pedido(self.pedido.pk, "refunded"))
+        self.pedido.refresh_from_db()
+        self.assertEqual(self.pedido.status, OrderStatus.CANCELLED)
+
+    @override_settings(MERCADOPAGO_WEBHOOK_SECRET="secreto")
+    def test_rechaza_firmas_invalidas(self):
+        respuesta = self._avisar(HTTP_X_SIGNATURE="ts=1,v1=abc", HTTP_X_REQUEST_ID="r-1")
+        self.assertEqual(respuesta.status_code, 401)
+        self.assertFalse(PaymentNotification.objects.exists())
+
+    def test_aviso_sin_recurso_es_invalido(self):
+        respuesta = self.client.post(self.url, data="{}", content_type="application/json")
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_metricas_cuentan_los_avisos(self):
+        User.objects.create_user("admin", password="clave-segura-123", is_staff=True)
+        self.client.login(username="admin", password="clave-segura-123")
+        with patch("tienda_app.services.obtener_pago", return_value=None):
+            self._avisar(evento="evt-metricas")
+        datos = self.client.get(reverse("tienda_app:metricas")).json()
+        self.assertGreaterEqual(datos["mercadopago"]["mercadopago.webhook.recibidos"], 1)
+
+
+class ClientesHttpTests(TestCase):
+    def test_reutiliza_la_conexion_entre_consultas(self):
+        cliente = services.ClienteHttpMercadoPago()
+        with ServidorMercadoPagoFalso() as servidor:
+            servidor.agregar_pago("1", pedido_id=1, estado="approved")
+            for _ in range(5):
+                respuesta = cliente.get(f"{servidor.url}/v1/payments/1", headers={})
+                self.assertEqual(respuesta["response"]["status"], "approved")
+        self.assertEqual(servidor.conexiones, 1)
+
+    def test_despues_de_un_fork_usa_sesiones_nuevas(self):
+        anterior = services.sesion_http("telegram")
+        self.assertIs(services.sesion_http("telegram"), anterior)
+        services._olvidar_sesiones()
+        self.assertIsNot(services.sesion_http("telegram"), anterior)
+
+
+@override_settings(
+    MERCADOPAGO_ACCESS_TOKEN="TEST-token",
+    CIRCUITO_FALLOS_PARA_ABRIR=3,
+    CIRCUITO_TIEMPO_ABIERTO=30,
+)
+class CircuitoMercadoPagoTests(TestCase):
+    def setUp(self):
+        self.sesion = patch.object(services.sesion_http("mercadopago"), "request").start()
+        self.addCleanup(patch.stopall)
+
+    def _responder(self, estado, datos=None):
+        respuesta = self.sesion.return_value
+        respuesta.status_code = estado
+        respuesta.content = b"{}"
+        respuesta.json.return_value = datos or {}
+
+    def test_se_abre_y_rechaza_sin_llamar(self):
+        self._responder(503)
+        for _ in range(3):
+            with self.assertRaises(MercadoPagoNoDisponibleError):
+                services.obtener_pago("1")
+        self.assertEqual(services.CIRCUITO_PAGO.estado(), circuito.ABIERTO)
+
+        self.sesion.reset_mock()
+        with self.assertRaises(MercadoPagoNoDisponibleError):
+            services.obtener_pago("1")
+        self.sesion.assert_not_called()
+        # El circuito de preferencias es otro: sigue cerrado.
+        self.assertTrue(services.mercadopago_disponible())
+
+    def test_semiabierto_deja_pasar_una_prueba_y_se_cierra(self):
+        services.CIRCUITO_PAGO._abrir()
+        with patch("tienda_app.circuito.time.time", return_value=time.time() + 31):
+            self.assertTrue(services.CIRCUITO_PAGO.permitir())
+            self.assertFalse(services.CIRCUITO_PAGO.permitir())
+
+        services.CIRCUITO_PAGO._abrir()
+        with patch("tienda_app.circuito.time.time", return_value=time.time() + 31):
+            self._responder(200, {"status": "approved"})
+            self.assertEqual(services.obtener_pago("1")["status"], "approved")
+        self.assertEqual(services.CIRCUITO_PAGO.estado(), circuito.CERRADO)
+
+    def test_un_4xx_no_cuenta_como_falla(self):
+        self._responder(404)
+        for _ in range(5):
+            with self.assertRaises(MercadoPagoError):
+                services.obtener_pago("no-existe")
+        self.assertEqual(services.CIRCUITO_PAGO.estado(), circuito.CERRADO)
+
+
+@override_settings(MERCADOPAGO_ACCESS_TOKEN="TEST-token", TAREAS_SINCRONICAS=False)
+class ReconciliarPagosTests(TransactionTestCase):
+    """
+    Las consultas a Mercado Pago corren en hilos con su propia conexión a la
+    base (por el cortacircuitos): los pedidos tienen que estar confirmados.
+    """
+
+    def setUp(self):
+        usuario = User.objects.create_user("cliente")
+        self.pedidos = [
+            Order.objects.create(user=usuario, payment_provider="mercadopago", payment_reference=f"pref-{numero}")
+            for numero in range(4)
+        ]
+        self.reciente = Order.objects.create(
+            user=usuario, payment_provider="mercadopago", payment_reference="pref-reciente"
+        )
+        hace_una_hora = timezone.now() - timedelta(hours=1)
+        Order.objects.exclude(pk=self.reciente.pk).update(created_at=hace_una_hora)
+
+    def conciliar(self, servidor, *argumentos):
+        salida = StringIO()
+        with override_settings(MERCADOPAGO_API_URL=servidor.url):
+            call_command(
+                "reconciliar_pagos", "--lote", "2", "--por-segundo", "0", *argumentos,
+                stdout=salida, stderr=StringIO(),
+            )
+        return salida.getvalue()
+
+    def test_actualiza_los_pedidos_segun_sus_pagos(self):
+        aprobado, rechazado, reintentado, sin_pago = self.pedidos
+        with ServidorMercadoPagoFalso() as servidor:
+            servidor.agregar_pago("1", aprobado.pk, "approved")
+            servidor.agregar_pago("2", rechazado.pk, "rejected")
+            servidor.agregar_pago("3", reintentado.pk, "rejected")
+            servidor.agregar_pago("4", reintentado.pk, "approved")
+            servidor.agregar_pago("5", self.reciente.pk, "approved")
+            self.conciliar(servidor)
+            self.assertEqual(servidor.consultas, 4)
+
+        estados = dict(Order.objects.values_list("pk", "status"))
+        self.assertEqual(estados[aprobado.pk], OrderStatus.COMPLETED)
+        self.assertEqual(estados[rechazado.pk], OrderStatus.CANCELLED)
+        self.assertEqual(estados[reintentado.pk], OrderStatus.COMPLETED)
+        self.assertEqual(estados[sin_pago.pk], OrderStatus.PENDING)
+        self.assertEqual(estados[self.reciente.pk], OrderStatus.PENDING)
+        self.assertEqual(BackgroundJob.objects.count(), 3)
+
+    def test_dry_run_no_guarda_cambios(self):
+        with ServidorMercadoPagoFalso() as servidor:
+            servidor.agregar_pago("1", self.pedidos[0].pk, "approved")
+            salida = self.conciliar(servidor, "--dry-run")
+        self.assertIn(f"Pedido #{self.pedidos[0].pk}: pendiente -> Completado", salida)
+        self.assertFalse(Order.objects.exclude(status=OrderStatus.PENDING).exists())
+        self.assertFalse(BackgroundJob.objects.exists())
+
+    def test_libera_los_checkouts_cortados_antes_de_la_preferencia(self):
+        crear_catalogo(cantidad_por_categoria=1)
+        producto = Product.objects.first()
+        Product.objects.filter(pk=producto.pk).update(stock=5)
+        usuario = User.objects.get(username="cliente")
+        # Como el checkout: se marca para Mercado Pago, se descuenta el stock
+        # y el proceso muere antes de guardar la referencia de la preferencia.
+        cortado = Order.objects.create(user=usuario, payment_provider="mercadopago")
+        descontar_stock_y_crear_items(cortado, {producto.pk: 2})
+        # Cargado a mano en el admin: nunca descontó stock.
+        manual = Order.objects.create(user=usuario)
+        OrderItem.objects.create(order=manual, product=producto, quantity=2, price=producto.price)
+        Order.objects.filter(pk__in=[cortado.pk, manual.pk]).update(
+            created_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(Product.objects.get(pk=producto.pk).stock, 3)
+
+        with ServidorMercadoPagoFalso() as servidor:
+            salida = self.conciliar(servidor)
+
+        self.assertIn("1 sin pago iniciado liberados", salida)
+        self.assertEqual(Order.objects.get(pk=cortado.pk).status, OrderStatus.FAILED)
+        self.assertEqual(Order.objects.get(pk=manual.pk).status, OrderStatus.PENDING)
+        self.assertEqual(Product.objects.get(pk=producto.pk).stock, 5)
+
+
+class TotalesPedidoTests(TestCase):
+    def setUp(self):
+        crear_catalogo(cantidad_por_categoria=2)
+        self.usuario = User.objects.create_user("cliente", password="clave-segura-123")
+        self.pedido = Order.objects.create(user=self.usuario)
+        self.producto = Product.objects.first()
+
+    def test_las_lineas_mantienen_los_totales(self):
+        item = OrderItem.objects.create(
+            order=self.pedido, product=self.producto, quantity=3, price=Decimal("100.50")
+        )
+        self.pedido.refresh_from_db()
+        self.assertEqual((self.pedido.total_items, self.pedido.total_amount), (3, Decimal("301.50")))
+
+        item.quantity = 1
+        item.save()
+        self.pedido.refresh_from_db()
+        self.assertEqual((self.pedido.total_items, self.pedido.total_amount), (1, Decimal("100.50")))
+
+        item.delete()
+        self.pedido.refresh_from_db()
+        self.assertEqual((self.pedido.total_items, self.pedido.total_amount), (0, Decimal("0.00")))
+
+    def test_mis_pedidos_no_suma_las_lineas(self):
+        for _ in range(5):
+            pedido = Order.objects.create(user=self.usuario)
+            OrderItem.objects.create(order=pedido, product=self.producto, quantity=2, price=Decimal("10"))
+        self.client.force_login(self.usuario)
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(reverse("tienda_app:mis_pedidos"))
+        self.assertContains(respuesta, "$20,00")
+        self.assertFalse([c["sql"] for c in consultas.captured_queries if "SUM(" in c["sql"]])
+
+    def test_verificar_detecta_y_corrige_diferencias(self):
+        OrderItem.objects.create(order=self.pedido, product=self.producto, quantity=2, price=Decimal("10"))
+        Order.objects.filter(pk=self.pedido.pk).update(total_items=0, total_amount=Decimal("0"))
+
+        salida = StringIO()
+        call_command("verificar_totales_pedidos", stdout=salida)
+        self.assertIn(f"Pedido #{self.pedido.pk}", salida.getvalue())
+
+        call_command("verificar_totales_pedidos", "--corregir", stdout=StringIO())
+        self.pedido.refresh_from_db()
+        self.assertEqual((self.pedido.total_items, self.pedido.total_amount), (2, Decimal("20.00")))
+        salida = StringIO()
+        call_command("verificar_totales_pedidos", stdout=salida)
+        self.assertIn("al día", salida.getvalue())
+
+
+class MisPedidosTests(TestCase):
+    def setUp(self):
+        crear_catalogo(cantidad_por_categoria=3)
+        self.usuario = User.objects.create_user("mayorista", password="clave-segura-123")
+        productos = list(Product.objects.all()[:5])
+        for numero in range(25):
+            pedido = Order.objects.create(
+                user=self.usuario,
+                status=OrderStatus.COMPLETED if numero % 5 else OrderStatus.CANCELLED,
+            )
+            OrderItem.objects.bulk_create(
+                OrderItem(order=pedido, product=producto, quantity=1, price=producto.price)
+                for producto in productos
+            )
+        self.client.force_login(self.usuario)
+        self.url = reverse("tienda_app:mis_pedidos")
+
+    def test_pagina_por_cursor_con_consultas_constantes(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(self.url)
+        pedidos = respuesta.context["pedidos"]
+        self.assertEqual(len(pedidos), 20)
+        self.assertEqual(len(pedidos[0].primeros_items), 3)
+        self.assertEqual(pedidos[0].items_restantes, 2)
+        self.assertContains(respuesta, "y 2 más")
+        # Sesión, usuario, página de pedidos y primeras líneas (más las del
+        # carrito y los mensajes), sin importar el tamaño del historial.
+        self.assertLessEqual(len(consultas), 6)
+
+        siguiente = self.client.get(self.url + respuesta.context["pagina_siguiente"])
+        self.assertEqual(len(siguiente.context["pedidos"]), 5)
+        self.assertIsNone(siguiente.context["pagina_siguiente"])
+        vistos = {pedido.pk for pedido in pedidos} | {pedido.pk for pedido in siguiente.context["pedidos"]}
+        self.assertEqual(len(vistos), 25)
+
+    def test_filtra_por_estado(self):
+        respuesta = self.client.get(self.url, {"estado": OrderStatus.CANCELLED})
+        self.assertEqual(len(respuesta.context["pedidos"]), 5)
+        self.assertTrue(all(p.status == OrderStatus.CANCELLED for p in respuesta.context["pedidos"]))
+
+        respuesta = self.client.get(self.url, {"estado": "inventado"})
+        self.assertEqual(respuesta.context["estado"], "")
+
+
+class PlanesDeConsultaTests(TestCase):
+    """
+    Las consultas principales del catálogo, de "mis pedidos" y del admin de
+    pedidos tienen que resolverse con un índice: si el plan de SQLite pasa a
+    recorrer la tabla entera u ordenar en una tabla temporal, falla.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        crear_catalogo(cantidad_por_categoria=5)
+        Product.objects.filter(name__endswith="modelo 0").update(is_active=False)
+        cls.usuario = User.objects.create_user("comprador", password="clave-segura-123")
+        cls.admin = User.objects.create_superuser("dueno", "dueno@example.com", "clave-segura-123")
+        for numero in range(30):
+            Order.objects.create(
+                user=cls.admin if numero % 3 else cls.usuario,
+                status=OrderStatus.COMPLETED if numero % 2 else OrderStatus.PENDING,
+            )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def setUp(self):
+        caches[cache_paginas.ALIAS_CACHE].clear()
+
+    def planes(self, url, tabla, parametros=None):
+        """
+        Pide la URL y devuelve el plan de cada SELECT sobre `tabla`.
+        """
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url, parametros or {})
+        self.assertEqual(respuesta.status_code, 200)
+        planes = []
+        with connection.cursor() as cursor:
+            for consulta in consultas.captured_queries:
+                sql = consulta["sql"]
+                if sql.startswith("SELECT") and f'FROM "{tabla}"' in sql:
+                    cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+                    planes.append((sql, [fila[-1] for fila in cursor.fetchall()]))
+        self.assertTrue(planes, f"Ninguna consulta sobre {tabla} en {url}")
+        return planes
+
+    def assertUsaIndices(self, planes, tabla):
+        for sql, pasos in planes:
+            for paso in pasos:
+                self.assertNotEqual(paso, f"SCAN {tabla}", f"Recorre toda la tabla:\n{sql}\n{pasos}")
+                self.assertNotIn("TEMP B-TREE", paso, f"Ordena sin índice:\n{sql}\n{pasos}")
+
+    def test_catalogo(self):
+        url = reverse("tienda_app:home")
+        for parametros in ({}, {"categoria": "calzado"}):
+            planes = self.planes(url, "tienda_app_product", parametros)
+            self.assertUsaIndices(planes, "tienda_app_product")
+            self.assertIn("producto_activo", " ".join(planes[-1][1]))
+
+    def test_mis_pedidos(self):
+        self.client.force_login(self.usuario)
+        url = reverse("tienda_app:mis_pedidos")
+        for parametros in ({}, {"estado": OrderStatus.PENDING}):
+            planes = self.planes(url, "tienda_app_order", parametros)
+            self.assertUsaIndices(planes, "tienda_app_order")
+            self.assertIn("pedido_usuario_fecha_idx", " ".join(planes[-1][1]))
+
+    def test_admin_de_pedidos(self):
+        self.client.force_login(self.admin)
+        url = reverse("admin:tienda_app_order_changelist")
+        hoy = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        for parametros, indice in (
+            ({"status__exact": OrderStatus.PENDING}, "pedido_estado_fecha_idx"),
+            (
+                {"created_at__gte": str(hoy), "created_at__lt": str(hoy + timedelta(days=1))},
+                "pedido_fecha_idx",
+            ),
+        ):
+            planes = self.planes(url, "tienda_app_order", parametros)
+            self.assertUsaIndices(planes, "tienda_app_order")
+            self.assertIn(indice, " ".join(" ".join(pasos) for _, pasos in planes))
@@ -3,15 +3,19 @@ from __future__ import annotations
 from django.contrib.auth.views import LogoutView
 from django.urls import path
 
-from . import views
+from . import api, views
 
 app_name = "tienda_app"
 
 urlpatterns = [
     path("", views.vista_inicio, name="home"),
+    path("catalogo/", views.vista_catalogo, name="catalogo"),
+    path("catalogo/pagina/", views.vista_catalogo_fragmento, name="catalogo_pagina"),
     path("producto/<slug:slug>/", views.vista_detalle_producto, name="product_detail"),
     path("carrito/", views.ver_carrito, name="ver_carrito"),
+    path("carrito/resumen/", views.resumen_carrito, name="resumen_carrito"),
     path("carrito/agregar/<slug:slug>/", views.agregar_al_carrito, name="agregar_al_carrito"),
+    path("carrito/actualizar/<int:pk>/", views.actualizar_carrito, name="actualizar_carrito"),
     path("carrito/eliminar/<str:pk>/", views.eliminar_del_carrito, name="eliminar_del_carrito"),
     path("carrito/vaciar/", views.vaciar_carrito, name="vaciar_carrito"),
     path("checkout/", views.checkout, name="checkout"),
@@ -25,5 +29,12 @@ urlpatterns = [
         views.mercadopago_resultado,
         name="mercadopago_resultado",
     ),
+    path("pago/mercadopago/webhook/", views.mercadopago_webhook, name="mercadopago_webhook"),
+    path("metricas/", views.vista_metricas, name="metricas"),
+    path("api/productos/", api.lista_productos, name="api_productos"),
+    path("api/productos/exportar/", api.exportar_productos, name="api_exportar_productos"),
+    path("api/productos/<slug:slug>/", api.detalle_producto, name="api_producto"),
+    path("api/categorias/", api.lista_categorias, name="api_categorias"),
+    path("api/autocompletar/", api.sugerencias, name="api_autocompletar"),
 ]
 
@@ -1,243 +1,535 @@
 from __future__ import annotations
 
 from decimal import Decimal
-from typing import Dict
+from typing import Any, Dict, Optional
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import authenticate, login
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import AuthenticationForm
-from django.db import transaction
-from django.db.models import Q
-from django.http import HttpRequest, HttpResponse
+from django.contrib.messages.utils import get_level_tags
+from django.db import IntegrityError, transaction
+from django.http import HttpRequest, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 
+from . import cache_tarjetas, carrito as carrito_de_compras, circuito, facetas, metricas, pagos, reservas, tareas
+from .cache_paginas import cache_pagina_anonima
+from .catalogo import filtrar_productos, tamano_pagina
+from .condicional import condicional_catalogo, condicional_producto
 from .formularios import (
     FormularioCheckout,
     FormularioIngreso,
     FormularioRegistroCliente,
 )
-from .models import Category, Order, OrderItem, OrderStatus, Product
+from .models import Category, FacetKind, Order, OrderStatus, PaymentNotification, Product
+from .paginacion import paginar_por_cursor
+from .pedidos import (
+    StockInsuficienteError,
+    con_cantidad_de_lineas,
+    descontar_stock_y_crear_items,
+    liberar_pedido_sin_pago,
+    primeros_items,
+)
 from .services import (
+    TITULO_PAGO_ACTUALIZADO,
     MercadoPagoError,
+    MercadoPagoNoDisponibleError,
     crear_preferencia_para_pedido,
-    enviar_notificacion_telegram,
+    mercadopago_disponible,
     obtener_pago,
 )
 
 
-def _obtener_carrito(request: HttpRequest) -> Dict[str, Dict[str, Decimal]]:
+# Historial de pedidos: pedidos por página y líneas que se muestran de cada uno.
+PEDIDOS_POR_PAGINA = 20
+ITEMS_POR_PEDIDO = 3
+
+MENSAJE_PAGOS_NO_DISPONIBLES = (
+    "Los pagos con Mercado Pago no están disponibles en este momento. "
+    "Tu carrito se conservó: probá de nuevo en unos minutos."
+)
+MENSAJE_RESERVADO_POR_OTROS = (
+    "Las últimas unidades están reservadas en otros carritos. Probá de nuevo en unos minutos."
+)
+
+
+# Columnas que usan las tarjetas del catálogo y el detalle; el resto queda diferido.
+CAMPOS_TARJETA_PRODUCTO = (
+    "name",
+    "slug",
+    "description",
+    "price",
+    "stock",
+    "image_url",
+    "is_active",
+    "updated_at",
+    "category__slug",
+)
+CAMPOS_DETALLE_PRODUCTO = CAMPOS_TARJETA_PRODUCTO + ("category__name",)
+
+
+def _url_con_cursor(request: HttpRequest, nombre_url: str, cursor: str) -> str:
+    parametros = request.GET.copy()
+    parametros["cursor"] = cursor
+    return f"{reverse(nombre_url)}?{parametros.urlencode()}"
+
+
+def _url_filtro(request: HttpRequest, nombre_url: str, **cambios: Optional[str]) -> str:
+    """
+    URL del listado con los filtros actuales más los cambios indicados (None
+    quita el filtro). Siempre vuelve a la primera página.
     """
-    Recupera el carrito de compras guardado en la sesión del usuario.
-    Si no existe, inicializa una estructura vacía.
+    parametros = request.GET.copy()
+    parametros.pop("cursor", None)
+    for clave, valor in cambios.items():
+        if valor:
+            parametros[clave] = valor
+        else:
+            parametros.pop(clave, None)
+    consulta = parametros.urlencode()
+    return f"{reverse(nombre_url)}?{consulta}" if consulta else reverse(nombre_url)
+
+
+def _filtros_catalogo(request: HttpRequest) -> Dict[str, Any]:
     """
-    if "carrito" not in request.session:
-        request.session["carrito"] = {}
-    return request.session["carrito"]
+    Botones de categoría y de rango de precio con sus cantidades, leídas de
+    las facetas precalculadas (una sola consulta, sin COUNT por categoría).
+    """
+    conteos = facetas.conteos()
+    por_categoria = conteos[FacetKind.CATEGORY.value]
+    por_precio = conteos[FacetKind.PRICE.value]
+
+    def opcion(parametro: str, valor: Optional[str], etiqueta: str, cantidad: int):
+        return {
+            "valor": valor or "",
+            "etiqueta": etiqueta,
+            "cantidad": cantidad,
+            "url": _url_filtro(request, "tienda_app:home", **{parametro: valor}),
+            "url_fragmento": _url_filtro(request, "tienda_app:catalogo", **{parametro: valor}),
+        }
+
+    total = sum(por_categoria.values())
+
+    categorias = [
+        opcion("categoria", categoria.slug, categoria.name, por_categoria.get(str(categoria.pk), 0))
+        for categoria in Category.objects.only("name", "slug")
+    ]
+    rangos = [
+        opcion("precio", rango.clave, rango.etiqueta, por_precio.get(rango.clave, 0))
+        for rango in facetas.rangos_de_precio()
+    ]
+    return {
+        "filtro_todas_categorias": opcion("categoria", None, "Todos", total),
+        "filtros_categoria": categorias,
+        "filtro_todos_precios": opcion("precio", None, "Todos los precios", total),
+        "filtros_precio": rangos,
+    }
 
 
-def vista_inicio(request: HttpRequest) -> HttpResponse:
+def _pagina_catalogo(request: HttpRequest) -> Dict[str, Any]:
     """
-    Página principal de la tienda. Permite filtrar por categoría y por texto.
+    Arma la página del catálogo según los filtros del request. El costo es
+    constante: sólo se leen los productos de la página pedida.
     """
-    categorias = Category.objects.all()
-    productos = Product.objects.filter(is_active=True)
+    productos = (
+        Product.objects.filter(is_active=True)
+        .select_related("category")
+        .only(*CAMPOS_TARJETA_PRODUCTO)
+    )
 
-    categoria_slug = request.GET.get("categoria")
-    if categoria_slug:
-        productos = productos.filter(category__slug=categoria_slug)
+    productos, orden = filtrar_productos(productos, request.GET)
+    pagina = paginar_por_cursor(
+        productos, request.GET.get("cursor"), tamano_pagina(request.GET), orden
+    )
 
-    busqueda = request.GET.get("buscar")
-    if busqueda:
-        productos = productos.filter(
-            Q(name__icontains=busqueda) | Q(description__icontains=busqueda)
+    contexto: Dict[str, Any] = {
+        "productos": pagina,
+        "tarjetas": cache_tarjetas.tarjetas_html(request, pagina),
+        "categoria_actual": request.GET.get("categoria", ""),
+        "precio_actual": request.GET.get("precio", ""),
+        "termino_busqueda": request.GET.get("buscar", ""),
+        "es_primera_pagina": not request.GET.get("cursor"),
+        "url_siguiente": None,
+        "url_fragmento_siguiente": None,
+    }
+    if pagina.hay_mas:
+        contexto["url_siguiente"] = _url_con_cursor(
+            request, "tienda_app:home", pagina.cursor_siguiente
         )
+        contexto["url_fragmento_siguiente"] = _url_con_cursor(
+            request, "tienda_app:catalogo_pagina", pagina.cursor_siguiente
+        )
+    return contexto
 
-    contexto = {
-        "categorias": categorias,
-        "productos": productos,
-        "categoria_actual": categoria_slug,
-        "termino_busqueda": busqueda or "",
-    }
+
+@condicional_catalogo
+@cache_pagina_anonima
+def vista_inicio(request: HttpRequest) -> HttpResponse:
+    """
+    Página principal de la tienda. Permite filtrar por categoría y por texto.
+    """
+    contexto = _pagina_catalogo(request)
+    contexto.update(_filtros_catalogo(request))
     return render(request, "tienda_app/inicio.html", contexto)
 
 
+@condicional_catalogo
+@cache_pagina_anonima
+def vista_catalogo(request: HttpRequest) -> HttpResponse:
+    """
+    Devuelve la barra de filtros y la primera página del catálogo, para
+    cambiar de categoría o de rango de precio sin recargar la página.
+    """
+    contexto = _pagina_catalogo(request)
+    contexto.update(_filtros_catalogo(request))
+    return render(request, "tienda_app/fragmentos/catalogo.html", contexto)
+
+
+@condicional_catalogo
+@cache_pagina_anonima
+def vista_catalogo_fragmento(request: HttpRequest) -> HttpResponse:
+    """
+    Devuelve sólo las tarjetas de la página pedida, para el scroll infinito.
+    """
+    return render(request, "tienda_app/fragmentos/productos.html", _pagina_catalogo(request))
+
+
+@condicional_producto
+@cache_pagina_anonima
 def vista_detalle_producto(request: HttpRequest, slug: str) -> HttpResponse:
     """
     Muestra el detalle de un producto específico para facilitar la compra.
     """
-    producto = get_object_or_404(Product, slug=slug, is_active=True)
+    producto = get_object_or_404(
+        Product.objects.select_related("category").only(*CAMPOS_DETALLE_PRODUCTO),
+        slug=slug,
+        is_active=True,
+    )
     return render(request, "tienda_app/detalle_producto.html", {"producto": producto})
 
 
-@login_required
-def agregar_al_carrito(request: HttpRequest, slug: str) -> HttpResponse:
+def _pide_json(request: HttpRequest) -> bool:
+    return "application/json" in request.headers.get("Accept", "")
+
+
+def _pide_fragmento(request: HttpRequest) -> bool:
+    return request.headers.get("X-Requested-With") == "XMLHttpRequest"
+
+
+def _linea_json(linea: carrito_de_compras.LineaCarrito) -> Dict[str, Any]:
+    return {
+        "producto": linea.producto.pk,
+        "nombre": linea.producto.name,
+        "cantidad": linea.cantidad,
+        "precio": f"{linea.precio:.2f}",
+        "subtotal": f"{linea.subtotal:.2f}",
+        "stock": linea.producto.stock,
+        "problema": linea.problema,
+    }
+
+
+def _contexto_carrito(lineas) -> Dict[str, Any]:
+    return {
+        "items_carrito": lineas,
+        "total": sum((linea.subtotal for linea in lineas if linea.producto.is_active), Decimal("0.00")),
+        "hay_problemas": any(linea.problema for linea in lineas),
+    }
+
+
+def _respuesta_carrito(
+    request: HttpRequest,
+    nivel: int,
+    mensaje: str,
+    destino: str,
+    linea: Optional[carrito_de_compras.LineaCarrito] = None,
+    status: int = 200,
+) -> HttpResponse:
     """
-    Agrega un producto al carrito. El stock es validado antes de sumar.
+    Responde una acción del carrito en un solo pedido: JSON con la línea y
+    los totales, o el carrito como fragmento HTML para reemplazarlo en la
+    página. El formulario sin JavaScript recibe el mensaje y la redirección.
     """
-    producto = get_object_or_404(Product, slug=slug, is_active=True)
-    cantidad = int(request.POST.get("cantidad", 1))
+    if _pide_json(request):
+        resumen = carrito_de_compras.obtener(request).resumen()
+        return JsonResponse(
+            {
+                "mensaje": mensaje,
+                "error": nivel == messages.ERROR,
+                "linea": _linea_json(linea) if linea else None,
+                "carrito": {"cantidad": resumen.unidades, "monto": f"{resumen.monto:.2f}"},
+            },
+            status=status,
+        )
+    if _pide_fragmento(request):
+        contexto = _contexto_carrito(carrito_de_compras.obtener(request).lineas())
+        contexto.update({"mensaje": mensaje, "nivel": get_level_tags()[nivel]})
+        return render(request, "tienda_app/fragmentos/carrito.html", contexto, status=status)
+    messages.add_message(request, nivel, mensaje)
+    return redirect(destino)
+
 
-    if cantidad < 1:
-        messages.error(request, "La cantidad debe ser al menos 1.")
-        return redirect(producto.get_absolute_url())
+def _cantidad_pedida(request: HttpRequest, por_defecto: Optional[int] = None) -> Optional[int]:
+    try:
+        return int(request.POST.get("cantidad", por_defecto))
+    except (TypeError, ValueError):
+        return None
 
-    if cantidad > producto.stock:
-        messages.error(request, "No hay stock suficiente para la cantidad solicitada.")
-        return redirect(producto.get_absolute_url())
 
-    carrito = _obtener_carrito(request)
-    clave = str(producto.pk)
+def _sin_disponible(producto: Product, cantidad: int, por_defecto: str) -> str:
+    """
+    Mensaje cuando no alcanza lo disponible: si el stock alcanzaría pero está
+    reservado en otros carritos, se avisa que puede liberarse pronto.
+    """
+    if cantidad <= producto.stock:
+        return MENSAJE_RESERVADO_POR_OTROS
+    return por_defecto
 
-    item_actual = carrito.get(clave, {"cantidad": 0})
-    nueva_cantidad = item_actual["cantidad"] + cantidad
 
-    if nueva_cantidad > producto.stock:
-        messages.error(request, "Ya tienes la cantidad máxima disponible en el carrito.")
-        return redirect(producto.get_absolute_url())
+@require_POST
+def agregar_al_carrito(request: HttpRequest, slug: str) -> HttpResponse:
+    """
+    Agrega un producto al carrito y reserva las unidades por unos minutos.
+    Se valida contra el stock menos lo reservado en otros carritos. No hace
+    falta haber ingresado: el carrito del visitante se suma al del cliente
+    cuando ingresa (los visitantes reservan hasta un tope de unidades).
+    """
+    producto = get_object_or_404(Product.objects.only(*carrito_de_compras.CAMPOS_LINEA), slug=slug, is_active=True)
+    cantidad = _cantidad_pedida(request, por_defecto=1)
 
-    carrito[clave] = {
-        "nombre": producto.name,
-        "precio": float(producto.price),
-        "cantidad": nueva_cantidad,
-        "imagen": producto.image_url,
-        "slug": producto.slug,
-    }
-    request.session.modified = True
-    messages.success(request, f"{producto.name} se agregó al carrito.")
-    
+    if cantidad is None or cantidad < 1:
+        return _respuesta_carrito(
+            request, messages.ERROR, "La cantidad debe ser al menos 1.", producto.get_absolute_url(), status=400
+        )
+
+    carrito = carrito_de_compras.obtener(request)
+    nueva_cantidad = carrito.cantidad(producto.pk) + cantidad
+    # Lo que supera el stock se rechaza sin escribir ninguna reserva.
+    disponible = producto.stock
+    if nueva_cantidad <= disponible:
+        disponible = reservas.reservar_si_alcanza(
+            reservas.titular(request), producto.pk, nueva_cantidad, maximo=reservas.maximo_del_titular(request)
+        )
+
+    if cantidad > disponible:
+        return _respuesta_carrito(
+            request,
+            messages.ERROR,
+            _sin_disponible(producto, cantidad, "No hay stock suficiente para la cantidad solicitada."),
+            producto.get_absolute_url(),
+            status=409,
+        )
+    if nueva_cantidad > disponible:
+        return _respuesta_carrito(
+            request,
+            messages.ERROR,
+            _sin_disponible(producto, nueva_cantidad, "Ya tienes la cantidad máxima disponible en el carrito."),
+            producto.get_absolute_url(),
+            status=409,
+        )
+
+    carrito.fijar(producto.pk, nueva_cantidad)
     # Si viene el parámetro seguir_comprando, redirigir a la página principal
-    if request.GET.get("seguir_comprando") == "1":
-        return redirect("tienda_app:home")
-    
-    return redirect("tienda_app:ver_carrito")
+    destino = "tienda_app:home" if request.GET.get("seguir_comprando") == "1" else "tienda_app:ver_carrito"
+    return _respuesta_carrito(
+        request,
+        messages.SUCCESS,
+        f"{producto.name} se agregó al carrito.",
+        destino,
+        linea=carrito_de_compras.LineaCarrito(producto, nueva_cantidad, disponible),
+    )
 
 
-@login_required
-def ver_carrito(request: HttpRequest) -> HttpResponse:
+@require_POST
+def actualizar_carrito(request: HttpRequest, pk: int) -> HttpResponse:
     """
-    Visualiza el estado actual del carrito en la sesión.
+    Cambia la cantidad de una línea del carrito y su reserva; con 0 la quita.
     """
-    carrito = _obtener_carrito(request)
-    productos = []
-    total = Decimal("0.00")
+    producto = get_object_or_404(Product.objects.only(*carrito_de_compras.CAMPOS_LINEA), pk=pk)
+    carrito = carrito_de_compras.obtener(request)
+    cantidad = _cantidad_pedida(request)
 
-    for pk, datos in carrito.items():
-        subtotal = Decimal(datos["precio"]) * datos["cantidad"]
-        total += subtotal
-        productos.append(
-            {
-                "pk": pk,
-                "nombre": datos["nombre"],
-                "precio": Decimal(datos["precio"]),
-                "cantidad": datos["cantidad"],
-                "imagen": datos["imagen"],
-                "subtotal": subtotal,
-                "slug": datos["slug"],
-            }
+    if cantidad is None or cantidad < 0:
+        return _respuesta_carrito(
+            request, messages.ERROR, "La cantidad no es válida.", "tienda_app:ver_carrito", status=400
+        )
+    if cantidad == 0:
+        carrito.fijar(producto.pk, 0)
+        reservas.liberar(reservas.titular(request, crear=False), [producto.pk])
+        return _respuesta_carrito(
+            request, messages.INFO, f"{producto.name} fue retirado del carrito.", "tienda_app:ver_carrito"
+        )
+    if producto.is_active and cantidad <= producto.stock:
+        disponible = reservas.reservar_si_alcanza(
+            reservas.titular(request), producto.pk, cantidad, maximo=reservas.maximo_del_titular(request)
+        )
+    else:
+        disponible = reservas.disponibles([producto], reservas.titular(request, crear=False))[producto.pk]
+    if not producto.is_active or cantidad > disponible:
+        if not producto.is_active:
+            mensaje = f"{producto.name} ya no está a la venta."
+        else:
+            mensaje = _sin_disponible(producto, cantidad, f"Sólo quedan {producto.stock} unidades de {producto.name}.")
+        actual = carrito.cantidad(producto.pk)
+        return _respuesta_carrito(
+            request,
+            messages.ERROR,
+            mensaje,
+            "tienda_app:ver_carrito",
+            linea=carrito_de_compras.LineaCarrito(producto, actual, disponible) if actual else None,
+            status=409,
         )
 
-    return render(
+    carrito.fijar(producto.pk, cantidad)
+    return _respuesta_carrito(
         request,
-        "tienda_app/carrito.html",
-        {"items_carrito": productos, "total": total},
+        messages.SUCCESS,
+        f"Se actualizó la cantidad de {producto.name}.",
+        "tienda_app:ver_carrito",
+        linea=carrito_de_compras.LineaCarrito(producto, cantidad, disponible),
     )
 
 
-@login_required
+def resumen_carrito(request: HttpRequest) -> JsonResponse:
+    """
+    Cantidad y monto del carrito para el contador de la barra de navegación.
+    Se pide aparte para que las páginas del catálogo no dependan de la sesión.
+    """
+    resumen = carrito_de_compras.obtener(request).resumen()
+    respuesta = JsonResponse({"cantidad": resumen.unidades, "monto": f"{resumen.monto:.2f}"})
+    respuesta["Cache-Control"] = "private, no-store"
+    return respuesta
+
+
+def ver_carrito(request: HttpRequest) -> HttpResponse:
+    """
+    Muestra el carrito con el precio y el stock actuales de cada producto,
+    leídos en una sola consulta.
+    """
+    lineas = carrito_de_compras.obtener(request).lineas()
+    return render(request, "tienda_app/carrito.html", _contexto_carrito(lineas))
+
+
 def eliminar_del_carrito(request: HttpRequest, pk: str) -> HttpResponse:
     """
     Elimina un producto del carrito.
     """
-    carrito = _obtener_carrito(request)
-    if pk in carrito:
-        producto = carrito.pop(pk)
-        request.session.modified = True
-        messages.info(request, f"{producto['nombre']} fue retirado del carrito.")
-    return redirect("tienda_app:ver_carrito")
+    carrito = carrito_de_compras.obtener(request)
+    producto_id = int(pk) if pk.isdigit() else None
+    if producto_id is None or not carrito.cantidad(producto_id):
+        return _respuesta_carrito(
+            request, messages.INFO, "El producto no estaba en el carrito.", "tienda_app:ver_carrito"
+        )
+    carrito.fijar(producto_id, 0)
+    reservas.liberar(reservas.titular(request, crear=False), [producto_id])
+    nombre = Product.objects.filter(pk=producto_id).values_list("name", flat=True).first()
+    return _respuesta_carrito(
+        request, messages.INFO, f"{nombre or 'El producto'} fue retirado del carrito.", "tienda_app:ver_carrito"
+    )
 
 
-@login_required
 def vaciar_carrito(request: HttpRequest) -> HttpResponse:
     """
-    Vacía el carrito por completo.
+    Vacía el carrito por completo y libera sus reservas.
     """
-    request.session["carrito"] = {}
-    request.session.modified = True
-    messages.info(request, "Se vació el carrito.")
-    return redirect("tienda_app:ver_carrito")
+    carrito_de_compras.obtener(request).vaciar()
+    reservas.liberar(reservas.titular(request, crear=False))
+    return _respuesta_carrito(request, messages.INFO, "Se vació el carrito.", "tienda_app:ver_carrito")
 
 
 @login_required
-@transaction.atomic
 def checkout(request: HttpRequest) -> HttpResponse:
     """
     Procesa la compra generando un pedido en base a los productos del carrito.
+    Primero se confirma el pedido con el stock descontado (una transacción
+    corta) y recién después se llama a Mercado Pago, fuera de la transacción.
+    Si el pago no se puede iniciar, el pedido se marca como fallido y el
+    stock se devuelve. Al entrar se revisa el carrito y se extienden sus
+    reservas mientras se completan los datos.
     """
-    carrito = _obtener_carrito(request)
+    carrito = carrito_de_compras.obtener(request)
     if not carrito:
         messages.warning(request, "Tu carrito está vacío.")
         return redirect("tienda_app:home")
 
+    if request.method != "POST":
+        lineas = carrito.lineas()
+        minutos = getattr(settings, "RESERVAS_MINUTOS_CHECKOUT", 20)
+        # Las reservas se extienden línea por línea con el control bajo
+        # bloqueo: la revisión de `lineas()` no bloquea y otro comprador puede
+        # haber reservado lo último mientras tanto.
+        if any(linea.problema for linea in lineas) or any(
+            reservas.reservar_si_alcanza(carrito.titular, linea.producto.pk, linea.cantidad, minutos) < linea.cantidad
+            for linea in lineas
+        ):
+            messages.error(request, "Hay productos de tu carrito sin stock suficiente. Revisalos antes de pagar.")
+            return redirect("tienda_app:ver_carrito")
+
+    if request.method == "POST" and not mercadopago_disponible():
+        # Con el circuito abierto no se reserva stock para un pago que no va
+        # a poder iniciarse; el carrito queda como está.
+        messages.error(request, MENSAJE_PAGOS_NO_DISPONIBLES)
+        return redirect("tienda_app:ver_carrito")
+
     if request.method == "POST":
         formulario = FormularioCheckout(request.POST)
         if formulario.is_valid():
             pedido: Order = formulario.save(commit=False)
             pedido.user = request.user
             pedido.status = OrderStatus.PENDING
-            pedido.save()
-
-            for pk, datos in carrito.items():
-                producto = get_object_or_404(Product, pk=pk)
-                if datos["cantidad"] > producto.stock:
-                    messages.error(
-                        request,
-                        f"No hay stock suficiente de {producto.name}. Ajustá tu carrito.",
-                    )
-                    transaction.set_rollback(True)
-                    return redirect("tienda_app:ver_carrito")
-                producto.stock -= datos["cantidad"]
-                producto.save()
-                OrderItem.objects.create(
-                    order=pedido,
-                    product=producto,
-                    quantity=datos["cantidad"],
-                    price=producto.price,
-                )
+            # Se marca junto con el descuento de stock: un pedido de Mercado
+            # Pago sin referencia es un checkout que se cortó, y la conciliación
+            # lo libera. Los cargados a mano no tienen proveedor y no se tocan.
+            pedido.payment_provider = "mercadopago"
+
+            try:
+                with transaction.atomic():
+                    pedido.save()
+                    descontar_stock_y_crear_items(pedido, carrito.cantidades(), carrito.titular)
+            except StockInsuficienteError as exc:
+                messages.error(request, f"{exc} Ajustá tu carrito.")
+                return redirect("tienda_app:ver_carrito")
 
             try:
                 preference = crear_preferencia_para_pedido(pedido, request)
                 init_point = preference.get("init_point") or preference.get("sandbox_init_point")
                 if not init_point:
                     raise MercadoPagoError("Mercado Pago no devolvió una URL válida para continuar con el pago.")
+
+                pedido.payment_reference = preference.get("id", "")
+                with transaction.atomic():
+                    pedido.save(update_fields=["payment_reference"])
+                    # La notificación a Telegram sale desde la cola, fuera del request.
+                    tareas.encolar("telegram.notificar_pedido", pedido_id=pedido.pk)
+            except MercadoPagoNoDisponibleError:
+                liberar_pedido_sin_pago(pedido)
+                messages.error(request, MENSAJE_PAGOS_NO_DISPONIBLES)
+                return redirect("tienda_app:ver_carrito")
             except MercadoPagoError as exc:
-                transaction.set_rollback(True)
+                liberar_pedido_sin_pago(pedido)
                 messages.error(
                     request,
                     f"No pudimos iniciar el pago con Mercado Pago. {exc}",
                 )
                 return redirect("tienda_app:ver_carrito")
-
-            pedido.payment_provider = "mercadopago"
-            pedido.payment_reference = preference.get("id", "")
-            pedido.save(update_fields=["payment_provider", "payment_reference"])
-
-            # Enviar notificación a Telegram
-            try:
-                enviar_notificacion_telegram(pedido)
             except Exception:
-                # No fallar el checkout si falla la notificación
-                pass
+                # Cualquier otro error (de red sin mapear, respuesta inesperada,
+                # base bloqueada) también devuelve el stock en el momento, sin
+                # esperar a que la conciliación lo encuentre sin referencia.
+                liberar_pedido_sin_pago(pedido)
+                raise
 
-            request.session["carrito"] = {}
-            request.session.modified = True
+            carrito.vaciar()
             messages.info(request, "Te redirigimos a Mercado Pago para completar el pago.")
             return redirect(init_point)
     else:
         formulario = FormularioCheckout()
 
-    total = sum(Decimal(item["precio"]) * item["cantidad"] for item in carrito.values())
+    _, total = carrito.totales()
     return render(
         request,
         "tienda_app/checkout.html",
@@ -257,15 +549,39 @@ def detalle_pedido(request: HttpRequest, pk: int) -> HttpResponse:
 @login_required
 def mis_pedidos(request: HttpRequest) -> HttpResponse:
     """
-    Muestra todos los pedidos del usuario autenticado.
+    Historial de pedidos del usuario, paginado por cursor sobre (fecha, id)
+    y con un filtro opcional por estado. Cada página cuesta lo mismo sin
+    importar cuántos pedidos tenga el usuario.
     """
+    pedidos = con_cantidad_de_lineas(Order.objects.filter(user=request.user))
+    estado = request.GET.get("estado", "")
+    if estado in OrderStatus.values:
+        pedidos = pedidos.filter(status=estado)
+    else:
+        estado = ""
 
-    pedidos = (
-        Order.objects.filter(user=request.user)
-        .prefetch_related("items__product")
-        .order_by("-created_at")
+    pagina = paginar_por_cursor(
+        pedidos, request.GET.get("cursor"), PEDIDOS_POR_PAGINA, ("-created_at", "-pk")
+    )
+    primeros_items(pagina.objetos, ITEMS_POR_PEDIDO)
+
+    siguiente = None
+    if pagina.hay_mas:
+        parametros = request.GET.copy()
+        parametros["cursor"] = pagina.cursor_siguiente
+        siguiente = f"?{parametros.urlencode()}"
+
+    return render(
+        request,
+        "tienda_app/mis_pedidos.html",
+        {
+            "pedidos": pagina.objetos,
+            "estado": estado,
+            "estados": OrderStatus.choices,
+            "pagina_siguiente": siguiente,
+            "es_primera_pagina": not request.GET.get("cursor"),
+        },
     )
-    return render(request, "tienda_app/mis_pedidos.html", {"pedidos": pedidos})
 
 
 @login_required
@@ -297,23 +613,71 @@ def mercadopago_resultado(request: HttpRequest) -> HttpResponse:
     estado = (pago or {}).get("status") or estado_reportado
 
     if estado == "approved":
-        pedido.status = OrderStatus.COMPLETED
         mensaje = "¡Pago aprobado! Tu pedido quedó confirmado."
         nivel = messages.SUCCESS
-    elif estado in {"pending", "in_process"}:
-        pedido.status = OrderStatus.PENDING
+    elif estado in pagos.ESTADOS_PENDIENTES:
         mensaje = "El pago quedó pendiente. Te avisaremos cuando se acredite."
         nivel = messages.INFO
     else:
-        pedido.status = OrderStatus.CANCELLED
         mensaje = "El pago fue cancelado o rechazado. Intentalo nuevamente."
         nivel = messages.WARNING
 
-    pedido.save(update_fields=["status"])
+    # El webhook puede haber actualizado el pedido antes: sólo se notifica
+    # si este retorno cambia el estado.
+    with transaction.atomic():
+        if pagos.actualizar_pedido(pedido.pk, estado):
+            tareas.encolar(
+                "telegram.notificar_pedido",
+                pedido_id=pedido.pk,
+                titulo=TITULO_PAGO_ACTUALIZADO,
+            )
     messages.add_message(request, nivel, mensaje)
     return redirect("tienda_app:detalle_pedido", pk=pedido.pk)
 
 
+@csrf_exempt
+@require_POST
+def mercadopago_webhook(request: HttpRequest) -> HttpResponse:
+    """
+    Recibe los avisos de Mercado Pago. Sólo guarda el aviso y encola su
+    procesamiento, sin llamar a la API: responde enseguida y los reenvíos
+    del mismo aviso se descartan por su clave. Una IPN de un pago cuyo aviso
+    ya se procesó vuelve a encolarlo, porque puede traer otro estado.
+    """
+    aviso = pagos.leer_aviso(request.GET, request.body)
+    if aviso is None:
+        return HttpResponse(status=400)
+    if not pagos.firma_valida(request.headers, aviso):
+        metricas.incrementar("mercadopago.webhook.firma_invalida")
+        return HttpResponse(status=401)
+    if aviso.tema != pagos.TEMA_PAGO:
+        # Órdenes comerciales y otros temas: el pago llega en su propio aviso.
+        metricas.incrementar("mercadopago.webhook.ignorados")
+        return HttpResponse(status=200)
+
+    try:
+        with transaction.atomic():
+            notificacion = PaymentNotification.objects.create(
+                key=aviso.clave,
+                topic=aviso.tema,
+                resource_id=aviso.recurso,
+                payload=aviso.datos,
+            )
+            tareas.encolar("mercadopago.procesar_notificacion", notificacion_id=notificacion.pk)
+    except IntegrityError:
+        with transaction.atomic():
+            reabierta = pagos.reabrir_aviso(aviso)
+            if reabierta is not None:
+                tareas.encolar("mercadopago.procesar_notificacion", notificacion_id=reabierta)
+        if reabierta is None:
+            metricas.incrementar("mercadopago.webhook.repetidos")
+        else:
+            metricas.incrementar("mercadopago.webhook.recibidos")
+    else:
+        metricas.incrementar("mercadopago.webhook.recibidos")
+    return HttpResponse(status=200)
+
+
 def registrar_usuario(request: HttpRequest) -> HttpResponse:
     """
     Permite crear un usuario de tipo cliente y acceder de inmediato.
@@ -351,3 +715,21 @@ def ingresar(request: HttpRequest) -> HttpResponse:
     return render(request, "tienda_app/ingreso.html", {"formulario": formulario})
 
 
+@staff_member_required
+def vista_metricas(request: HttpRequest) -> JsonResponse:
+    """
+    Métricas internas del proceso que atiende el request (sólo para el personal).
+    """
+    return JsonResponse(
+        {
+            "cache_tarjetas": cache_tarjetas.estadisticas(),
+            "cache_paginas": metricas.resumen_cache("cache_paginas"),
+            "mercadopago": metricas.instantanea("mercadopago."),
+            "tareas": metricas.instantanea("tareas."),
+            "sesiones": metricas.instantanea("sesiones."),
+            "circuitos": {
+                "estados": circuito.estados(),
+                "contadores": metricas.instantanea("circuito."),
+            },
+        }
+    )